@@ -1,5 +1,6 @@
 import re
-from flask import Flask, render_template, request, redirect, url_for, session, flash, g, get_flashed_messages, jsonify, send_file
+from flask import Flask, render_template, request, redirect, url_for, session, flash, g, get_flashed_messages, jsonify, send_file, Response
+from flask import before_render_template, template_rendered, has_request_context
 from flask_login import LoginManager, UserMixin, login_user, login_required, logout_user, current_user
 from flask_wtf.csrf import CSRFProtect
 import psycopg2
@@ -8,17 +9,28 @@ from werkzeug.security import generate_password_hash, check_password_hash
 from dotenv import load_dotenv
 import os
 import secrets
+import io
+import tempfile
+import shutil
+import click
+import threading
+import time
+# Antes de importar los modelos: varios leen su configuración del entorno al importarse
+load_dotenv()
+from models.ConnectionPool import ConnectionPool
 from models.entities.usuario import Usuario, Cliente, Administrador
 from models.UserModel import UserModel
-from models.ProductoModel import ProductoModel
+from models.ProductoModel import ProductoModel, ORDEN_POR_DEFECTO, FORMATOS_IMPORTACION
 from models.CarritoModel import CarritoModel
 from models.entities.producto import Producto
-from models.PedidoModel import PedidoModel
-from reportlab.pdfgen import canvas
-from reportlab.lib import colors
-from reportlab.lib.pagesizes import letter
-from reportlab.platypus import Table, TableStyle
-from datetime import datetime
+from models.PedidoModel import PedidoModel, PedidoModificado
+from models.GeneradorRecibos import GeneradorRecibos
+from models.AlmacenRecibos import crear_almacen
+from models.Migraciones import Migrador
+from models import Metricas
+from models.Instrumentacion import (CursorMedido, EstadisticasEndpoints, iniciar_medicion,
+                                    terminar_medicion, medicion_actual, configurar_consultas_lentas)
+from datetime import datetime, timedelta
 import json
 LOGIN_TEMPLATE = 'login.html'
 FORM_PRODUCTO_TEMPLATE = 'form_producto.html'
@@ -26,7 +38,9 @@ REGISTRO_TEMPLATE = 'registro.html'
 RECUPERAR_TEMPLATE = 'recuperar.html'
 ACTION_AÑADIR = 'Añadir'
 FORM_CONTRASEÑA = 'contraseña'
-load_dotenv()
+CATALOGO_POR_PAGINA = int(os.environ.get('CATALOGO_POR_PAGINA', 24))
+BUSQUEDA_MAX_PAGINAS = 50
+PEDIDOS_POR_PAGINA = 50
 app = Flask(__name__)
 app.secret_key = os.environ.get('SECRET_KEY') or secrets.token_hex(32)
 
@@ -34,27 +48,289 @@ csrf = CSRFProtect(app)
 login_manager = LoginManager(app)
 login_manager.login_view = 'login'
 
+# Cada worker escucha los cambios del catálogo y de los usuarios (LISTEN/NOTIFY) para invalidar sus cachés
+ProductoModel.catalogo_cache.configurar(os.environ.get('DATABASE_URL'))
+UserModel.cache.configurar(os.environ.get('DATABASE_URL'))
+
+# Recibos PDF: se generan en memoria; con almacén 'local' o 'bd' se generan en un
+# pool de procesos, se guardan y se consultan por id de trabajo
+recibos = GeneradorRecibos(
+    almacen=crear_almacen(
+        os.environ.get('RECIBOS_ALMACEN', 'local'),
+        directorio=os.environ.get('RECIBOS_DIR') or os.path.join(app.root_path, 'recibos'),
+        dsn=os.environ.get('DATABASE_URL')
+    ),
+    max_workers=int(os.environ.get('RECIBOS_WORKERS', 2)),
+    max_pendientes=int(os.environ.get('RECIBOS_MAX_PENDIENTES', 32)),
+    timeout=float(os.environ.get('RECIBOS_TIMEOUT', 120)),
+    retencion_dias=float(os.environ.get('RECIBOS_RETENCION_DIAS', 30))
+)
+
+# Métricas por endpoint (tiempo, consultas SQL, BD, plantillas, tamaño) de este worker
+metricas = EstadisticasEndpoints(muestras=int(os.environ.get('METRICAS_MUESTRAS', 1000)))
+
+# Consultas lentas (y una muestra con EXPLAIN ANALYZE) a un archivo local que rota
+configurar_consultas_lentas(
+    umbral_ms=float(os.environ.get('SQL_LENTA_MS', 200)),
+    muestreo=float(os.environ.get('SQL_EXPLAIN_MUESTREO', 0.1)),
+    archivo=os.environ.get('SQL_LENTA_ARCHIVO') or os.path.join(app.root_path, 'logs', 'consultas_lentas.log')
+)
+
+_db_pool = None
+_db_pool_pid = None
+_db_pool_lock = threading.Lock()
+
+# Réplica de lectura opcional (DATABASE_REPLICA_URL), con su propio pool por proceso
+DATABASE_REPLICA_URL = os.environ.get('DATABASE_REPLICA_URL')
+DB_REPLICA_FIJAR_SEGUNDOS = float(os.environ.get('DB_REPLICA_FIJAR_SEGUNDOS', 5))
+DB_REPLICA_REINTENTO = float(os.environ.get('DB_REPLICA_REINTENTO', 30))
+_db_pool_replica = None
+_db_pool_replica_pid = None
+_replica_caida_hasta = 0.0
+
+def _crear_pool(dsn):
+    # psycopg2 es lo suficientemente inteligente para entender la URL completa.
+    return ConnectionPool(
+        dsn,
+        min_size=int(os.environ.get('DB_POOL_MIN', 1)),
+        max_size=int(os.environ.get('DB_POOL_MAX', 10)),
+        timeout=float(os.environ.get('DB_POOL_TIMEOUT', 10)),
+        max_lifetime=float(os.environ.get('DB_POOL_MAX_LIFETIME', 1800)),
+        health_check_interval=float(os.environ.get('DB_POOL_HEALTHCHECK', 30)),
+        cursor_factory=CursorMedido,
+    )
+
+def get_pool():
+    """
+    Devuelve el pool de conexiones de este proceso. Se crea de forma perezosa y
+    se vuelve a crear tras un fork, así cada worker de gunicorn tiene el suyo.
+    """
+    global _db_pool, _db_pool_pid
+    pid = os.getpid()
+    if _db_pool is not None and _db_pool_pid == pid:
+        return _db_pool
+    with _db_pool_lock:
+        if _db_pool is None or _db_pool_pid != pid:
+            _db_pool = _crear_pool(os.environ.get('DATABASE_URL'))
+            _db_pool_pid = pid
+    return _db_pool
+
+def get_pool_replica():
+    """Pool de la réplica de este proceso (mismo ciclo de vida que get_pool)."""
+    global _db_pool_replica, _db_pool_replica_pid
+    pid = os.getpid()
+    if _db_pool_replica is not None and _db_pool_replica_pid == pid:
+        return _db_pool_replica
+    with _db_pool_lock:
+        if _db_pool_replica is None or _db_pool_replica_pid != pid:
+            _db_pool_replica = _crear_pool(DATABASE_REPLICA_URL)
+            _db_pool_replica_pid = pid
+    return _db_pool_replica
+
 def get_db():
     if 'db' not in g:
         try:
-            # psycopg2 es lo suficientemente inteligente para entender la URL completa.
-            DATABASE_URL = os.environ.get('DATABASE_URL')
-            g.db = psycopg2.connect(DATABASE_URL)
+            with Metricas.DB_POOL_ESPERA_SEGUNDOS.time():
+                g.db = get_pool().getconn()
         except psycopg2.Error as ex:
             # Es buena idea loguear el error para depurar en Render
             app.logger.error(f"FALLO AL CONECTAR A LA BD: {ex}")
             raise ValueError(f"Error al conectar con la base de datos: {ex}")
     return g.db
 
+def _usar_replica():
+    """La réplica solo atiende peticiones GET/HEAD que no deban ver una escritura reciente."""
+    if not DATABASE_REPLICA_URL or not has_request_context():
+        return False
+    if request.method not in ('GET', 'HEAD') or time.monotonic() < _replica_caida_hasta:
+        return False
+    return session.get('bd_primaria_hasta', 0) <= time.time()
+
+def fijar_primaria(segundos=None):
+    """Las lecturas de esta sesión van a la primaria durante unos segundos (leer lo que uno escribió)."""
+    session['bd_primaria_hasta'] = time.time() + (DB_REPLICA_FIJAR_SEGUNDOS if segundos is None else segundos)
+
+def _descartar_replica(ex):
+    """Deja de usar la réplica en este worker durante DB_REPLICA_REINTENTO segundos."""
+    global _replica_caida_hasta
+    _replica_caida_hasta = time.monotonic() + DB_REPLICA_REINTENTO
+    app.logger.warning(f"Réplica no disponible, se lee de la primaria: {ex}")
+    conexion = g.pop('db_lectura', None)
+    if conexion is not None:
+        get_pool_replica().putconn(conexion, close=True)
+
+def get_db_lectura():
+    """
+    Conexión para consultas de solo lectura: la réplica si está configurada y
+    disponible; si no, la misma conexión primaria que get_db().
+    """
+    if not _usar_replica():
+        return get_db()
+    if 'db_lectura' not in g:
+        try:
+            with Metricas.DB_POOL_ESPERA_SEGUNDOS.time():
+                g.db_lectura = get_pool_replica().getconn()
+        except psycopg2.Error as ex:
+            _descartar_replica(ex)
+            return get_db()
+    return g.db_lectura
+
+def _error_de_conexion(ex):
+    """True si el error (o el que lo provocó) es de conexión o de conflicto con la recuperación."""
+    while ex is not None:
+        if isinstance(ex, (psycopg2.OperationalError, psycopg2.InterfaceError)):
+            return True
+        ex = ex.__cause__ or ex.__context__
+    return False
+
+def leer(metodo, *args, **kwargs):
+    """
+    Ejecuta un método de solo lectura de un modelo, p. ej. leer(ProductoModel.get_all_products),
+    en la conexión de get_db_lectura(). Si falla la réplica, se repite en la primaria.
+    """
+    conexion = get_db_lectura()
+    if conexion is g.get('db'):
+        Metricas.DB_LECTURAS.labels(destino='primaria').inc()
+        return metodo(conexion, *args, **kwargs)
+    try:
+        resultado = metodo(conexion, *args, **kwargs)
+        Metricas.DB_LECTURAS.labels(destino='replica').inc()
+        return resultado
+    except (ValueError, psycopg2.Error) as ex:
+        if not _error_de_conexion(ex):
+            raise
+        if conexion.closed:
+            _descartar_replica(ex)
+        Metricas.DB_LECTURAS.labels(destino='respaldo').inc()
+        return metodo(get_db(), *args, **kwargs)
+
 @app.teardown_appcontext
 def close_db(e=None):
     """
-    Cierra la conexión a la base de datos automáticamente al final de cada petición.
+    Devuelve las conexiones a sus pools automáticamente al final de cada petición.
     """
     db = g.pop('db', None)
     if db is not None:
-        db.close()
-        app.logger.info("Cerrando conexión a la base de datos.")
+        get_pool().putconn(db)
+    db_lectura = g.pop('db_lectura', None)
+    if db_lectura is not None:
+        get_pool_replica().putconn(db_lectura)
+
+@app.after_request
+def fijar_primaria_tras_escribir(response):
+    """Tras una escritura correcta la sesión lee de la primaria hasta que la réplica la alcance."""
+    if DATABASE_REPLICA_URL and request.method not in ('GET', 'HEAD', 'OPTIONS') and response.status_code < 400:
+        fijar_primaria()
+    return response
+
+@app.before_request
+def iniciar_medicion_peticion():
+    g.medicion_token = iniciar_medicion()
+
+
+@before_render_template.connect_via(app)
+def _inicio_plantilla(sender, template, context, **extra):
+    medicion = medicion_actual()
+    if medicion is not None:
+        medicion.inicio_plantilla()
+
+
+@template_rendered.connect_via(app)
+def _fin_plantilla(sender, template, context, **extra):
+    medicion = medicion_actual()
+    if medicion is not None:
+        medicion.fin_plantilla()
+
+
+@app.after_request
+def registrar_medicion(response):
+    """Añade la cabecera Server-Timing y guarda las métricas de la petición por endpoint."""
+    medicion = medicion_actual()
+    if medicion is None or request.endpoint == 'static':
+        return response
+    total_ms = medicion.transcurrido() * 1000
+    bd_ms = medicion.tiempo_bd * 1000
+    plantillas_ms = medicion.tiempo_plantillas * 1000
+    response.headers['Server-Timing'] = (
+        f'app;dur={total_ms:.1f}, '
+        f'db;dur={bd_ms:.1f};desc="{medicion.consultas} consultas", '
+        f'tpl;dur={plantillas_ms:.1f}'
+    )
+    tamano = response.content_length
+    if tamano is None:
+        tamano = response.calculate_content_length()
+    endpoint = request.endpoint or 'sin_ruta'
+    Metricas.PETICION_SEGUNDOS.labels(endpoint=endpoint, metodo=request.method).observe(total_ms / 1000)
+    Metricas.PETICIONES.labels(endpoint=endpoint, metodo=request.method, status=response.status_code).inc()
+    _publicar_estado_pool()
+    metricas.registrar(endpoint, response.status_code, {
+        'total_ms': total_ms,
+        'bd_ms': bd_ms,
+        'consultas': medicion.consultas,
+        'plantillas_ms': plantillas_ms,
+        'bytes': tamano,
+    })
+    return response
+
+
+def _publicar_estado_pool():
+    """Copia el estado del pool de este worker a los gauges de /metrics."""
+    if _db_pool is None or _db_pool_pid != os.getpid():
+        return
+    stats = _db_pool.stats()
+    Metricas.DB_POOL_CONEXIONES.labels(estado='en_uso').set(stats['in_use'])
+    Metricas.DB_POOL_CONEXIONES.labels(estado='libres').set(stats['idle'])
+    Metricas.DB_POOL_CONEXIONES.labels(estado='esperando').set(stats['waiting'])
+
+
+@app.teardown_request
+def terminar_medicion_peticion(e=None):
+    token = g.pop('medicion_token', None)
+    if token is not None:
+        terminar_medicion(token)
+
+
+@app.route('/metrics')
+def metrics():
+    """Métricas en formato de texto de Prometheus, sumadas entre los workers.
+    Si METRICAS_TOKEN está definido se exige `Authorization: Bearer <token>`."""
+    token = os.environ.get('METRICAS_TOKEN')
+    if token and not secrets.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}'):
+        return Response('No autorizado\n', status=401, mimetype='text/plain')
+    cuerpo, content_type = Metricas.exponer()
+    return Response(cuerpo, content_type=content_type)
+
+
+@app.route('/api/admin/metricas')
+@login_required
+def api_metricas():
+    """Percentiles por endpoint de este worker (solo administradores). ?reiniciar=1 vacía las series."""
+    if not _check_admin_permission():
+        return jsonify({'success': False, 'message': 'No autorizado'}), 403
+    datos = metricas.exportar()
+    if request.args.get('reiniciar') == '1':
+        metricas.reiniciar()
+    return jsonify({'success': True, 'pid': os.getpid(), 'endpoints': datos})
+
+
+@app.route('/api/admin/pool')
+@login_required
+def api_pool_stats():
+    """Estadísticas del pool de conexiones de este worker (solo administradores)."""
+    if current_user.rol != 'administrador':
+        return jsonify({'success': False, 'message': 'No autorizado'}), 403
+    return jsonify({
+        'success': True,
+        'pid': os.getpid(),
+        'pool': get_pool().stats(),
+        'replica': {
+            'configurada': bool(DATABASE_REPLICA_URL),
+            'disponible': time.monotonic() >= _replica_caida_hasta,
+            'pool': _db_pool_replica.stats() if _db_pool_replica_pid == os.getpid() else None,
+        },
+        'user_cache': UserModel.cache_stats(),
+        'recibos': recibos.stats()
+    })
 # VERSIÓN CORREGIDA Y RECOMENDADA
 @app.route('/')
 def inicio():
@@ -139,12 +415,14 @@ def logout():
 def load_user(user_id):
     """
     Flask-Login usa esta función para recargar el objeto de usuario desde el ID
-    almacenado en la sesión. Se ejecuta en cada petición de un usuario logueado.
+    almacenado en la sesión. Se ejecuta en cada petición de un usuario logueado,
+    por eso primero se consulta la caché y solo en un fallo se toca la BD.
     """
+    usuario = UserModel.get_cached(user_id)
+    if usuario is not None:
+        return usuario
     try:
-        # Obtiene una conexión segura para esta petición específica
-        conexion = get_db()
-        return UserModel.get_by_id(conexion, user_id)
+        return leer(UserModel.get_by_id, user_id)
     except Exception as ex:
         app.logger.error(f"Error en load_user: {ex}")
         return None
@@ -157,9 +435,8 @@ def panel_admin():
             flash("No tienes permisos para acceder a esta página.", "danger")
             return redirect(url_for('inicio'))
 
-        conexion = get_db()
         # Mostrar TODOS los productos en el panel de administración (incluye inactivos)
-        productos = ProductoModel.get_all_products(conexion)
+        productos = leer(ProductoModel.get_all_products)
         return render_template('panel_admin.html', productos=productos)
     except Exception as ex:
         app.logger.error(f"Error en panel_admin: {ex}")
@@ -227,26 +504,8 @@ def _get_product_form_data():
     }
 
 def _validate_product_data(form_data):
-    errores = []
-    if not _is_product_name_valid(form_data['nombre']):
-        errores.append("El nombre es obligatorio.")
-    
-    if not _is_product_price_valid(form_data['precio']):
-        errores.append("El precio debe ser mayor a 0.")
-    
-    if not _is_product_stock_valid(form_data['stock']):
-        errores.append("El stock no puede ser negativo.")
-
-    return errores
-
-def _is_product_name_valid(nombre):
-    return bool(nombre)
-
-def _is_product_price_valid(precio):
-    return precio is not None and precio > 0
-
-def _is_product_stock_valid(stock):
-    return stock is not None and stock >= 0
+    # Mismas reglas que la importación masiva (ProductoModel.validar_datos)
+    return ProductoModel.validar_datos(form_data)
 
 def _create_and_save_product(form_data):
     nuevo_producto = Producto (
@@ -262,6 +521,175 @@ def _create_and_save_product(form_data):
     ProductoModel.create_product(conexion, nuevo_producto)
 
 
+def _formato_por_extension(nombre_archivo):
+    extension = os.path.splitext(nombre_archivo or '')[1].lower().lstrip('.')
+    return 'jsonl' if extension in ('jsonl', 'ndjson', 'json') else 'csv'
+
+
+def _archivo_binario(archivo):
+    """Devuelve el contenido del upload como archivo binario que TextIOWrapper acepte.
+
+    Werkzeug guarda los uploads grandes en un SpooledTemporaryFile, que antes de
+    Python 3.11 no es io.IOBase (le faltan readable/readinto): en ese caso se copia
+    por bloques a un TemporaryFile.
+    """
+    if isinstance(archivo.stream, io.IOBase):
+        return archivo.stream
+    copia = tempfile.TemporaryFile()
+    shutil.copyfileobj(archivo.stream, copia, 64 * 1024)
+    copia.seek(0)
+    return copia
+
+
+@app.route('/api/admin/productos/exportar')
+@login_required
+def exportar_productos():
+    """Descarga el catálogo completo en CSV o JSONL (formato=csv|jsonl), generado con COPY."""
+    if not _check_admin_permission():
+        return jsonify({'success': False, 'message': 'Acceso denegado'}), 403
+    formato = request.args.get('formato', 'csv')
+    if formato not in FORMATOS_IMPORTACION:
+        return jsonify({'success': False, 'message': 'Formato no soportado'}), 400
+
+    # COPY escribe en un archivo temporal (en memoria hasta 8 MB) y se envía por bloques
+    archivo = tempfile.SpooledTemporaryFile(max_size=8 * 1024 * 1024)
+    try:
+        # Sin reintento en la primaria: el archivo ya puede tener parte de la exportación
+        ProductoModel.exportar(get_db_lectura(), archivo, formato)
+    except Exception as ex:
+        archivo.close()
+        app.logger.error(f"Error exportando productos: {ex}")
+        return jsonify({'success': False, 'message': str(ex)}), 500
+    archivo.seek(0)
+
+    def _bloques():
+        with archivo:
+            while True:
+                bloque = archivo.read(64 * 1024)
+                if not bloque:
+                    break
+                yield bloque
+
+    mimetype = 'text/csv' if formato == 'csv' else 'application/x-ndjson'
+    nombre = f"productos_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{formato}"
+    return Response(_bloques(), mimetype=mimetype,
+                    headers={'Content-Disposition': f'attachment; filename={nombre}'})
+
+
+@app.route('/api/admin/productos/importar', methods=['POST'])
+@login_required
+def importar_productos():
+    """
+    Importa productos desde un archivo CSV o JSONL (campo 'archivo').
+    Upsert por nombre; responde con los totales y los errores por línea.
+    """
+    if not _check_admin_permission():
+        return jsonify({'success': False, 'message': 'Acceso denegado'}), 403
+    archivo = request.files.get('archivo')
+    if not archivo or not archivo.filename:
+        return jsonify({'success': False, 'message': 'Seleccione un archivo'}), 400
+    formato = request.form.get('formato') or _formato_por_extension(archivo.filename)
+    if formato not in FORMATOS_IMPORTACION:
+        return jsonify({'success': False, 'message': 'Formato no soportado'}), 400
+    try:
+        with io.TextIOWrapper(_archivo_binario(archivo), encoding='utf-8-sig', newline='') as texto:
+            resultado = ProductoModel.importar(get_db(), texto, formato)
+        app.logger.info(f"Importación de productos por {current_user.id}: "
+                        f"{resultado['insertados']} nuevos, {resultado['actualizados']} actualizados, "
+                        f"{len(resultado['errores']) + resultado['errores_omitidos']} con error")
+        return jsonify({'success': True, **resultado})
+    except Exception as ex:
+        app.logger.error(f"Error importando productos: {ex}")
+        return jsonify({'success': False, 'message': str(ex)}), 500
+
+
+@app.route('/api/admin/productos/masivo', methods=['POST'])
+@login_required
+def accion_masiva_productos():
+    """
+    Aplica una acción a varios productos en una sola sentencia.
+    JSON: {'accion', 'valor', 'ids': [...]} o {'accion', 'valor', 'categoria'} para toda una categoría.
+    Responde con cuántos productos se seleccionaron y cambiaron, los ids pedidos que no
+    existen y un mensaje con ese resumen (el panel lo muestra sin recargar).
+    """
+    if not _check_admin_permission():
+        return jsonify({'success': False, 'message': 'Acceso denegado'}), 403
+    data = request.get_json(silent=True) or {}
+    accion = data.get('accion')
+    categoria = str(data.get('categoria') or '').strip()
+    try:
+        ids = ProductoModel.validar_ids(data.get('ids') or [])
+        if not (ids or categoria):
+            raise ValueError('Seleccione productos o una categoría')
+        valor = ProductoModel.validar_accion_masiva(accion, data.get('valor'))
+    except ValueError as ex:
+        return jsonify({'success': False, 'message': str(ex)}), 400
+    try:
+        resultado = ProductoModel.accion_masiva(get_db(), accion, valor, ids=ids, categoria=categoria)
+    except Exception as ex:
+        app.logger.error(f"Error en acción masiva de productos: {ex}")
+        return jsonify({'success': False, 'message': str(ex)}), 500
+    app.logger.info(f"Acción masiva '{accion}' por {current_user.id}: {resultado['afectados']} productos")
+    mensaje = f"{resultado['afectados']} de {resultado['seleccionados']} productos actualizados."
+    if resultado['no_encontrados']:
+        mensaje += f" No existen: {', '.join(map(str, resultado['no_encontrados']))}."
+    return jsonify({'success': True, 'message': mensaje, **resultado})
+
+
+@app.cli.command('productos-exportar')
+@click.argument('archivo', type=click.Path(dir_okay=False))
+@click.option('--formato', type=click.Choice(FORMATOS_IMPORTACION), default=None,
+              help='Por defecto se deduce de la extensión del archivo.')
+def cli_exportar_productos(archivo, formato):
+    """Exporta el catálogo a ARCHIVO (CSV o JSONL)."""
+    formato = formato or _formato_por_extension(archivo)
+    with open(archivo, 'wb') as destino:
+        ProductoModel.exportar(get_db(), destino, formato)
+    click.echo(f"Catálogo exportado a {archivo} ({formato})")
+
+
+@app.cli.command('productos-importar')
+@click.argument('archivo', type=click.Path(exists=True, dir_okay=False))
+@click.option('--formato', type=click.Choice(FORMATOS_IMPORTACION), default=None,
+              help='Por defecto se deduce de la extensión del archivo.')
+@click.option('--lote', default=1000, show_default=True, help='Filas por lote de COPY.')
+def cli_importar_productos(archivo, formato, lote):
+    """Importa productos desde ARCHIVO (CSV o JSONL), con upsert por nombre."""
+    formato = formato or _formato_por_extension(archivo)
+    with open(archivo, encoding='utf-8-sig', newline='') as origen:
+        resultado = ProductoModel.importar(get_db(), origen, formato, tamano_lote=lote)
+    for error in resultado['errores']:
+        click.echo(f"Línea {error['linea']}: {' '.join(error['errores'])}", err=True)
+    click.echo(f"Procesadas {resultado['procesados']}: {resultado['insertados']} nuevas, "
+               f"{resultado['actualizados']} actualizadas, "
+               f"{len(resultado['errores']) + resultado['errores_omitidos']} con error")
+
+
+@app.cli.command('db-migrar')
+@click.option('--hasta', type=int, default=None, help='Aplica solo hasta esta versión (incluida).')
+@click.option('--pendientes', is_flag=True, help='Solo lista las migraciones pendientes.')
+def cli_migrar(hasta, pendientes):
+    """Aplica las migraciones pendientes de migrations/ y las registra en schema_migrations."""
+    migrador = Migrador(os.environ.get('DATABASE_URL'))
+    if pendientes:
+        for migracion in migrador.estado()['pendientes']:
+            click.echo(os.path.basename(migracion['ruta']))
+        return
+    aplicadas = migrador.migrar(hasta=hasta, avisar=click.echo)
+    click.echo(f"{len(aplicadas)} migraciones aplicadas" if aplicadas else "El esquema está al día")
+
+
+@app.cli.command('db-verificar')
+def cli_verificar():
+    """Verifica que no haya migraciones pendientes y que existan los índices esperados."""
+    problemas = Migrador(os.environ.get('DATABASE_URL')).verificar()
+    for problema in problemas:
+        click.echo(problema, err=True)
+    if problemas:
+        raise SystemExit(1)
+    click.echo("Esquema e índices en orden")
+
+
 @app.route('/admin/producto/editar/<int:id>', methods=['GET', 'POST'])
 @login_required
 def editar_producto(id):
@@ -269,8 +697,8 @@ def editar_producto(id):
         flash("No tienes permisos para editar productos.", "danger")
         return redirect(url_for('catalogo'))
     
-    conexion = get_db()
     if request.method == 'POST':
+        conexion = get_db()
         try:
             # Obtener datos del formulario
             nombre = request.form.get('nombre', '').strip()
@@ -310,7 +738,7 @@ def editar_producto(id):
             return redirect(url_for('editar_producto', id=id))
     
     # GET: Obtener producto y mostrar formulario
-    producto_a_editar = ProductoModel.get_product_by_id(conexion, id)
+    producto_a_editar = leer(ProductoModel.get_product_by_id, id)
     if not producto_a_editar:
         flash("Producto no encontrado.", "warning")
         return redirect(url_for('panel_admin'))
@@ -356,13 +784,9 @@ def activar_producto(id):
         return redirect(url_for('inicio'))
 
     try:
-        cursor = conexion.cursor()
-        cursor.execute("UPDATE productos SET activo = TRUE WHERE id = %s", (id,))
-        conexion.commit()
-        cursor.close()
+        ProductoModel.activate_product(conexion, id)
         flash('Producto activado correctamente.', 'success')
     except Exception as e:
-        conexion.rollback()
         flash(f"Error al activar producto: {str(e)}", 'danger')
 
     return redirect(url_for('panel_admin'))
@@ -403,10 +827,9 @@ def pagina_inicio():
 @app.route('/catalogo', methods=['GET', 'POST'])
 @login_required
 def catalogo():
-    conexion = get_db()
-    
     # Manejar agregar al carrito
     if request.method == 'POST':
+        conexion = get_db()
         id_producto = request.form.get('product_id', type=int)
         cantidad = request.form.get('quantity') or request.form.get('cantidad') or 1
         try:
@@ -424,14 +847,20 @@ def catalogo():
                 flash(f"Error al agregar producto: {str(e)}", 'danger')
     
     try:
-        # ✅ AQUÍ ESTÁ EL CAMBIO: usa get_active_products en lugar de get_all_products
-        productos = ProductoModel.get_active_products(conexion)
+        # Primera página (filtrada y ordenada en SQL) desde la caché del catálogo
+        categoria, orden, limite, despues = _get_catalogo_params()
+        catalogo_version, (productos, siguiente) = leer(
+            ProductoModel.get_catalogo_page, categoria, orden, limite, despues)
         
-        # Obtener el carrito del usuario desde la base de datos
-        items_carrito = CarritoModel.get_carrito_by_usuario(conexion, current_user.id)
+        # Obtener el carrito del usuario (tras un POST, leer() usa la primaria y ya ve lo agregado)
+        items_carrito = leer(CarritoModel.get_carrito_by_usuario, current_user.id)
         total_carrito = calcular_total_carrito(items_carrito)
         return render_template('catalogo.html', 
                             productos=productos, 
+                            siguiente=siguiente,
+                            categoria=categoria,
+                            orden=orden,
+                            catalogo_version=catalogo_version,
                             nombre=current_user.nombre, 
                             total_carrito=total_carrito, 
                             carrito=items_carrito)
@@ -440,6 +869,81 @@ def catalogo():
         return redirect(url_for('inicio'))
 
 
+def _get_catalogo_params():
+    """Lee categoría, orden, tamaño de página y cursor de la query string."""
+    categoria = request.args.get('categoria', '').strip()
+    if categoria == 'todos':
+        categoria = ''
+    orden = request.args.get('orden', ORDEN_POR_DEFECTO)
+    limite = request.args.get('limite', CATALOGO_POR_PAGINA, type=int)
+    limite = min(max(limite, 1), 100)
+    despues = request.args.get('cursor') or None
+    return categoria or None, orden, limite, despues
+
+
+@app.route('/api/catalogo')
+@login_required
+def api_catalogo():
+    """
+    API paginada de productos activos (parámetros: categoria, orden, limite, cursor).
+    Con html=1 incluye las tarjetas ya renderizadas. La versión del catálogo es el ETag.
+    """
+    try:
+        categoria, orden, limite, despues = _get_catalogo_params()
+        version, (productos, siguiente) = leer(
+            ProductoModel.get_catalogo_page, categoria, orden, limite, despues)
+        con_html = request.args.get('html') == '1'
+        etag = f"catalogo-{version}"
+        # Las tarjetas HTML llevan el token CSRF de la sesión: no se validan por ETag
+        if not con_html and etag in request.if_none_match:
+            return '', 304, {'ETag': f'"{etag}"'}
+        data = {
+            'success': True,
+            'version': version,
+            'productos': [p.to_dict() for p in productos],
+            'siguiente': siguiente
+        }
+        if con_html:
+            data['html'] = render_template('_productos.html', productos=productos)
+        response = jsonify(data)
+        if not con_html:
+            response.set_etag(etag)
+        return response
+    except Exception as ex:
+        app.logger.error(f"Error en API catálogo: {ex}")
+        return jsonify({'success': False, 'message': str(ex)}), 500
+
+
+
+@app.route('/api/productos/buscar')
+@login_required
+def api_buscar_productos():
+    """
+    Búsqueda de productos por texto (parámetros: q, pagina, limite).
+    Los administradores pueden incluir inactivos con todos=1; con html=1 se
+    devuelven también las tarjetas del catálogo renderizadas.
+    """
+    try:
+        texto = request.args.get('q', '').strip()
+        pagina = min(max(request.args.get('pagina', 1, type=int), 1), BUSQUEDA_MAX_PAGINAS)
+        limite = min(max(request.args.get('limite', CATALOGO_POR_PAGINA, type=int), 1), 100)
+        solo_activos = not (_check_admin_permission() and request.args.get('todos') == '1')
+
+        productos, hay_mas = leer(ProductoModel.search, texto, pagina, limite, solo_activos)
+        data = {
+            'success': True,
+            'q': texto,
+            'pagina': pagina,
+            'hay_mas': hay_mas and pagina < BUSQUEDA_MAX_PAGINAS,
+            'productos': [p.to_dict() for p in productos]
+        }
+        if request.args.get('html') == '1':
+            data['html'] = render_template('_productos.html', productos=productos)
+        return jsonify(data)
+    except Exception as ex:
+        app.logger.error(f"Error en búsqueda de productos: {ex}")
+        return jsonify({'success': False, 'message': str(ex)}), 500
+
 
 @app.route('/api/carrito/agregar', methods=['POST'])
 @login_required
@@ -467,8 +971,8 @@ def api_agregar_carrito():
             cantidad = 1
 
         conexion = get_db()
-        # Pass quantity to agregar_producto so it inserts the desired number of units
-        CarritoModel.agregar_producto(conexion, current_user.id, id_producto, cantidad)
+        # Validación de stock e inserción en una sola sentencia atómica
+        resultado = CarritoModel.agregar_producto(conexion, current_user.id, id_producto, cantidad)
 
         # Obtener carrito actualizado
         items_carrito = CarritoModel.get_carrito_by_usuario(conexion, current_user.id)
@@ -481,7 +985,9 @@ def api_agregar_carrito():
             'message': 'Producto agregado al carrito',
             'items': items_carrito,
             'count': count_units,
-            'total': total
+            'total': total,
+            'cantidad_en_carrito': resultado['cantidad'],
+            'disponibles': resultado['disponibles']
         })
     except Exception as ex:
         app.logger.error(f"Error en API agregar carrito: {ex}")
@@ -548,8 +1054,7 @@ def api_limpiar_carrito():
 @login_required
 def ver_carrito():
     try:
-        conexion = get_db()
-        items_carrito = CarritoModel.get_carrito_by_usuario(conexion, current_user.id)
+        items_carrito = leer(CarritoModel.get_carrito_by_usuario, current_user.id)
         total_carrito = calcular_total_carrito(items_carrito)
         return render_template('carrito_compras.html', 
                             nombre=current_user.nombre, 
@@ -575,165 +1080,20 @@ def eliminar_del_carrito(producto_id):
 @app.route('/generar_recibo', methods=['POST'])
 @login_required
 def generar_recibo():
-    # Usamos la función auxiliar para mantener la lógica reutilizable.
+    """Convierte el carrito en pedido y redirige a su recibo (antes se generaba sin registrar el pedido)."""
     try:
-        conexion = get_db()
-        items_carrito = CarritoModel.get_carrito_by_usuario(conexion, current_user.id)
-        if not items_carrito:
+        pedido = PedidoModel.checkout(get_db(), current_user.id)
+        if pedido is None:
             flash("No hay items en el carrito", "warning")
             return redirect(url_for('ver_carrito'))
-
-        pdf_filename = _generate_pdf_for_items(items_carrito, current_user)
-
-        # Limpiar carrito
-        CarritoModel.limpiar_carrito(conexion, current_user.id)
-
-        # Enviar PDF para visualización inline; si falla, redirigir al archivo estático
-        pdf_path = os.path.join(app.root_path, 'static', 'recibos', pdf_filename)
-        try:
-            return send_file(pdf_path, mimetype='application/pdf', as_attachment=False, download_name=pdf_filename)
-        except Exception:
-            return redirect(url_for('static', filename=f'recibos/{pdf_filename}'))
+        return redirect(url_for('recibo_pedido', pedido_id=pedido['id_pedido']))
     except Exception as e:
         app.logger.error(f"Error generando recibo: {e}")
-        flash("Error al generar el recibo", "danger")
-        return redirect(url_for('ver_carrito'))
-
-
-def _normalize_item(item):
-    """Normaliza un item retornando dict con claves: id, nombre, precio, cantidad."""
-    if isinstance(item, dict):
-        return {
-            'id': item.get('id') or item.get('producto_id') or item.get('product_id'),
-            'nombre': item.get('nombre') or item.get('titulo') or item.get('name') or '',
-            'precio': float(item.get('precio') or item.get('price') or 0),
-            'cantidad': int(item.get('cantidad') or item.get('qty') or item.get('quantity') or 1)
-        }
-
-    # Intentar atributos del objeto
-    try:
-        pid = getattr(item, 'id', None) or getattr(item, 'producto_id', None) or getattr(item, 'product_id', None)
-        nombre = getattr(item, 'nombre', None) or getattr(item, 'titulo', None) or getattr(item, 'name', None) or ''
-        precio = getattr(item, 'precio', None) or getattr(item, 'price', None) or 0
-        cantidad = getattr(item, 'cantidad', None) or getattr(item, 'qty', None) or getattr(item, 'quantity', None) or 1
-        return {'id': pid, 'nombre': nombre, 'precio': float(precio), 'cantidad': int(cantidad)}
-    except Exception:
-        # Fallback: intentar como secuencia (tupla/lista)
-        try:
-            pid = item[0]; nombre = item[1]; precio = float(item[2]); cantidad = int(item[3])
-            return {'id': pid, 'nombre': nombre, 'precio': precio, 'cantidad': cantidad}
-        except Exception:
-            return {'id': None, 'nombre': str(item), 'precio': 0.0, 'cantidad': 1}
-
-
-def _aggregate_items(items_carrito):
-    """Agrupa items por id y suma cantidades. Devuelve dict de agregados."""
-    agregados = {}
-    if not items_carrito:
-        return agregados
-
-    for item in items_carrito:
-        it = _normalize_item(item)
-        pid = it['id']
-        precio = float(it['precio'])
-        cantidad = int(it['cantidad'])
-        nombre = it['nombre']
-
-        if pid in agregados:
-            agregados[pid]['cantidad'] += cantidad
-            agregados[pid]['precio'] = precio  # conservar último precio conocido
+        if 'Stock insuficiente' in str(e):
+            flash(str(e).split(': ', 1)[-1], 'danger')
         else:
-            agregados[pid] = {'id': pid, 'nombre': nombre, 'precio': precio, 'cantidad': cantidad}
-
-    return agregados
-
-
-def _generate_pdf_for_items(items_carrito, usuario):
-    """Genera el PDF a partir de una lista de items (diccionarios) y retorna el nombre de archivo generado."""
-    # Crear directorio para recibos si no existe
-    recibos_dir = os.path.join(app.root_path, 'static', 'recibos')
-    os.makedirs(recibos_dir, exist_ok=True)
-
-    # Nombre único para el PDF
-    timestamp = datetime.now().strftime('%Y%m%d_%H-%M-%S')
-    pdf_filename = f"recibo_{getattr(usuario, 'id', 'anon')}_{timestamp}.pdf"
-    pdf_path = os.path.join(recibos_dir, pdf_filename)
-
-    # Crear PDF
-    c = canvas.Canvas(pdf_path, pagesize=letter)
-    width, height = letter
-
-    # Encabezado
-    c.setFont("Helvetica-Bold", 18)
-    c.drawString(50, height - 50, "Recibo de Compra")
-
-    # Información del cliente y fecha
-    c.setFont("Helvetica", 11)
-    c.drawString(50, height - 80, f"Cliente: {getattr(usuario, 'nombre', '')}")
-    correo = getattr(usuario, 'correo', '') if hasattr(usuario, 'correo') else ''
-    c.drawString(50, height - 100, f"Correo: {correo}")
-    fecha_str = datetime.now().strftime('%d/%m/%Y %H:%M:%S')
-    c.drawString(50, height - 120, f"Fecha: {fecha_str}")
-
-    # Agrupar productos por ID y sumar cantidades (delegado a helper para reducir complejidad)
-    agregados = _aggregate_items(items_carrito)
-
-    # Preparar datos de la tabla
-    data = [["Producto", "Cantidad", "Precio Unit.", "Subtotal"]]
-    total = 0.0
-    for agg in agregados.values():
-        precio = float(agg.get('precio', 0))
-        cantidad = int(agg.get('cantidad', 0))
-        subtotal = precio * cantidad
-        total += subtotal
-        data.append([
-            agg.get('nombre', ''),
-            str(cantidad),
-            f"${precio:.2f}",
-            f"${subtotal:.2f}"
-        ])
-
-    # Fila de total
-    data.append(["", "", "Total:", f"${total:.2f}"])
-
-    # Crear tabla
-    table = Table(data, colWidths=[240, 80, 100, 100])
-    table.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#4a5568')),
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-        ('ALIGN', (1, 1), (-1, -2), 'CENTER'),
-        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 0), (-1, 0), 11),
-        ('BOTTOMPADDING', (0, 0), (-1, 0), 8),
-        ('GRID', (0, 0), (-1, -1), 0.5, colors.grey),
-        ('BACKGROUND', (0, -1), (-1, -1), colors.HexColor('#f7fafc')),
-        ('FONTNAME', (0, -1), (-1, -1), 'Helvetica-Bold')
-    ]))
-
-    # Dibujar tabla
-    _, table_height = table.wrap(0, 0)
-    y_position = height - 160 - table_height
-    if y_position < 80:
-        y_position = 80
-
-    table.wrapOn(c, width, height)
-    table.drawOn(c, 50, y_position)
-
-    # Información adicional
-    c.setFont("Helvetica", 10)
-    c.drawString(50, 60, "Gracias por su compra!")
-    c.drawString(50, 45, "Este documento sirve como comprobante de pago.")
-    c.drawRightString(width - 50, 45, f"Recibo: {timestamp}")
-
-    # Guardar el documento una sola vez
-    c.save()
-    # Log location for easier debugging
-    try:
-        app.logger.info(f"Recibo generado en: {pdf_path}")
-    except Exception:
-        pass
-
-    return pdf_filename
+            flash("Error al generar el recibo", "danger")
+        return redirect(url_for('ver_carrito'))
 
 
 @app.route('/pagar', methods=['GET', 'POST'])
@@ -765,42 +1125,98 @@ def pagar():
     try:
         # Simular procesamiento (siempre exitoso en esta simulación)
         conexion = get_db()
-        items_carrito = CarritoModel.get_carrito_by_usuario(conexion, current_user.id)
-        if not items_carrito:
+        # Pedido, líneas, stock y vaciado del carrito en una sola transacción
+        pedido = PedidoModel.checkout(conexion, current_user.id)
+        if pedido is None:
             flash('No hay items en el carrito', 'warning')
             return redirect(url_for('ver_carrito'))
-        total = calcular_total_carrito(items_carrito)
+        app.logger.info(f"Pedido {pedido['id_pedido']} creado para usuario {current_user.id} por ${pedido['total']:.2f}")
 
-        id_pedido = PedidoModel.crear_pedido(conexion, current_user.id, total, items_carrito)
-        app.logger.info(f"Pedido {id_pedido} creado para usuario {current_user.id} por ${total:.2f}")
+        # El recibo sale del pedido recién registrado (sus líneas y precios guardados)
+        pedido.update({'id_cliente': current_user.id, 'nombre_cliente': current_user.nombre,
+                       'correo_cliente': getattr(current_user, 'correo', '')})
 
-        # Generar el PDF y limpiar carrito
-        pdf_filename = _generate_pdf_for_items(items_carrito, current_user)
-        CarritoModel.limpiar_carrito(conexion, current_user.id)
+        # Sin almacén el PDF se genera en memoria y se envía directamente;
+        # pagar.html ya abre las respuestas application/pdf en la pestaña nueva
+        if recibos.en_memoria:
+            return _enviar_pdf(recibos.obtener(pedido), f"recibo_pedido_{pedido['id_pedido']}.pdf")
 
-        # Construir URL pública del PDF
-        pdf_url = url_for('static', filename=f'recibos/{pdf_filename}')
+        # Con almacén el PDF se genera en segundo plano
+        recibos.encolar(pedido)
+        estado_url = url_for('api_estado_recibo', pedido_id=pedido['id_pedido'])
 
-        # Si la petición viene desde JS (AJAX), responder con JSON que contiene la URL.
-        # Nuestro JS abrirá una pestaña en blanco primero (user gesture) y luego cargará esta URL.
+        # Si la petición viene desde JS (AJAX), responder con el pedido y la URL de estado.
+        # Nuestro JS abre una pestaña en blanco primero (user gesture) y consulta el estado
+        # hasta que el PDF esté listo.
         is_xhr = request.headers.get('X-Requested-With') == 'XMLHttpRequest' or request.form.get('ajax') == '1'
         if is_xhr:
-            return jsonify({'success': True, 'pdf_url': pdf_url})
+            return jsonify({'success': True, 'id_pedido': pedido['id_pedido'], 'estado_url': estado_url})
 
-        # Si no es AJAX, intentar enviar el PDF inline como antes
-        pdf_path = os.path.join(app.root_path, 'static', 'recibos', pdf_filename)
-        try:
-            return send_file(pdf_path, mimetype='application/pdf', as_attachment=False, download_name=pdf_filename)
-        except Exception:
-            # Fallback a redirect si por alguna razón send_file falla
-            return redirect(pdf_url)
+        # Si no es AJAX, la página de confirmación hace la misma consulta
+        return render_template('pago_exitoso.html', pedido_id=pedido['id_pedido'])
 
     except Exception as ex:
         app.logger.error(f"Error procesando pago: {ex}")
-        flash('Ocurrió un error al procesar el pago. Intente nuevamente.', 'danger')
+        if 'Stock insuficiente' in str(ex):
+            flash(str(ex).split(': ', 1)[-1], 'danger')
+        else:
+            flash('Ocurrió un error al procesar el pago. Intente nuevamente.', 'danger')
         return redirect(url_for('ver_carrito'))
     
 
+def _obtener_pedido_visible(conexion, pedido_id):
+    """Devuelve el pedido si existe y el usuario es su cliente o un administrador; si no, None."""
+    pedido = PedidoModel.obtener_pedido_por_id(conexion, pedido_id)
+    if pedido and (_check_admin_permission() or pedido.id_cliente == current_user.id):
+        return pedido
+    return None
+
+
+@app.route('/api/pedido/<int:pedido_id>/recibo')
+@login_required
+def api_estado_recibo(pedido_id):
+    """Estado del recibo del pedido: pendiente, listo (con pdf_url) o error."""
+    pedido = leer(_obtener_pedido_visible, pedido_id)
+    if pedido is None:
+        return jsonify({'success': False, 'message': 'Pedido no encontrado'}), 404
+    # Un recibo que no se encoló (pedidos anteriores) se genera al descargarlo
+    estado = recibos.estado(pedido_id, pedido.version) or 'listo'
+    data = {'success': True, 'estado': estado}
+    if estado == 'listo':
+        data['pdf_url'] = url_for('recibo_pedido', pedido_id=pedido_id)
+    return jsonify(data)
+
+
+@app.route('/pedido/<int:pedido_id>/recibo')
+@login_required
+def recibo_pedido(pedido_id):
+    """Recibo PDF de un pedido registrado, cacheado por id y versión del pedido."""
+    try:
+        pedido = leer(_obtener_pedido_visible, pedido_id)
+        if pedido is None:
+            flash("Pedido no encontrado.", "warning")
+            return redirect(url_for('catalogo'))
+        datos = pedido.to_dict()
+        datos['items'] = [
+            {'id': d.id_producto, 'nombre': d.nombre_producto,
+             'precio': d.precio_unitario, 'cantidad': d.cantidad}
+            for d in leer(PedidoModel.obtener_detalle_pedido, pedido_id)
+        ]
+        return _enviar_pdf(recibos.obtener(datos), f"recibo_pedido_{pedido_id}.pdf")
+    except Exception as ex:
+        app.logger.error(f"Error generando el recibo del pedido {pedido_id}: {ex}")
+        flash("Error al generar el recibo", "danger")
+        return redirect(url_for('catalogo'))
+
+
+def _enviar_pdf(pdf, pdf_filename):
+    """Responde con un PDF en memoria para verlo en el navegador."""
+    response = send_file(io.BytesIO(pdf), mimetype='application/pdf',
+                         as_attachment=False, download_name=pdf_filename)
+    response.headers['Cache-Control'] = 'private, no-store'
+    return response
+
+
 @app.route('/buscar_pedidos')
 @login_required
 def buscar_pedidos():
@@ -810,15 +1226,74 @@ def buscar_pedidos():
         return redirect(url_for('catalogo'))
     
     try:
-        conexion = get_db()
-        pedidos = PedidoModel.obtener_todos_pedidos(conexion)
-        return render_template('buscar_pedidos.html', pedidos=pedidos)
+        filtros, limite, despues = _get_filtros_pedidos()
+        pedidos, siguiente = leer(PedidoModel.buscar_pedidos, filtros, limite, despues)
+        return render_template('buscar_pedidos.html', pedidos=pedidos, siguiente=siguiente,
+                               filtros=request.args)
     except Exception as ex:
         app.logger.error(f"Error al cargar pedidos: {ex}")
         flash("Error al cargar los pedidos.", "danger")
         return redirect(url_for('panel_admin'))
 
 
+def _get_filtros_pedidos():
+    """Lee los filtros de búsqueda de pedidos, el tamaño de página y el cursor de la query string."""
+    def _fecha(nombre):
+        valor = request.args.get(nombre, '').strip()
+        if not valor:
+            return None
+        try:
+            return datetime.strptime(valor, '%Y-%m-%d')
+        except ValueError:
+            raise ValueError(f"Fecha inválida en '{nombre}' (formato AAAA-MM-DD)")
+
+    filtros = {
+        'q': request.args.get('q', '').strip(),
+        'cliente': request.args.get('cliente', '').strip(),
+        'correo': request.args.get('correo', '').strip(),
+        'status': request.args.get('status', '').strip(),
+        'desde': _fecha('desde'),
+        'hasta': _fecha('hasta'),
+        'total_min': request.args.get('total_min', type=float),
+        'total_max': request.args.get('total_max', type=float),
+    }
+    if filtros['status'] and filtros['status'] not in ('pendiente', 'completado'):
+        raise ValueError("Estado inválido")
+    # 'hasta' incluye el día completo
+    if filtros['hasta']:
+        filtros['hasta'] += timedelta(days=1)
+    limite = min(max(request.args.get('limite', PEDIDOS_POR_PAGINA, type=int), 1), 200)
+    despues = request.args.get('cursor') or None
+    return filtros, limite, despues
+
+
+@app.route('/api/pedidos/buscar')
+@login_required
+def api_buscar_pedidos():
+    """
+    Búsqueda paginada de pedidos (solo admin). Filtros: q, cliente, correo, status,
+    desde, hasta (AAAA-MM-DD), total_min, total_max; paginación con limite y cursor.
+    """
+    if not _check_admin_permission():
+        return jsonify({'success': False, 'message': 'Acceso denegado'}), 403
+    try:
+        filtros, limite, despues = _get_filtros_pedidos()
+    except ValueError as ex:
+        return jsonify({'success': False, 'message': str(ex)}), 400
+    try:
+        pedidos, siguiente = leer(PedidoModel.buscar_pedidos, filtros, limite, despues)
+        data = []
+        for pedido in pedidos:
+            item = pedido.to_dict()
+            item['fecha'] = pedido.data_pedido.strftime('%d/%m/%Y %H:%M')
+            item['data_pedido'] = pedido.data_pedido.isoformat()
+            data.append(item)
+        return jsonify({'success': True, 'pedidos': data, 'siguiente': siguiente})
+    except Exception as ex:
+        app.logger.error(f"Error en búsqueda de pedidos: {ex}")
+        return jsonify({'success': False, 'message': str(ex)}), 500
+
+
 @app.route('/pedido/detalle/<int:pedido_id>')
 @login_required
 def ver_detalle_pedido(pedido_id):
@@ -828,17 +1303,15 @@ def ver_detalle_pedido(pedido_id):
         return redirect(url_for('catalogo'))
     
     try:
-        conexion = get_db()
-        
         # Obtener información del pedido
-        pedido = PedidoModel.obtener_pedido_por_id(conexion, pedido_id)
+        pedido = leer(PedidoModel.obtener_pedido_por_id, pedido_id)
         
         if not pedido:
             flash("Pedido no encontrado.", "warning")
             return redirect(url_for('buscar_pedidos'))
         
         # Obtener detalles del pedido
-        detalles = PedidoModel.obtener_detalle_pedido(conexion, pedido_id)
+        detalles = leer(PedidoModel.obtener_detalle_pedido, pedido_id)
         
         return render_template('detalle_pedido.html', pedido=pedido, detalles=detalles)
         
@@ -895,45 +1368,45 @@ def _handle_get_pedido(conexion, pedido, pedido_id):
 
 
 def _handle_post_pedido(conexion, pedido_id):
-    """Maneja las solicitudes POST: procesa cambios y actualiza."""
-    # DEBUG: volcar lo que llega en el formulario para depuración
+    """Maneja las solicitudes POST: arma el lote de cambios del formulario y lo aplica en una transacción."""
     try:
-        keys = list(request.form.keys())
-        app.logger.info(f"[DEBUG editar_pedido POST] request.form.keys(): {keys}")
-        # Mostrar valores no planos (listas) para ver inputs duplicados
-        try:
-            form_map = request.form.to_dict(flat=False)
-            app.logger.info(f"[DEBUG editar_pedido POST] request.form (multi): {form_map}")
-        except Exception:
-            app.logger.info("[DEBUG editar_pedido POST] no se pudo volcar form.to_dict(flat=False)")
-        # También volcar el body crudo (por si los nombres no llegan como espera)
-        try:
-            raw = request.get_data(as_text=True)
-            app.logger.info(f"[DEBUG editar_pedido POST] raw body: {raw}")
-        except Exception:
-            app.logger.info("[DEBUG editar_pedido POST] no se pudo leer request.get_data()")
-    except Exception as ex:
-        app.logger.error(f"Error registrando request.form en editar_pedido: {ex}")
-
-    detalles = PedidoModel.obtener_detalle_pedido(conexion, pedido_id)
-    app.logger.info(f"[DEBUG editar_pedido POST] detalles actuales ids: {[_get_det_id(d) for d in detalles]}")
-    _process_existing_details(conexion, detalles)
-    _process_new_details(conexion, pedido_id)
-    # Procesar posible cambio de estado enviado desde el formulario
-    nuevo_status = request.form.get('status')
-    if nuevo_status:
-        try:
-            PedidoModel.actualizar_status(conexion, pedido_id, nuevo_status)
-        except Exception as ex:
-            app.logger.error(f"No se pudo actualizar el estado del pedido {pedido_id}: {ex}")
-            flash('No se pudo actualizar el estado del pedido.', 'warning')
+        resultado = PedidoModel.aplicar_cambios(conexion, pedido_id, _cambios_desde_formulario())
+    except PedidoModificado as ex:
+        flash(str(ex), 'warning')
+        return redirect(url_for('editar_pedido_admin', pedido_id=pedido_id))
+    except ValueError as ex:
+        app.logger.error(f"No se pudo actualizar el pedido {pedido_id}: {ex}")
+        flash('No se pudo actualizar el pedido. Revise productos y cantidades.', 'danger')
+        return redirect(url_for('editar_pedido_admin', pedido_id=pedido_id))
+    app.logger.info(f"Pedido {pedido_id} editado por {current_user.id}: {resultado['cambios']}")
     flash('Pedido actualizado correctamente.', 'success')
     return redirect(url_for('ver_detalle_pedido', pedido_id=pedido_id))
 
 
-def _get_det_id(d):
-    """Extrae el ID de detalle de un objeto (dict o modelo)."""
-    return d.get('id_detalle') if isinstance(d, dict) else getattr(d, 'id_detalle', None)
+@app.route('/api/admin/pedido/<int:pedido_id>/editar', methods=['POST'])
+@login_required
+def api_editar_pedido(pedido_id):
+    """
+    Edita un pedido en lote (JSON):
+    {'version', 'lineas': [{'id_detalle', 'id_producto', 'cantidad'}], 'eliminar': [id_detalle],
+     'nuevas': [{'id_producto', 'cantidad'}], 'status'}.
+    Solo se escriben las líneas que cambian; responde con el pedido, sus líneas y el total nuevos.
+    """
+    if not _check_admin_permission():
+        return jsonify({'success': False, 'message': 'Acceso denegado'}), 403
+    cambios = request.get_json(silent=True)
+    if not isinstance(cambios, dict):
+        return jsonify({'success': False, 'message': 'Se esperaba un objeto JSON'}), 400
+    try:
+        resultado = PedidoModel.aplicar_cambios(get_db(), pedido_id, cambios)
+    except PedidoModificado as ex:
+        return jsonify({'success': False, 'message': str(ex)}), 409
+    except ValueError as ex:
+        return jsonify({'success': False, 'message': str(ex)}), 400
+    pedido = resultado['pedido'].to_dict()
+    pedido['data_pedido'] = pedido['data_pedido'].isoformat() if pedido['data_pedido'] else None
+    detalles = [detalle.to_dict() for detalle in resultado['detalles']]
+    return jsonify({'success': True, 'pedido': pedido, 'detalles': detalles, 'cambios': resultado['cambios']})
 
 
 def _safe_int(val, default=None):
@@ -944,139 +1417,65 @@ def _safe_int(val, default=None):
         return default
 
 
-def _should_keep_detail(det_id):
-    """Verifica si un detalle debe mantenerse."""
-    keep = request.form.get(f'keep_{det_id}', '1')
-    return keep != '0'
-
-
-def _process_detail_action(conexion, det_id):
-    """Procesa acciones para un detalle: eliminar o actualizar."""
-    if not _should_keep_detail(det_id):
-        app.logger.info(f"_process_detail_action: eliminando detalle {det_id}")
-        PedidoModel.eliminar_detalle(conexion, det_id)
-        return
-    
-    prod_id = _safe_int(request.form.get(f'producto_{det_id}'))
-    cantidad = _safe_int(request.form.get(f'cantidad_{det_id}'), 1) or 1
-    
-    if prod_id is not None:
-        app.logger.info(f"_process_detail_action: actualizando detalle {det_id} -> producto {prod_id} cantidad {cantidad}")
-        PedidoModel.actualizar_detalle(conexion, det_id, prod_id, cantidad)
-
-
-def _process_existing_details(conexion, detalles):
-    """Procesa cada detalle existente: elimina si se marcó, o actualiza si cambió."""
-    for d in detalles:
-        det_id = _get_det_id(d)
-        if det_id:
-            _process_detail_action(conexion, det_id)
-
-
-def _extract_new_detail_data(key):
-    """Extrae datos de un nuevo detalle del formulario."""
-    if not key.startswith('new_prod_id_'):
-        return None
-    
-    suffix = key[len('new_prod_id_'):]
-    prod_val = request.form.get(key)
-    cant_val = request.form.get(f'new_cant_{suffix}', '1')
-    
-    prod_id = _safe_int(prod_val)
-    cantidad = _safe_int(cant_val, 1)
-    
-    # Validar datos extraídos
-    if prod_id is None or cantidad is None:
-        return None
-    
-    return {'prod_id': prod_id, 'cantidad': cantidad}
-
-
-def _process_new_details(conexion, id_pedido):
-    """Busca claves new_prod_id_* en request.form y crea nuevas líneas."""
-    _process_json_lines(conexion, id_pedido)
-    _process_list_format(conexion, id_pedido)
-    _process_suffix_format(conexion, id_pedido)
-
-
-def _process_json_lines(conexion, id_pedido):
-    """Procesa JSON serializado con nuevas líneas."""
-    json_payload = request.form.get('new_lines_json')
-    if not json_payload:
-        return
-
-    try:
-        items = json.loads(json_payload)
-        if isinstance(items, list):
-            for item in items:
-                _add_detail_from_dict(conexion, id_pedido, item, 'json')
-    except Exception as ex:
-        app.logger.error(f"Error parseando new_lines_json: {ex}")
-
-
-def _process_list_format(conexion, id_pedido):
-    """Procesa listas repetidas (new_prod_id y new_cant)."""
-    prod_list = request.form.getlist('new_prod_id')
-    if not prod_list:
-        return
-
-    cant_list = request.form.getlist('new_cant')
-    for idx, prod_val in enumerate(prod_list):
-        cant_val = _get_safe_quantity(cant_list, idx)
-        _add_detail(conexion, id_pedido, prod_val, cant_val, 'list')
-
-
-def _process_suffix_format(conexion, id_pedido):
-    """Procesa claves con sufijo (new_prod_id_*)."""
-    processed = set()
+def _cambios_desde_formulario():
+    """Convierte el formulario de editar_pedido.html al lote de cambios de PedidoModel.aplicar_cambios."""
+    cambios = {
+        'version': request.form.get('version') or None,
+        'status': request.form.get('status') or None,
+        'lineas': [],
+        'eliminar': [],
+        'nuevas': _nuevas_lineas_formulario(),
+    }
     for key in request.form.keys():
-        if not key.startswith('new_prod_id_'):
+        if not key.startswith('producto_'):
             continue
-
-        suffix = key[len('new_prod_id_'):]
-        if suffix in processed:
+        det_id = _safe_int(key[len('producto_'):])
+        if det_id is None:
             continue
+        if request.form.get(f'keep_{det_id}', '1') == '0':
+            cambios['eliminar'].append(det_id)
+            continue
+        prod_id = _safe_int(request.form.get(key))
+        cantidad = _safe_int(request.form.get(f'cantidad_{det_id}'), 1) or 1
+        if prod_id is not None:
+            cambios['lineas'].append({'id_detalle': det_id, 'id_producto': prod_id, 'cantidad': cantidad})
+    return cambios
 
-        detail_data = _extract_new_detail_data(key)
-        if detail_data:
-            _add_detail(conexion, id_pedido, 
-                       detail_data['prod_id'], 
-                       detail_data['cantidad'], 
-                       'suffix')
-            processed.add(suffix)
-
-
-def _add_detail_from_dict(conexion, id_pedido, item, source):
-    """Agrega detalle desde un diccionario (JSON)."""
-    if not isinstance(item, dict):
-        return
-
-    prod_id = _safe_int(item.get('prod_id'))
-    cantidad = _safe_int(item.get('cantidad'), 1)
-    _add_detail(conexion, id_pedido, prod_id, cantidad, source)
-
-
-def _add_detail(conexion, id_pedido, prod_id, cantidad, source):
-    """Valida y agrega un detalle de pedido."""
-    prod_id = _safe_int(prod_id)
-    cantidad = _safe_int(cantidad, 1)
 
-    if prod_id is None or cantidad is None:
-        return
+def _nuevas_lineas_formulario():
+    """Lee las líneas nuevas en cualquiera de los formatos aceptados por el formulario:
+    JSON serializado (new_lines_json), listas repetidas (new_prod_id/new_cant) o
+    claves con sufijo (new_prod_id_<n>/new_cant_<n>).
+    """
+    nuevas = []
 
-    app.logger.info(
-        f"_process_new_details({source}): agregando producto {prod_id} "
-        f"x{cantidad} al pedido {id_pedido}"
-    )
-    PedidoModel.agregar_detalle(conexion, id_pedido, prod_id, cantidad)
+    json_payload = request.form.get('new_lines_json')
+    if json_payload:
+        try:
+            items = json.loads(json_payload)
+        except ValueError as ex:
+            app.logger.error(f"Error parseando new_lines_json: {ex}")
+            items = []
+        for item in items if isinstance(items, list) else []:
+            if isinstance(item, dict):
+                nuevas.append((item.get('prod_id'), item.get('cantidad')))
 
+    cant_list = request.form.getlist('new_cant')
+    for idx, prod_val in enumerate(request.form.getlist('new_prod_id')):
+        nuevas.append((prod_val, cant_list[idx] if idx < len(cant_list) else '1'))
 
-def _get_safe_quantity(cant_list, idx):
-    """Obtiene cantidad segura desde lista, default 1."""
-    try:
-        return cant_list[idx] if idx < len(cant_list) else '1'
-    except Exception:
-        return '1'
+    for key in request.form.keys():
+        if key.startswith('new_prod_id_'):
+            suffix = key[len('new_prod_id_'):]
+            nuevas.append((request.form.get(key), request.form.get(f'new_cant_{suffix}', '1')))
+
+    lineas = []
+    for prod_val, cant_val in nuevas:
+        prod_id = _safe_int(prod_val)
+        cantidad = _safe_int(cant_val, 1)
+        if prod_id is not None and cantidad is not None:
+            lineas.append({'id_producto': prod_id, 'cantidad': cantidad})
+    return lineas
 
 @app.route('/carrito/limpiar', methods=['POST'])
 @login_required
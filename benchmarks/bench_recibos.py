@@ -0,0 +1,64 @@
+"""Benchmark del recibo PDF: tiempo de renderizado para pedidos de 10, 1.000 y 10.000 líneas.
+
+Uso (desde la raíz del proyecto):
+    python benchmarks/bench_recibos.py
+    python benchmarks/bench_recibos.py --lineas 10 1000 10000 50000 --repeticiones 5
+
+Muestra el mejor tiempo, la mediana, los microsegundos por línea (debería
+mantenerse casi constante si el costo es lineal), las páginas y el tamaño.
+"""
+import argparse
+import os
+import re
+import statistics
+import sys
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from models.GeneradorRecibos import renderizar_recibo  # noqa: E402
+
+
+def _pedido(lineas):
+    items = [{
+        'id': i,
+        'nombre': f"Producto de prueba {i}",
+        'precio': 1 + (i % 97) * 0.75,
+        'cantidad': 1 + i % 5
+    } for i in range(1, lineas + 1)]
+    cliente = {'id': 1, 'nombre': 'Cliente Benchmark', 'correo': 'benchmark@example.com'}
+    return items, cliente
+
+
+def medir(lineas, repeticiones):
+    items, cliente = _pedido(lineas)
+    fecha = datetime(2025, 1, 1, 12, 0, 0)
+    tiempos = []
+    pdf = b''
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        pdf = renderizar_recibo(items, cliente, fecha, f"Benchmark {lineas}")
+        tiempos.append(time.perf_counter() - inicio)
+    paginas = len(re.findall(rb'/Type /Page\b', pdf))
+    return min(tiempos), statistics.median(tiempos), paginas, len(pdf)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--lineas', type=int, nargs='+', default=[10, 1000, 10000])
+    parser.add_argument('--repeticiones', type=int, default=3)
+    args = parser.parse_args()
+
+    # La primera llamada registra fuentes y carga módulos: no se cuenta
+    renderizar_recibo(*_pedido(1))
+
+    print(f"{'líneas':>8} {'mejor (s)':>10} {'mediana (s)':>12} {'µs/línea':>10} {'páginas':>8} {'KB':>8}")
+    for lineas in args.lineas:
+        mejor, mediana, paginas, tamano = medir(lineas, args.repeticiones)
+        print(f"{lineas:>8} {mejor:>10.3f} {mediana:>12.3f} {mejor / lineas * 1e6:>10.1f} "
+              f"{paginas:>8} {tamano / 1024:>8.1f}")
+
+
+if __name__ == '__main__':
+    main()
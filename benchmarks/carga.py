@@ -0,0 +1,289 @@
+"""Prueba de carga de extremo a extremo: catálogo, carrito, checkout y edición de pedidos.
+
+Se ejecuta contra la aplicación corriendo sobre un PostgreSQL local con datos
+sintéticos y cuentas de prueba (ver README, "Pruebas de carga"):
+    gunicorn app:app -w 4
+    python benchmarks/carga.py --url http://localhost:8000 --usuarios 20 --duracion 60
+
+Cada usuario virtual repite su escenario hasta que se acaba el tiempo:
+- cliente: login -> /catalogo -> /api/carrito/agregar x N -> /pagar
+- admin (--fraccion-admin): login -> /buscar_pedidos -> editar_pedido_admin (GET y POST)
+
+Al terminar muestra por endpoint las peticiones, errores, throughput y latencia
+p50/p95/p99 (más el tiempo de BD y las consultas que informa la cabecera
+Server-Timing) y guarda el resultado en JSON para compararlo con
+benchmarks/comparar.py.
+"""
+import argparse
+import http.cookiejar
+import json
+import math
+import os
+import random
+import re
+import statistics
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from datetime import datetime
+
+RAIZ = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+RE_CSRF = re.compile(r'name="csrf_token"\s+value="([^"]+)"')
+RE_PRODUCTO = re.compile(r'name="product_id"\s+value="(\d+)"')
+RE_EDITAR = re.compile(r'/admin/pedido/editar/(\d+)')
+RE_VERSION = re.compile(r'name="version"\s+value="(\d+)"')
+RE_LINEA = re.compile(
+    r'<select name="producto_(\d+)"(?:(?!</select>).)*?<option value="(\d+)"\s+selected'
+    r'.*?name="cantidad_\1"\s+value="(\d+)"', re.S)
+RE_SERVER_TIMING = re.compile(r'(\w+);dur=([\d.]+)(?:;desc="(\d+))?')
+
+
+class _SinRedirecciones(urllib.request.HTTPRedirectHandler):
+    """Cada petición se mide sola: las redirecciones no se siguen."""
+
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+class Resultados:
+    """Muestras por endpoint, compartidas por todos los usuarios virtuales."""
+
+    def __init__(self, desde):
+        self.desde = desde
+        self._lock = threading.Lock()
+        self._muestras = {}
+
+    def registrar(self, etiqueta, latencia, ok, bd_ms=None, consultas=None):
+        if time.monotonic() < self.desde:
+            return   # calentamiento
+        with self._lock:
+            self._muestras.setdefault(etiqueta, []).append((latencia, ok, bd_ms, consultas))
+
+    def resumen(self, duracion):
+        with self._lock:
+            muestras = {k: list(v) for k, v in self._muestras.items()}
+        endpoints = {etiqueta: _estadisticas(filas, duracion) for etiqueta, filas in sorted(muestras.items())}
+        todas = [fila for filas in muestras.values() for fila in filas]
+        return endpoints, _estadisticas(todas, duracion)
+
+
+def _percentil(ordenados, p):
+    if not ordenados:
+        return None
+    return ordenados[max(0, math.ceil(p / 100 * len(ordenados)) - 1)]
+
+
+def _estadisticas(filas, duracion):
+    latencias = sorted(f[0] * 1000 for f in filas)
+    bd = sorted(f[2] for f in filas if f[2] is not None)
+    consultas = [f[3] for f in filas if f[3] is not None]
+    datos = {
+        'peticiones': len(filas),
+        'errores': sum(1 for f in filas if not f[1]),
+        'rps': round(len(filas) / duracion, 2) if duracion else 0.0,
+    }
+    if latencias:
+        datos.update({
+            'media_ms': round(statistics.fmean(latencias), 2),
+            'p50_ms': round(_percentil(latencias, 50), 2),
+            'p95_ms': round(_percentil(latencias, 95), 2),
+            'p99_ms': round(_percentil(latencias, 99), 2),
+            'max_ms': round(latencias[-1], 2),
+        })
+    if bd:
+        datos['bd_p50_ms'] = round(_percentil(bd, 50), 2)
+        datos['bd_p95_ms'] = round(_percentil(bd, 95), 2)
+    if consultas:
+        datos['consultas_media'] = round(statistics.fmean(consultas), 2)
+    return datos
+
+
+class UsuarioVirtual:
+    """Un navegador simulado: sesión con cookies propia y token CSRF."""
+
+    def __init__(self, base, resultados, timeout):
+        self.base = base.rstrip('/')
+        self.resultados = resultados
+        self.timeout = timeout
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()), _SinRedirecciones)
+        self.csrf = None
+
+    def pedir(self, etiqueta, ruta, formulario=None, json_=None):
+        """Hace la petición, la registra y devuelve (status, cuerpo)."""
+        cabeceras = {}
+        datos = None
+        if formulario is not None:
+            datos = urllib.parse.urlencode(formulario).encode()
+            cabeceras['Content-Type'] = 'application/x-www-form-urlencoded'
+        elif json_ is not None:
+            datos = json.dumps(json_).encode()
+            cabeceras['Content-Type'] = 'application/json'
+        if datos is not None and self.csrf:
+            cabeceras['X-CSRFToken'] = self.csrf
+        peticion = urllib.request.Request(self.base + ruta, data=datos, headers=cabeceras)
+
+        inicio = time.perf_counter()
+        try:
+            with self.opener.open(peticion, timeout=self.timeout) as respuesta:
+                status, cuerpo, headers = respuesta.status, respuesta.read(), respuesta.headers
+        except urllib.error.HTTPError as ex:
+            status, cuerpo, headers = ex.code, ex.read(), ex.headers
+        except (urllib.error.URLError, OSError):
+            self.resultados.registrar(etiqueta, time.perf_counter() - inicio, False)
+            raise
+        latencia = time.perf_counter() - inicio
+
+        bd_ms = consultas = None
+        for nombre, duracion, descripcion in RE_SERVER_TIMING.findall(headers.get('Server-Timing', '')):
+            if nombre == 'db':
+                bd_ms = float(duracion)
+                consultas = int(descripcion) if descripcion else None
+        self.resultados.registrar(etiqueta, latencia, status < 400, bd_ms, consultas)
+
+        texto = cuerpo.decode('utf-8', 'replace')
+        token = RE_CSRF.search(texto)
+        if token:
+            self.csrf = token.group(1)
+        return status, texto
+
+    def login(self, correo, password):
+        self.pedir('GET /login', '/login')
+        status, _ = self.pedir('POST /login', '/login', formulario={
+            'csrf_token': self.csrf or '', 'correo': correo, 'contraseña': password})
+        if status != 302:
+            raise RuntimeError(f"No se pudo iniciar sesión como {correo} (HTTP {status})")
+
+
+def escenario_cliente(uv, rng, args, correo):
+    if uv.csrf is None:
+        uv.login(correo, args.password)
+    _, html = uv.pedir('GET /catalogo', '/catalogo')
+    productos = RE_PRODUCTO.findall(html)
+    if not productos:
+        raise RuntimeError("El catálogo no devolvió productos")
+    for _ in range(args.items):
+        uv.pedir('POST /api/carrito/agregar', '/api/carrito/agregar',
+                 json_={'product_id': int(rng.choice(productos)), 'quantity': rng.randint(1, 3)})
+    uv.pedir('POST /pagar', '/pagar', formulario={
+        'csrf_token': uv.csrf or '', 'titular': 'Cliente Carga', 'numero': '4111111111111111',
+        'cvv': '123', 'ajax': '1'})
+
+
+def escenario_admin(uv, rng, args, correo):
+    if uv.csrf is None:
+        uv.login(correo, args.password)
+    _, html = uv.pedir('GET /buscar_pedidos', '/buscar_pedidos')
+    pedidos = RE_EDITAR.findall(html)
+    if not pedidos:
+        return
+    pedido_id = rng.choice(pedidos)
+    _, html = uv.pedir('GET /admin/pedido/editar/<id>', f'/admin/pedido/editar/{pedido_id}')
+    version = RE_VERSION.search(html)
+    formulario = {'csrf_token': uv.csrf or '', 'version': version.group(1) if version else ''}
+    lineas = RE_LINEA.findall(html)
+    if lineas:
+        id_detalle, id_producto, cantidad = rng.choice(lineas)
+        # Alterna la cantidad de una línea para que siempre haya un cambio que aplicar
+        formulario.update({
+            f'producto_{id_detalle}': id_producto,
+            f'cantidad_{id_detalle}': str(int(cantidad) % 5 + 1),
+            f'keep_{id_detalle}': '1',
+        })
+    uv.pedir('POST /admin/pedido/editar/<id>', f'/admin/pedido/editar/{pedido_id}', formulario=formulario)
+
+
+def _trabajador(indice, args, resultados, fin, fallos):
+    rng = random.Random(args.semilla + indice)
+    es_admin = indice < round(args.usuarios * args.fraccion_admin)
+    correo = args.admin if es_admin else args.clientes.format(n=indice % args.num_clientes + 1)
+    escenario = escenario_admin if es_admin else escenario_cliente
+    uv = UsuarioVirtual(args.url, resultados, args.timeout)
+    while time.monotonic() < fin:
+        try:
+            escenario(uv, rng, args, correo)
+        except Exception as ex:
+            fallos.append(f"{correo}: {ex}")
+            uv = UsuarioVirtual(args.url, resultados, args.timeout)   # sesión nueva
+            time.sleep(0.5)
+
+
+def _commit():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=RAIZ,
+                                capture_output=True, text=True, check=True).stdout.strip()
+        sucio = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=RAIZ,
+                               capture_output=True, text=True).stdout.strip()
+        return commit + ('-sucio' if sucio else '')
+    except (OSError, subprocess.CalledProcessError):
+        return 'desconocido'
+
+
+def _imprimir(endpoints, total):
+    print(f"{'endpoint':<36}{'pet.':>7}{'err.':>6}{'rps':>8}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}"
+          f"{'bd p50':>8}{'sql':>6}")
+    for etiqueta, d in list(endpoints.items()) + [('TOTAL', total)]:
+        print(f"{etiqueta:<36}{d['peticiones']:>7}{d['errores']:>6}{d['rps']:>8.1f}"
+              f"{d.get('p50_ms', 0):>9.1f}{d.get('p95_ms', 0):>9.1f}{d.get('p99_ms', 0):>9.1f}"
+              f"{d.get('bd_p50_ms', 0):>8.1f}{d.get('consultas_media', 0):>6.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', default='http://localhost:5000')
+    parser.add_argument('--usuarios', type=int, default=10, help='Usuarios virtuales concurrentes.')
+    parser.add_argument('--duracion', type=float, default=60, help='Segundos medidos.')
+    parser.add_argument('--calentamiento', type=float, default=5, help='Segundos iniciales que no se miden.')
+    parser.add_argument('--fraccion-admin', type=float, default=0.1, help='Fracción de usuarios admin.')
+    parser.add_argument('--items', type=int, default=3, help='Productos agregados al carrito por compra.')
+    parser.add_argument('--clientes', default='cliente{n}@carga.test', help='Patrón de correo de los clientes.')
+    parser.add_argument('--num-clientes', type=int, default=1000, help='Cuántas cuentas de cliente existen.')
+    parser.add_argument('--admin', default='admin@carga.test')
+    parser.add_argument('--password', default='carga123')
+    parser.add_argument('--timeout', type=float, default=30)
+    parser.add_argument('--semilla', type=int, default=1)
+    parser.add_argument('--salida', help='Archivo JSON (defecto benchmarks/resultados/carga_<commit>_<fecha>.json).')
+    args = parser.parse_args()
+
+    commit = _commit()
+    inicio = time.monotonic()
+    resultados = Resultados(desde=inicio + args.calentamiento)
+    fin = inicio + args.calentamiento + args.duracion
+    fallos = []
+    hilos = [threading.Thread(target=_trabajador, args=(i, args, resultados, fin, fallos), daemon=True)
+             for i in range(args.usuarios)]
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join()
+    duracion = max(time.monotonic() - resultados.desde, 1e-9)
+
+    endpoints, total = resultados.resumen(duracion)
+    _imprimir(endpoints, total)
+    if fallos:
+        print(f"\n{len(fallos)} escenarios abortados; primero: {fallos[0]}", file=sys.stderr)
+
+    salida = args.salida or os.path.join(
+        RAIZ, 'benchmarks', 'resultados', f"carga_{commit}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(salida)), exist_ok=True)
+    parametros = {k: v for k, v in vars(args).items() if k not in ('password', 'salida')}
+    with open(salida, 'w', encoding='utf-8') as f:
+        json.dump({
+            'fecha': datetime.now().isoformat(timespec='seconds'),
+            'commit': commit,
+            'parametros': parametros,
+            'duracion_s': round(duracion, 2),
+            'escenarios_abortados': len(fallos),
+            'endpoints': endpoints,
+            'total': total,
+        }, f, indent=2, ensure_ascii=False)
+    print(f"\nResultados guardados en {salida}")
+
+
+if __name__ == '__main__':
+    main()
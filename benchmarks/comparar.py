@@ -0,0 +1,72 @@
+"""Compara dos resultados de benchmarks/carga.py (por ejemplo, de dos commits).
+
+Uso:
+    python benchmarks/comparar.py benchmarks/resultados/carga_abc123_....json benchmarks/resultados/carga_def456_....json
+    python benchmarks/comparar.py base.json nuevo.json --umbral 15
+
+Muestra por endpoint el throughput y la latencia p50/p95/p99 de ambos y la variación.
+Marca con "!" las regresiones mayores que --umbral (%) y en ese caso termina con código 1,
+para poder usarlo en CI.
+"""
+import argparse
+import json
+import sys
+
+# Métrica -> True si un valor mayor es peor
+METRICAS = (('rps', False), ('p50_ms', True), ('p95_ms', True), ('p99_ms', True))
+
+
+def _cargar(ruta):
+    with open(ruta, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def _variacion(antes, despues):
+    if not antes or despues is None:
+        return None
+    return (despues - antes) / antes * 100
+
+
+def comparar(base, nuevo, umbral):
+    """Devuelve las filas (endpoint, métrica, antes, después, variación %, regresión)."""
+    filas = []
+    endpoints = list(base['endpoints']) + [e for e in nuevo['endpoints'] if e not in base['endpoints']]
+    for endpoint in endpoints + ['TOTAL']:
+        antes = base['total'] if endpoint == 'TOTAL' else base['endpoints'].get(endpoint, {})
+        despues = nuevo['total'] if endpoint == 'TOTAL' else nuevo['endpoints'].get(endpoint, {})
+        for metrica, mayor_es_peor in METRICAS:
+            a, d = antes.get(metrica), despues.get(metrica)
+            variacion = _variacion(a, d)
+            regresion = variacion is not None and (variacion > umbral if mayor_es_peor else variacion < -umbral)
+            filas.append((endpoint, metrica, a, d, variacion, regresion))
+    return filas
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('base')
+    parser.add_argument('nuevo')
+    parser.add_argument('--umbral', type=float, default=10.0, help='Variación (%%) que se considera regresión.')
+    args = parser.parse_args()
+
+    base, nuevo = _cargar(args.base), _cargar(args.nuevo)
+    print(f"base:  {base['commit']} ({base['fecha']})")
+    print(f"nuevo: {nuevo['commit']} ({nuevo['fecha']})\n")
+    print(f"{'endpoint':<36}{'métrica':<9}{'base':>10}{'nuevo':>10}{'var. %':>9}")
+
+    filas = comparar(base, nuevo, args.umbral)
+    for endpoint, metrica, a, d, variacion, regresion in filas:
+        texto_a = '-' if a is None else f"{a:.1f}"
+        texto_d = '-' if d is None else f"{d:.1f}"
+        texto_v = '' if variacion is None else f"{variacion:+.1f}"
+        print(f"{endpoint:<36}{metrica:<9}{texto_a:>10}{texto_d:>10}{texto_v:>9}{'  !' if regresion else ''}")
+
+    regresiones = sum(1 for fila in filas if fila[5])
+    if regresiones:
+        print(f"\n{regresiones} regresiones mayores al {args.umbral:.0f}%")
+        sys.exit(1)
+    print("\nSin regresiones")
+
+
+if __name__ == '__main__':
+    main()
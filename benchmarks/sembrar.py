@@ -0,0 +1,283 @@
+"""Genera datos sintéticos a escala para probar las consultas de los modelos.
+
+Uso (desde la raíz del proyecto, con DATABASE_URL en .env o --dsn):
+    python benchmarks/sembrar.py --truncar
+    python benchmarks/sembrar.py --truncar --usuarios 500000 --productos 200000 --pedidos 2000000
+
+Crea usuarios, productos, carritos, pedidos y sus líneas con distribuciones
+realistas: pocas categorías con muchos productos y una cola larga de categorías
+chicas, productos populares que se repiten en muchas líneas y clientes que
+compran una y otra vez. Todo se escribe con COPY desde generadores, así la
+memoria no crece con la cantidad de filas, y la misma --semilla (con la
+misma --hasta) produce siempre los mismos datos.
+
+Las cuentas coinciden con benchmarks/carga.py: cliente{n}@carga.test y
+admin@carga.test, todas con la contraseña --password.
+"""
+import argparse
+import math
+import os
+import random
+import sys
+import time
+from datetime import date, datetime, timedelta
+
+import psycopg2
+from dotenv import load_dotenv
+from werkzeug.security import generate_password_hash
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from models.CatalogoCache import CatalogoCache  # noqa: E402
+
+NOMBRES = ('Ana', 'Luis', 'María', 'Carlos', 'Lucía', 'Jorge', 'Sofía', 'Diego', 'Valentina', 'Andrés',
+           'Camila', 'Mateo', 'Isabella', 'Santiago', 'Daniela', 'Felipe', 'Paula', 'Tomás', 'Laura', 'Juan')
+APELLIDOS = ('García', 'Rodríguez', 'Martínez', 'López', 'González', 'Pérez', 'Sánchez', 'Ramírez',
+             'Torres', 'Flores', 'Rivera', 'Gómez', 'Díaz', 'Reyes', 'Morales', 'Castro', 'Ortiz', 'Vargas')
+ADJETIVOS = ('Clásico', 'Premium', 'Compacto', 'Deluxe', 'Eco', 'Pro', 'Mini', 'Ultra', 'Básico', 'Plus')
+COPY_BUFFER = 64 * 1024
+
+
+class _FlujoCopia:
+    """Archivo de solo lectura para copy_expert que arma las líneas de COPY bajo demanda."""
+
+    def __init__(self, filas, tabla, total):
+        self._filas = iter(filas)
+        self._resto = ''
+        self.tabla = tabla
+        self.total = total
+        self.escritas = 0
+        self._inicio = time.perf_counter()
+
+    def read(self, size=-1):
+        size = size if size and size > 0 else COPY_BUFFER
+        partes = [self._resto]
+        largo = len(self._resto)
+        while largo < size:
+            fila = next(self._filas, None)
+            if fila is None:
+                break
+            linea = '\t'.join(fila) + '\n'
+            partes.append(linea)
+            largo += len(linea)
+            self.escritas += 1
+            if self.escritas % 200000 == 0:
+                self._progreso()
+        datos = ''.join(partes)
+        self._resto = datos[size:]
+        return datos[:size]
+
+    def _progreso(self):
+        transcurrido = time.perf_counter() - self._inicio
+        print(f"  {self.tabla}: {self.escritas:,}/{self.total:,} filas "
+              f"({self.escritas / transcurrido:,.0f} filas/s)", flush=True)
+
+
+def _sesgado(rng, n, exponente):
+    """Índice en [0, n) concentrado en los primeros valores (exponente > 1 = más concentrado)."""
+    return min(n - 1, int(n * rng.random() ** exponente))
+
+
+def _multiplicador(n):
+    """Número coprimo con n para repartir los índices populares entre todos los ids."""
+    for candidato in (1_000_003, 2_147_483_647, 7_919, 104_729):
+        if math.gcd(candidato, n) == 1:
+            return candidato
+    return 1
+
+
+def _uniforme(valor, semilla):
+    """Valor determinista en [0, 1) a partir de un entero (hash multiplicativo)."""
+    return (((valor + semilla * 7_919) * 2_654_435_761) & 0xFFFFFFFF) / 2 ** 32
+
+
+def _precio(id_producto, semilla):
+    # Muchos productos baratos y pocos caros
+    return round(2 + 800 * _uniforme(id_producto, semilla) ** 3, 2)
+
+
+class Sembrador:
+
+    def __init__(self, args):
+        self.args = args
+        self.conexion = psycopg2.connect(args.dsn)
+
+    def _copiar(self, tabla, columnas, filas, total):
+        inicio = time.perf_counter()
+        flujo = _FlujoCopia(filas, tabla, total)
+        with self.conexion.cursor() as cursor:
+            cursor.copy_expert(f"COPY {tabla} ({', '.join(columnas)}) FROM STDIN", flujo, size=COPY_BUFFER)
+        self.conexion.commit()
+        transcurrido = time.perf_counter() - inicio
+        print(f"{tabla}: {flujo.escritas:,} filas en {transcurrido:.1f}s "
+              f"({flujo.escritas / max(transcurrido, 1e-9):,.0f} filas/s)", flush=True)
+        return flujo.escritas
+
+    def _siguiente_id(self, tabla, columna):
+        with self.conexion.cursor() as cursor:
+            cursor.execute(f"SELECT COALESCE(MAX({columna}), 0) + 1 FROM {tabla}")
+            return cursor.fetchone()[0]
+
+    def truncar(self):
+        with self.conexion.cursor() as cursor:
+            cursor.execute("TRUNCATE detalle_pedidos, pedidos, carrito, productos, usuarios RESTART IDENTITY CASCADE")
+        self.conexion.commit()
+        print("Tablas vaciadas")
+
+    # ------------------------------------------------------------------ #
+    # Generadores (misma semilla -> mismas filas)
+    # ------------------------------------------------------------------ #
+    def _usuarios(self, base):
+        a = self.args
+        rng = random.Random(a.semilla)
+        password = generate_password_hash(a.password)   # un solo hash para todas las cuentas
+        yield (str(base), 'Administrador Carga', 'admin@carga.test', password, 'administrador')
+        for n in range(1, a.usuarios + 1):
+            nombre = f"{rng.choice(NOMBRES)} {rng.choice(APELLIDOS)} {rng.choice(APELLIDOS)}"
+            yield (str(base + n), nombre, f"cliente{n}@carga.test", password, 'cliente')
+
+    def _categorias(self):
+        # Ley de Zipf: la categoría k tiene peso 1/k
+        pesos = [1 / k for k in range(1, self.args.categorias + 1)]
+        return [f"Categoría {k}" for k in range(1, self.args.categorias + 1)], pesos
+
+    def _productos(self, base):
+        a = self.args
+        rng = random.Random(a.semilla + 1)
+        categorias, pesos = self._categorias()
+        acumulados = []
+        suma = 0.0
+        for peso in pesos:
+            suma += peso
+            acumulados.append(suma)
+        for i in range(a.productos):
+            id_producto = base + i
+            categoria = rng.choices(categorias, cum_weights=acumulados)[0]
+            nombre = f"{rng.choice(ADJETIVOS)} {categoria.split()[-1]}-{i + 1}"
+            descripcion = f"Producto sintético {i + 1} de {categoria.lower()}"
+            activo = 't' if rng.random() < 0.95 else 'f'
+            stock = str(rng.randint(1_000, 100_000))
+            yield (str(id_producto), nombre, descripcion, categoria, '/static/imagenes/producto.png',
+                   f"{_precio(id_producto, a.semilla):.2f}", stock, activo)
+
+    def _carritos(self, base_usuario, base_producto):
+        a = self.args
+        rng = random.Random(a.semilla + 2)
+        salto = _multiplicador(a.productos)
+        for n in range(1, a.usuarios + 1):
+            if rng.random() >= a.carritos:
+                continue
+            elegidos = set()
+            for _ in range(rng.randint(1, 5)):
+                elegidos.add(base_producto + (_sesgado(rng, a.productos, 3) * salto) % a.productos)
+            for id_producto in sorted(elegidos):
+                yield (str(base_usuario + n), str(id_producto), str(rng.randint(1, 3)))
+
+    def _pedidos(self, base_pedido, base_usuario, base_producto):
+        """Genera (pedido, líneas); se recorre dos veces (cabeceras y detalle) con la misma semilla."""
+        a = self.args
+        rng = random.Random(a.semilla + 3)
+        salto_clientes = _multiplicador(a.usuarios)
+        salto_productos = _multiplicador(a.productos)
+        ahora = datetime.combine(a.hasta, datetime.min.time())
+        for i in range(a.pedidos):
+            # Clientes recurrentes: unos pocos concentran muchos pedidos
+            id_cliente = base_usuario + 1 + (_sesgado(rng, a.usuarios, 2) * salto_clientes) % a.usuarios
+            dias = a.dias * rng.random() ** 1.5   # más pedidos recientes
+            fecha = ahora - timedelta(seconds=int(dias * 86400))
+            status = 'completado' if dias > 7 or rng.random() < 0.5 else 'pendiente'
+            lineas = []
+            for _ in range(min(1 + int(rng.expovariate(1 / max(a.lineas_media - 1, 0.01))), 50)):
+                id_producto = base_producto + (_sesgado(rng, a.productos, 3) * salto_productos) % a.productos
+                lineas.append((id_producto, rng.randint(1, 4), _precio(id_producto, a.semilla)))
+            yield (base_pedido + i, id_cliente, fecha, status), lineas
+
+    def _cabeceras(self, *bases):
+        for (id_pedido, id_cliente, fecha, status), lineas in self._pedidos(*bases):
+            total = sum(cantidad * precio for _, cantidad, precio in lineas)
+            yield (str(id_pedido), str(id_cliente), fecha.isoformat(sep=' '), status, f"{total:.2f}")
+
+    def _detalles(self, *bases):
+        for (id_pedido, _, _, _), lineas in self._pedidos(*bases):
+            for id_producto, cantidad, precio in lineas:
+                yield (str(id_pedido), str(id_producto), str(cantidad), f"{precio:.2f}")
+
+    # ------------------------------------------------------------------ #
+    def sembrar(self):
+        a = self.args
+        inicio = time.perf_counter()
+        if a.truncar:
+            self.truncar()
+        base_usuario = self._siguiente_id('usuarios', 'id')
+        base_producto = self._siguiente_id('productos', 'id')
+        base_pedido = self._siguiente_id('pedidos', 'id_pedido')
+        lineas_estimadas = int(a.pedidos * a.lineas_media)
+
+        filas = self._copiar('usuarios', ('id', 'nombre', 'correo', 'contraseña', 'rol'),
+                             self._usuarios(base_usuario), a.usuarios + 1)
+        filas += self._copiar('productos', ('id', 'nombre', 'descripcion', 'categoria', 'nombre_columna_imagen',
+                                            'precio', 'stock', 'activo'),
+                              self._productos(base_producto), a.productos)
+        filas += self._copiar('carrito', ('id_usuario', 'id_producto', 'cantidad'),
+                              self._carritos(base_usuario, base_producto), int(a.usuarios * a.carritos * 3))
+        bases = (base_pedido, base_usuario, base_producto)
+        filas += self._copiar('pedidos', ('id_pedido', 'id_cliente', 'data_pedido', 'status', 'total'),
+                              self._cabeceras(*bases), a.pedidos)
+
+        # El trigger de stock no debe correr por cada línea histórica
+        with self.conexion.cursor() as cursor:
+            cursor.execute("ALTER TABLE detalle_pedidos DISABLE TRIGGER USER")
+        try:
+            filas += self._copiar('detalle_pedidos', ('id_pedido', 'id_producto', 'cantidad', 'precio_unitario'),
+                                  self._detalles(*bases), lineas_estimadas)
+        finally:
+            self.conexion.rollback()
+            with self.conexion.cursor() as cursor:
+                cursor.execute("ALTER TABLE detalle_pedidos ENABLE TRIGGER USER")
+            self.conexion.commit()
+
+        with self.conexion.cursor() as cursor:
+            for tabla, columna in (('usuarios', 'id'), ('productos', 'id'), ('pedidos', 'id_pedido')):
+                cursor.execute(f"SELECT setval(pg_get_serial_sequence('{tabla}', '{columna}'), "
+                               f"(SELECT MAX({columna}) FROM {tabla}))")
+            # Los workers descartan su caché del catálogo
+            CatalogoCache.registrar_cambio(cursor)
+        self.conexion.commit()
+
+        print("Actualizando estadísticas (ANALYZE)...", flush=True)
+        self.conexion.autocommit = True
+        with self.conexion.cursor() as cursor:
+            for tabla in ('usuarios', 'productos', 'carrito', 'pedidos', 'detalle_pedidos'):
+                cursor.execute(f"ANALYZE {tabla}")
+        transcurrido = time.perf_counter() - inicio
+        print(f"Total: {filas:,} filas en {transcurrido:.1f}s ({filas / transcurrido:,.0f} filas/s)")
+        self.conexion.close()
+
+
+def main():
+    load_dotenv()
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--dsn', default=os.environ.get('DATABASE_URL'))
+    parser.add_argument('--usuarios', type=int, default=100_000)
+    parser.add_argument('--productos', type=int, default=50_000)
+    parser.add_argument('--categorias', type=int, default=200)
+    parser.add_argument('--pedidos', type=int, default=1_000_000)
+    parser.add_argument('--lineas-media', type=float, default=3.0, help='Líneas promedio por pedido.')
+    parser.add_argument('--carritos', type=float, default=0.2, help='Fracción de usuarios con carrito.')
+    parser.add_argument('--dias', type=int, default=365, help='Antigüedad máxima de los pedidos.')
+    parser.add_argument('--hasta', type=date.fromisoformat, default=date.today(),
+                        help='Fecha (AAAA-MM-DD) del pedido más reciente; fijarla hace la salida idéntica entre corridas.')
+    parser.add_argument('--password', default='carga123')
+    parser.add_argument('--semilla', type=int, default=42)
+    parser.add_argument('--truncar', action='store_true',
+                        help='Vacía usuarios, productos, carrito, pedidos y detalle_pedidos antes de sembrar.')
+    args = parser.parse_args()
+    if not args.dsn:
+        parser.error("Defina DATABASE_URL o use --dsn")
+    if args.usuarios < 1 or args.productos < 1 or args.categorias < 1:
+        parser.error("--usuarios, --productos y --categorias deben ser al menos 1")
+    Sembrador(args).sembrar()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,30 @@
+import glob
+import os
+
+# Las métricas de Prometheus se suman entre workers a través de este directorio.
+# Se define aquí, antes de que cualquier proceso importe prometheus_client.
+os.environ.setdefault('PROMETHEUS_MULTIPROC_DIR', os.path.join('/tmp', 'tienda_metricas'))
+
+
+def on_starting(server):
+    """Al arrancar el máster se descartan las métricas de una ejecución anterior
+    y, si se pidió, se migra la base."""
+    directorio = os.environ['PROMETHEUS_MULTIPROC_DIR']
+    os.makedirs(directorio, exist_ok=True)
+    for archivo in glob.glob(os.path.join(directorio, '*.db')):
+        os.remove(archivo)
+
+    # Con MIGRAR_AL_INICIAR=1 el máster aplica las migraciones pendientes antes de
+    # crear los workers; si fallan, gunicorn no arranca.
+    from dotenv import load_dotenv
+    load_dotenv()
+    if os.environ.get('MIGRAR_AL_INICIAR', '').lower() in ('1', 'true'):
+        from models.Migraciones import Migrador
+        aplicadas = Migrador(os.environ.get('DATABASE_URL')).migrar(avisar=server.log.info)
+        server.log.info("Migraciones aplicadas al iniciar: %d", len(aplicadas))
+
+
+def child_exit(server, worker):
+    """Descarta los gauges del worker que terminó para que no sumen en /metrics."""
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)
@@ -0,0 +1,124 @@
+-- Esquema base de la tienda, tal como existía antes de 001, y los índices de las
+-- consultas más frecuentes. Las migraciones siguientes agregan columnas, tablas e
+-- índices sobre este esquema. En una base existente solo crea lo que falte.
+-- Idempotente.
+--
+-- Índices de las rutas calientes:
+--   carrito (id_usuario, id_producto)  carrito del usuario y upsert de agregar_producto
+--   detalle_pedidos (id_pedido)        líneas de un pedido, totales, recibos
+--   detalle_pedidos (id_producto)      ventas por producto y baja de productos
+--   pedidos (data_pedido, id_pedido)   búsqueda y listados de pedidos por fecha
+--   usuarios (correo)                  login, registro y cambio de contraseña
+--   productos (id) WHERE activo        catálogo ordenado por "más nuevos"
+
+BEGIN;
+
+CREATE TABLE IF NOT EXISTS usuarios (
+    id SERIAL PRIMARY KEY,
+    nombre VARCHAR(100) NOT NULL,
+    correo VARCHAR(150) NOT NULL,
+    contraseña VARCHAR(255) NOT NULL,
+    rol VARCHAR(20) NOT NULL DEFAULT 'cliente'
+);
+
+CREATE TABLE IF NOT EXISTS productos (
+    id SERIAL PRIMARY KEY,
+    nombre VARCHAR(150) NOT NULL,
+    descripcion TEXT,
+    categoria VARCHAR(100),
+    nombre_columna_imagen VARCHAR(255),
+    precio NUMERIC(10, 2) NOT NULL,
+    stock INTEGER NOT NULL DEFAULT 0,
+    activo BOOLEAN NOT NULL DEFAULT TRUE
+);
+
+CREATE TABLE IF NOT EXISTS carrito (
+    id_carrito SERIAL PRIMARY KEY,
+    id_usuario INTEGER NOT NULL REFERENCES usuarios (id) ON DELETE CASCADE,
+    id_producto INTEGER NOT NULL REFERENCES productos (id) ON DELETE CASCADE
+);
+
+CREATE TABLE IF NOT EXISTS pedidos (
+    id_pedido SERIAL PRIMARY KEY,
+    id_cliente INTEGER NOT NULL REFERENCES usuarios (id),
+    data_pedido TIMESTAMP NOT NULL DEFAULT NOW(),
+    status VARCHAR(20) NOT NULL DEFAULT 'pendiente'
+);
+
+CREATE TABLE IF NOT EXISTS detalle_pedidos (
+    id_detalle SERIAL PRIMARY KEY,
+    id_pedido INTEGER NOT NULL REFERENCES pedidos (id_pedido) ON DELETE CASCADE,
+    id_producto INTEGER NOT NULL REFERENCES productos (id),
+    cantidad INTEGER NOT NULL
+);
+
+-- Cada línea de pedido descuenta su cantidad del stock del producto.
+-- El trigger solo se crea si la tabla no tiene ya uno propio, para no descontar dos veces.
+CREATE OR REPLACE FUNCTION descontar_stock() RETURNS trigger AS $$
+BEGIN
+    UPDATE productos SET stock = stock - NEW.cantidad WHERE id = NEW.id_producto;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DO $$
+BEGIN
+    IF NOT EXISTS (
+        SELECT 1 FROM pg_trigger
+        WHERE tgrelid = 'detalle_pedidos'::regclass AND NOT tgisinternal
+    ) THEN
+        CREATE TRIGGER tr_detalle_pedidos_descontar_stock
+            AFTER INSERT ON detalle_pedidos
+            FOR EACH ROW EXECUTE FUNCTION descontar_stock();
+    END IF;
+END $$;
+
+-- Mismos nombres que en 001 y 005, que así no los duplican
+CREATE INDEX IF NOT EXISTS ix_detalle_pedidos_pedido
+    ON detalle_pedidos (id_pedido);
+
+CREATE INDEX IF NOT EXISTS ix_detalle_pedidos_producto
+    ON detalle_pedidos (id_producto);
+
+CREATE INDEX IF NOT EXISTS ix_pedidos_fecha
+    ON pedidos (data_pedido DESC, id_pedido DESC);
+
+CREATE INDEX IF NOT EXISTS ix_productos_activos
+    ON productos (id) WHERE activo = TRUE;
+
+-- Los índices únicos no se crean si ya hay duplicados: el del carrito lo crea 001
+-- después de colapsar las filas repetidas. Si ya existe un índice b-tree que empiece
+-- por usuarios.correo (por ejemplo un UNIQUE de la tabla original) no se agrega otro;
+-- con correos repetidos queda un índice no único hasta que se unifiquen.
+DO $$
+BEGIN
+    IF NOT EXISTS (
+        SELECT 1 FROM carrito GROUP BY id_usuario, id_producto HAVING COUNT(*) > 1
+    ) THEN
+        CREATE UNIQUE INDEX IF NOT EXISTS ux_carrito_usuario_producto
+            ON carrito (id_usuario, id_producto);
+    END IF;
+
+    IF NOT EXISTS (
+        SELECT 1
+        FROM pg_index i
+        JOIN pg_class c ON c.oid = i.indexrelid
+        JOIN pg_am am ON am.oid = c.relam
+        JOIN pg_attribute a ON a.attrelid = i.indrelid AND a.attnum = i.indkey[0]
+        WHERE i.indrelid = 'usuarios'::regclass
+          AND am.amname = 'btree'
+          AND a.attname = 'correo'
+          AND i.indpred IS NULL
+    ) THEN
+        IF EXISTS (
+            SELECT 1 FROM usuarios GROUP BY correo HAVING COUNT(*) > 1
+        ) THEN
+            RAISE NOTICE 'Hay usuarios con el mismo correo: se crea ix_usuarios_correo sin UNIQUE';
+            CREATE INDEX ix_usuarios_correo ON usuarios (correo);
+        ELSE
+            CREATE UNIQUE INDEX ux_usuarios_correo ON usuarios (correo);
+        END IF;
+    END IF;
+END $$;
+
+COMMIT;
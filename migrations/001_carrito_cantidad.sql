@@ -0,0 +1,38 @@
+-- Carrito por cantidad: una fila por (usuario, producto) en lugar de una fila por unidad.
+-- Es idempotente: se puede ejecutar varias veces sin efectos secundarios.
+-- Uso: psql "$DATABASE_URL" -f migrations/001_carrito_cantidad.sql
+
+BEGIN;
+
+ALTER TABLE carrito ADD COLUMN IF NOT EXISTS cantidad INTEGER NOT NULL DEFAULT 1;
+
+-- Colapsar las filas repetidas: la fila más antigua conserva la suma de cantidades
+WITH agrupado AS (
+    SELECT id_usuario, id_producto, MIN(id_carrito) AS conservar, SUM(cantidad) AS total
+    FROM carrito
+    GROUP BY id_usuario, id_producto
+    HAVING COUNT(*) > 1
+)
+UPDATE carrito c
+SET cantidad = a.total
+FROM agrupado a
+WHERE c.id_carrito = a.conservar;
+
+DELETE FROM carrito c
+USING carrito otro
+WHERE c.id_usuario = otro.id_usuario
+  AND c.id_producto = otro.id_producto
+  AND c.id_carrito > otro.id_carrito;
+
+-- Necesario para el upsert (ON CONFLICT) de CarritoModel.agregar_producto
+CREATE UNIQUE INDEX IF NOT EXISTS ux_carrito_usuario_producto
+    ON carrito (id_usuario, id_producto);
+
+DO $$
+BEGIN
+    IF NOT EXISTS (SELECT 1 FROM pg_constraint WHERE conname = 'ck_carrito_cantidad_positiva') THEN
+        ALTER TABLE carrito ADD CONSTRAINT ck_carrito_cantidad_positiva CHECK (cantidad > 0);
+    END IF;
+END $$;
+
+COMMIT;
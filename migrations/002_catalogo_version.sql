@@ -0,0 +1,14 @@
+-- Versión del catálogo: se incrementa con cada cambio de productos y se notifica
+-- por el canal `catalogo_cambios` (ver models/CatalogoCache.py). Idempotente.
+
+BEGIN;
+
+CREATE TABLE IF NOT EXISTS catalogo_version (
+    id BOOLEAN PRIMARY KEY DEFAULT TRUE CHECK (id),
+    version BIGINT NOT NULL DEFAULT 1
+);
+
+INSERT INTO catalogo_version (id, version) VALUES (TRUE, 1)
+ON CONFLICT (id) DO NOTHING;
+
+COMMIT;
@@ -0,0 +1,22 @@
+-- Índices para la paginación por clave del catálogo (ProductoModel.get_active_products_page).
+-- Cada ordenamiento (precio, nombre, más nuevos) con y sin filtro de categoría
+-- recorre un índice parcial sobre los productos activos. Idempotente.
+
+BEGIN;
+
+CREATE INDEX IF NOT EXISTS ix_productos_activos_precio
+    ON productos (precio, id) WHERE activo = TRUE;
+
+CREATE INDEX IF NOT EXISTS ix_productos_activos_nombre
+    ON productos (nombre, id) WHERE activo = TRUE;
+
+CREATE INDEX IF NOT EXISTS ix_productos_activos_categoria
+    ON productos (categoria, id) WHERE activo = TRUE;
+
+CREATE INDEX IF NOT EXISTS ix_productos_activos_categoria_precio
+    ON productos (categoria, precio, id) WHERE activo = TRUE;
+
+CREATE INDEX IF NOT EXISTS ix_productos_activos_categoria_nombre
+    ON productos (categoria, nombre, id) WHERE activo = TRUE;
+
+COMMIT;
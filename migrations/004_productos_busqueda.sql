@@ -0,0 +1,28 @@
+-- Búsqueda de texto completo de productos (ProductoModel.search).
+-- La columna generada `busqueda` se mantiene sola en cada INSERT/UPDATE y la
+-- configuración es_unaccent hace la búsqueda insensible a tildes. Idempotente.
+
+BEGIN;
+
+CREATE EXTENSION IF NOT EXISTS unaccent;
+
+DO $$
+BEGIN
+    IF NOT EXISTS (SELECT 1 FROM pg_ts_config WHERE cfgname = 'es_unaccent') THEN
+        CREATE TEXT SEARCH CONFIGURATION es_unaccent (COPY = pg_catalog.spanish);
+        ALTER TEXT SEARCH CONFIGURATION es_unaccent
+            ALTER MAPPING FOR hword, hword_part, word WITH unaccent, spanish_stem;
+    END IF;
+END $$;
+
+-- Nombre pesa más que categoría, y ésta más que la descripción
+ALTER TABLE productos ADD COLUMN IF NOT EXISTS busqueda tsvector
+    GENERATED ALWAYS AS (
+        setweight(to_tsvector('es_unaccent', coalesce(nombre, '')), 'A') ||
+        setweight(to_tsvector('es_unaccent', coalesce(categoria, '')), 'B') ||
+        setweight(to_tsvector('es_unaccent', coalesce(descripcion, '')), 'C')
+    ) STORED;
+
+CREATE INDEX IF NOT EXISTS ix_productos_busqueda ON productos USING GIN (busqueda);
+
+COMMIT;
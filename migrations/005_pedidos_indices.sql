@@ -0,0 +1,29 @@
+-- Índices para la búsqueda paginada de pedidos (PedidoModel.buscar_pedidos).
+-- La paginación por clave recorre (data_pedido, id_pedido) en orden descendente,
+-- con o sin filtro de estado o cliente; el total de cada pedido se calcula con
+-- detalle_pedidos(id_pedido). Los índices trigram aceleran los ILIKE '%texto%'
+-- sobre nombre y correo del cliente. Idempotente.
+
+BEGIN;
+
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+CREATE INDEX IF NOT EXISTS ix_pedidos_fecha
+    ON pedidos (data_pedido DESC, id_pedido DESC);
+
+CREATE INDEX IF NOT EXISTS ix_pedidos_status_fecha
+    ON pedidos (status, data_pedido DESC, id_pedido DESC);
+
+CREATE INDEX IF NOT EXISTS ix_pedidos_cliente_fecha
+    ON pedidos (id_cliente, data_pedido DESC, id_pedido DESC);
+
+CREATE INDEX IF NOT EXISTS ix_detalle_pedidos_pedido
+    ON detalle_pedidos (id_pedido);
+
+CREATE INDEX IF NOT EXISTS ix_usuarios_nombre_trgm
+    ON usuarios USING gin (nombre gin_trgm_ops);
+
+CREATE INDEX IF NOT EXISTS ix_usuarios_correo_trgm
+    ON usuarios USING gin (correo gin_trgm_ops);
+
+COMMIT;
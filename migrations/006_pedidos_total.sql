@@ -0,0 +1,32 @@
+-- Total del pedido almacenado y precio unitario congelado en cada línea.
+-- `detalle_pedidos.precio_unitario` guarda el precio al momento de la compra y
+-- `pedidos.total` la suma de las líneas; PedidoModel los mantiene al crear o
+-- editar líneas. Los pedidos existentes se rellenan con el precio actual.
+-- Idempotente.
+
+BEGIN;
+
+ALTER TABLE detalle_pedidos ADD COLUMN IF NOT EXISTS precio_unitario NUMERIC(10, 2);
+
+UPDATE detalle_pedidos dp
+SET precio_unitario = pr.precio
+FROM productos pr
+WHERE dp.id_producto = pr.id
+  AND dp.precio_unitario IS NULL;
+
+ALTER TABLE detalle_pedidos ALTER COLUMN precio_unitario SET NOT NULL;
+
+ALTER TABLE pedidos ADD COLUMN IF NOT EXISTS total NUMERIC(12, 2);
+
+UPDATE pedidos p
+SET total = COALESCE((
+    SELECT SUM(dp.cantidad * dp.precio_unitario)
+    FROM detalle_pedidos dp
+    WHERE dp.id_pedido = p.id_pedido
+), 0)
+WHERE p.total IS NULL;
+
+ALTER TABLE pedidos ALTER COLUMN total SET DEFAULT 0;
+ALTER TABLE pedidos ALTER COLUMN total SET NOT NULL;
+
+COMMIT;
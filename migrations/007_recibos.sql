@@ -0,0 +1,19 @@
+-- Almacén de recibos en la base de datos (RECIBOS_ALMACEN=bd, ver models/AlmacenRecibos.py).
+-- Una fila por trabajo: 'pendiente' al encolar, 'listo' con el PDF o 'error'.
+-- El índice por fecha sirve a la purga por retención. Idempotente.
+
+BEGIN;
+
+CREATE TABLE IF NOT EXISTS recibos (
+    nombre      TEXT PRIMARY KEY,
+    id_usuario  INTEGER NOT NULL,
+    estado      TEXT NOT NULL DEFAULT 'pendiente'
+                CHECK (estado IN ('pendiente', 'listo', 'error')),
+    pdf         BYTEA,
+    error       TEXT,
+    creado      TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+
+CREATE INDEX IF NOT EXISTS ix_recibos_creado ON recibos (creado);
+
+COMMIT;
@@ -0,0 +1,9 @@
+-- Versión del pedido: PedidoModel la incrementa cada vez que cambian sus líneas.
+-- Los recibos se cachean con la clave pedido_<id>_v<version>, así una edición
+-- del administrador deja obsoleto el recibo anterior. Idempotente.
+
+BEGIN;
+
+ALTER TABLE pedidos ADD COLUMN IF NOT EXISTS version INTEGER NOT NULL DEFAULT 1;
+
+COMMIT;
@@ -0,0 +1,20 @@
+-- Clave natural de productos para la importación masiva (ProductoModel.importar):
+-- el nombre sin distinguir mayúsculas. El upsert compara lower(nombre), así que
+-- este índice lo hace rápido y evita duplicados entre importaciones simultáneas.
+-- Si ya hay nombres repetidos no se crea el índice y se avisa; hay que unificarlos
+-- y volver a ejecutar la migración. Idempotente.
+
+BEGIN;
+
+DO $$
+BEGIN
+    IF EXISTS (
+        SELECT 1 FROM productos GROUP BY lower(nombre) HAVING COUNT(*) > 1
+    ) THEN
+        RAISE NOTICE 'Hay productos con el mismo nombre: no se crea ux_productos_nombre';
+    ELSE
+        CREATE UNIQUE INDEX IF NOT EXISTS ux_productos_nombre ON productos (lower(nombre));
+    END IF;
+END $$;
+
+COMMIT;
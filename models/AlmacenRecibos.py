@@ -0,0 +1,163 @@
+import os
+import threading
+
+import psycopg2
+
+
+class AlmacenLocal:
+    """Guarda los recibos en un directorio local repartido en subcarpetas.
+
+    Cada recibo va en `<directorio>/<aa>/<bb>/<nombre>.pdf`, donde aa y bb son
+    los primeros caracteres del hash del recibo, para no acumular miles de
+    archivos en una sola carpeta. El estado se deduce de los archivos
+    `.pendiente`, `.pdf` y `.error`, visibles para todos los workers.
+    """
+
+    def __init__(self, directorio):
+        self.directorio = directorio
+
+    def _ruta(self, trabajo, nombre, extension):
+        return os.path.join(self.directorio, trabajo[:2], trabajo[2:4], f"{nombre}.{extension}")
+
+    def marcar_pendiente(self, trabajo, nombre, id_usuario):
+        ruta = self._ruta(trabajo, nombre, 'pendiente')
+        os.makedirs(os.path.dirname(ruta), exist_ok=True)
+        with open(ruta, 'w', encoding='utf-8') as f:
+            f.write(str(id_usuario))
+
+    def guardar(self, trabajo, nombre, id_usuario, datos):
+        ruta = self._ruta(trabajo, nombre, 'pdf')
+        os.makedirs(os.path.dirname(ruta), exist_ok=True)
+        # Escribir y renombrar: nunca se sirve un PDF a medias
+        with open(f"{ruta}.tmp", 'wb') as f:
+            f.write(datos)
+        os.replace(f"{ruta}.tmp", ruta)
+        self._quitar(trabajo, nombre, 'pendiente')
+
+    def marcar_error(self, trabajo, nombre, mensaje):
+        with open(self._ruta(trabajo, nombre, 'error'), 'w', encoding='utf-8') as f:
+            f.write(mensaje)
+        self._quitar(trabajo, nombre, 'pendiente')
+
+    def _quitar(self, trabajo, nombre, extension):
+        try:
+            os.remove(self._ruta(trabajo, nombre, extension))
+        except FileNotFoundError:
+            pass
+
+    def estado(self, trabajo, nombre):
+        """Devuelve (estado, creado_epoch) o (None, None) si no existe."""
+        for estado, extension in (('listo', 'pdf'), ('error', 'error'), ('pendiente', 'pendiente')):
+            try:
+                return estado, os.path.getmtime(self._ruta(trabajo, nombre, extension))
+            except OSError:
+                continue
+        return None, None
+
+    def leer(self, trabajo, nombre):
+        try:
+            with open(self._ruta(trabajo, nombre, 'pdf'), 'rb') as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def purgar(self, antes_de):
+        """Elimina los recibos anteriores a `antes_de` (epoch) y las carpetas vacías."""
+        eliminados = 0
+        for raiz, carpetas, archivos in os.walk(self.directorio, topdown=False):
+            for archivo in archivos:
+                ruta = os.path.join(raiz, archivo)
+                try:
+                    if os.path.getmtime(ruta) < antes_de:
+                        os.remove(ruta)
+                        eliminados += 1
+                except OSError:
+                    pass
+            if raiz != self.directorio:
+                try:
+                    os.rmdir(raiz)
+                except OSError:
+                    pass
+        return eliminados
+
+
+class AlmacenBD:
+    """Guarda los recibos en la tabla `recibos` (ver migrations/007_recibos.sql).
+
+    Se usa una conexión propia en autocommit por proceso, porque también
+    escriben los procesos del pool de recibos, que no tienen contexto Flask.
+    """
+
+    def __init__(self, dsn):
+        self.dsn = dsn
+        self._conexion = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        # Solo viaja el DSN a los procesos del pool
+        return {'dsn': self.dsn}
+
+    def __setstate__(self, estado):
+        self.__init__(estado['dsn'])
+
+    def _ejecutar(self, sql, params=(), obtener=False):
+        with self._lock:
+            for intento in (1, 2):
+                try:
+                    if self._conexion is None or self._conexion.closed or self._pid != os.getpid():
+                        self._conexion = psycopg2.connect(self.dsn)
+                        self._conexion.autocommit = True
+                        self._pid = os.getpid()
+                    with self._conexion.cursor() as cursor:
+                        cursor.execute(sql, params)
+                        if obtener:
+                            return cursor.fetchone()
+                        return cursor.rowcount
+                except psycopg2.OperationalError:
+                    # Conexión caída: se reintenta una vez con una nueva
+                    self._conexion = None
+                    if intento == 2:
+                        raise
+
+    def marcar_pendiente(self, trabajo, nombre, id_usuario):
+        self._ejecutar("""
+            INSERT INTO recibos (nombre, id_usuario, estado)
+            VALUES (%s, %s, 'pendiente')
+            ON CONFLICT (nombre) DO NOTHING
+        """, (nombre, id_usuario))
+
+    def guardar(self, trabajo, nombre, id_usuario, datos):
+        self._ejecutar("""
+            INSERT INTO recibos (nombre, id_usuario, estado, pdf)
+            VALUES (%s, %s, 'listo', %s)
+            ON CONFLICT (nombre) DO UPDATE SET estado = 'listo', pdf = EXCLUDED.pdf
+        """, (nombre, id_usuario, psycopg2.Binary(datos)))
+
+    def marcar_error(self, trabajo, nombre, mensaje):
+        self._ejecutar("UPDATE recibos SET estado = 'error', error = %s WHERE nombre = %s",
+                       (mensaje, nombre))
+
+    def estado(self, trabajo, nombre):
+        row = self._ejecutar("SELECT estado, EXTRACT(EPOCH FROM creado) FROM recibos WHERE nombre = %s",
+                             (nombre,), obtener=True)
+        return (row[0], float(row[1])) if row else (None, None)
+
+    def leer(self, trabajo, nombre):
+        row = self._ejecutar("SELECT pdf FROM recibos WHERE nombre = %s AND estado = 'listo'",
+                             (nombre,), obtener=True)
+        return bytes(row[0]) if row else None
+
+    def purgar(self, antes_de):
+        return self._ejecutar("DELETE FROM recibos WHERE creado < to_timestamp(%s)", (antes_de,))
+
+
+def crear_almacen(tipo, directorio=None, dsn=None):
+    """Crea el almacén configurado: 'local', 'bd' o 'memoria' (sin persistencia, devuelve None)."""
+    if tipo == 'memoria':
+        return None
+    if tipo == 'bd':
+        return AlmacenBD(dsn)
+    if tipo == 'local':
+        return AlmacenLocal(directorio)
+    raise ValueError(f"Almacén de recibos desconocido: {tipo}")
@@ -1,32 +1,24 @@
 from models.entities.producto import Producto
+from models.Metricas import CARRITO_AGREGADOS
+from models.MapeoFilas import mapear_filas
 
 class CarritoModel:
     @classmethod
     def get_carrito_by_usuario(cls, db_connection, id_usuario):
         """Obtiene todos los items del carrito de un usuario específico"""
         try:
-            items_carrito = []
             with db_connection.cursor() as cursor:
-                # Agrupar por producto y sumar la cantidad (se almacenan filas por unidad)
+                # Una fila por producto con su cantidad (ver migrations/001_carrito_cantidad.sql)
                 sql = """
-                    SELECT p.id, p.nombre, p.precio, p.nombre_columna_imagen, COUNT(c.id_carrito) AS cantidad
+                    SELECT p.id, p.nombre, p.precio, p.nombre_columna_imagen AS imagen, c.cantidad
                     FROM carrito c
                     JOIN productos p ON c.id_producto = p.id
                     WHERE c.id_usuario = %s
-                    GROUP BY p.id, p.nombre, p.precio, p.nombre_columna_imagen
+                    ORDER BY c.id_carrito
                 """
                 cursor.execute(sql, (id_usuario,))
-                rows = cursor.fetchall()
-
-                for row in rows:
-                    items_carrito.append({
-                        'id': row[0],  # id_producto
-                        'nombre': row[1],
-                        'precio': float(row[2]),
-                        'imagen': row[3],
-                        'cantidad': int(row[4])
-                    })
-                return items_carrito
+                # 'id' es el id del producto
+                return mapear_filas(cursor, conversiones={'precio': float, 'cantidad': int})
         except Exception as ex:
             db_connection.rollback()
             raise ValueError(f"Error al obtener carrito: {ex}")
@@ -35,33 +27,46 @@ class CarritoModel:
     def agregar_producto(cls, db_connection, id_usuario, id_producto, cantidad=1):
         """Agrega una cantidad de producto al carrito del usuario.
 
-        Implementación: la tabla `carrito` guarda una fila por unidad. Antes de insertar validamos
-        que la cantidad solicitada no supere el stock disponible menos lo que ya está en el carrito.
+        Implementación: la tabla `carrito` guarda una fila por (usuario, producto) con su cantidad.
+        La validación de stock y el upsert van en una sola sentencia: la condición del
+        ON CONFLICT se evalúa sobre la versión más reciente de la fila (bloqueada), así dos
+        peticiones concurrentes no pueden superar el stock entre ambas.
+
+        Devuelve un dict con la nueva cantidad en el carrito y las unidades que quedan disponibles.
         """
         try:
+            if cantidad <= 0:
+                raise ValueError("La cantidad debe ser al menos 1")
             with db_connection.cursor() as cursor:
-                # Obtener stock actual del producto
-                cursor.execute("SELECT stock FROM productos WHERE id = %s", (id_producto,))
-                prod_row = cursor.fetchone()
-                if not prod_row:
+                cursor.execute("""
+                    WITH producto AS (
+                        SELECT p.id, p.stock, COALESCE(c.cantidad, 0) AS en_carrito
+                        FROM productos p
+                        LEFT JOIN carrito c ON c.id_producto = p.id AND c.id_usuario = %(usuario)s
+                        WHERE p.id = %(producto)s
+                    ), agregado AS (
+                        INSERT INTO carrito (id_usuario, id_producto, cantidad)
+                        SELECT %(usuario)s, id, %(cantidad)s FROM producto WHERE %(cantidad)s <= stock
+                        ON CONFLICT (id_usuario, id_producto) DO UPDATE
+                            SET cantidad = carrito.cantidad + EXCLUDED.cantidad
+                            WHERE carrito.cantidad + EXCLUDED.cantidad
+                                  <= (SELECT stock FROM productos WHERE id = EXCLUDED.id_producto)
+                        RETURNING cantidad
+                    )
+                    SELECT producto.stock, producto.en_carrito, (SELECT cantidad FROM agregado)
+                    FROM producto
+                """, {'usuario': id_usuario, 'producto': id_producto, 'cantidad': cantidad})
+                row = cursor.fetchone()
+                if not row:
                     raise ValueError("Producto no encontrado")
-                stock = int(prod_row[0])
 
-                # Cantidad ya en el carrito para este usuario y producto
-                cursor.execute("SELECT COUNT(*) FROM carrito WHERE id_usuario = %s AND id_producto = %s", (id_usuario, id_producto))
-                in_cart = cursor.fetchone()[0] or 0
+                stock, in_cart, nueva_cantidad = int(row[0]), int(row[1]), row[2]
+                if nueva_cantidad is None:
+                    raise ValueError(f"Stock insuficiente. Disponibles: {max(stock - in_cart, 0)}")
 
-                available = stock - int(in_cart)
-                if cantidad <= 0:
-                    raise ValueError("La cantidad debe ser al menos 1")
-                if cantidad > available:
-                    raise ValueError(f"Stock insuficiente. Disponibles: {available}")
-
-                # Insertar filas (una por unidad). Usamos executemany para eficiencia.
-                values = [(id_usuario, id_producto) for _ in range(cantidad)]
-                cursor.executemany("INSERT INTO carrito (id_usuario, id_producto) VALUES (%s, %s)", values)
                 db_connection.commit()
-                return True
+                CARRITO_AGREGADOS.inc()
+                return {'cantidad': int(nueva_cantidad), 'disponibles': stock - int(nueva_cantidad)}
         except Exception as ex:
             db_connection.rollback()
             raise ValueError(f"Error al agregar producto al carrito: {ex}")
@@ -0,0 +1,110 @@
+from models.EscuchaCambios import EscuchaCambios
+from models.TTLCache import TTLCache
+
+
+class CatalogoCache(EscuchaCambios):
+    """Caché del catálogo compartida por las peticiones de un worker.
+
+    Cada cambio del catálogo incrementa `catalogo_version.version` y emite un
+    NOTIFY en el mismo commit (ver `registrar_cambio`). Un hilo por proceso
+    hace LISTEN y, al recibir la nueva versión, deja obsoletas las entradas de
+    todos los workers. La versión sirve también como ETag.
+
+    Si el hilo de escucha pierde la conexión se vacía la caché y, hasta que
+    vuelve, las entradas caducan tras `ttl_sin_listener` segundos.
+    """
+
+    CANAL = 'catalogo_cambios'
+    NOMBRE = 'catalogo'
+
+    def __init__(self, dsn=None, ttl=300.0, ttl_sin_listener=5.0, maxsize=256):
+        super().__init__(dsn)
+        self.ttl = ttl
+        self.ttl_sin_listener = ttl_sin_listener
+        self._entradas = TTLCache(maxsize=maxsize, ttl=ttl, nombre='catalogo')   # clave -> (version, valor)
+        self._version = 0
+
+    def configurar(self, dsn, ttl=None, ttl_sin_listener=None):
+        self.dsn = dsn
+        if ttl is not None:
+            self.ttl = self._entradas.ttl = ttl
+        if ttl_sin_listener is not None:
+            self.ttl_sin_listener = ttl_sin_listener
+
+    # ------------------------------------------------------------------ #
+    # Lectura
+    # ------------------------------------------------------------------ #
+    def obtener(self, db_connection, clave, cargar):
+        """Devuelve (version, valor) para `clave`, llamando a `cargar(db_connection)` si hace falta."""
+        self._asegurar_listener()
+        entrada = self._entradas.get(clave)
+        if entrada is not None and entrada[0] >= self._version:
+            return entrada
+
+        version = self.leer_version(db_connection)
+        valor = cargar(db_connection)
+        self._actualizar_version(version)
+        ttl = self.ttl if self._listener_ok else self.ttl_sin_listener
+        self._entradas.set(clave, (version, valor), ttl=ttl)
+        return version, valor
+
+    def leer_version(self, db_connection):
+        with db_connection.cursor() as cursor:
+            cursor.execute("SELECT version FROM catalogo_version")
+            row = cursor.fetchone()
+        return int(row[0]) if row else 0
+
+    @property
+    def version(self):
+        return self._version
+
+    def stats(self):
+        data = self._entradas.stats()
+        data.update({'version': self._version, 'listener': self._listener_ok})
+        return data
+
+    # ------------------------------------------------------------------ #
+    # Invalidación
+    # ------------------------------------------------------------------ #
+    @classmethod
+    def registrar_cambio(cls, cursor):
+        """Incrementa la versión y emite el NOTIFY dentro de la transacción del llamador.
+
+        El aviso solo llega a los demás workers cuando la transacción hace commit.
+        """
+        cursor.execute(f"""
+            WITH v AS (
+                UPDATE catalogo_version SET version = version + 1 RETURNING version
+            )
+            SELECT version, pg_notify('{cls.CANAL}', version::text) FROM v
+        """)
+        row = cursor.fetchone()
+        return int(row[0]) if row else None
+
+    def invalidar(self, version=None):
+        """Deja obsoletas las entradas de este worker (tras el commit del cambio)."""
+        if version is None:
+            self._entradas.clear()
+        else:
+            self._actualizar_version(version)
+
+    def _actualizar_version(self, version):
+        with self._lock:
+            if version > self._version:
+                self._version = version
+
+    # ------------------------------------------------------------------ #
+    # Avisos del hilo de escucha (ver EscuchaCambios)
+    # ------------------------------------------------------------------ #
+    def _al_reconectar(self):
+        self._entradas.clear()
+
+    def _al_desconectar(self):
+        # Las entradas guardadas con el TTL largo ya no recibirían los avisos
+        self._entradas.clear()
+
+    def _al_notificar(self, payload):
+        try:
+            self._actualizar_version(int(payload))
+        except (TypeError, ValueError):
+            self._entradas.clear()
@@ -0,0 +1,193 @@
+import threading
+import time
+
+import psycopg2
+from psycopg2 import extensions
+
+
+class PoolTimeout(psycopg2.OperationalError):
+    """Se lanza cuando no se obtiene una conexión libre dentro del tiempo de espera."""
+
+
+class ConnectionPool:
+    """Pool de conexiones PostgreSQL para un proceso (un worker de gunicorn).
+
+    - Mantiene entre `min_size` y `max_size` conexiones abiertas.
+    - Al prestar una conexión comprueba que siga viva (`SELECT 1` si lleva
+      más de `health_check_interval` segundos sin usarse).
+    - Descarta las conexiones que superan `max_lifetime` segundos.
+    - Si todas están ocupadas espera hasta `timeout` segundos y luego lanza PoolTimeout.
+    """
+
+    def __init__(self, dsn, min_size=1, max_size=10, timeout=10.0,
+                 max_lifetime=1800.0, health_check_interval=30.0, **connect_kwargs):
+        if min_size < 0 or max_size < 1 or min_size > max_size:
+            raise ValueError("Tamaño de pool inválido")
+        self.dsn = dsn
+        self.min_size = min_size
+        self.max_size = max_size
+        self.timeout = timeout
+        self.max_lifetime = max_lifetime
+        self.health_check_interval = health_check_interval
+        self.connect_kwargs = connect_kwargs
+
+        self._lock = threading.Condition()
+        self._idle = []          # [(conexion, creada_en, devuelta_en)]
+        self._created_at = {}    # id(conexion) -> instante de creación
+        self._in_use = 0
+        self._waiting = 0
+        self._closed = False
+
+        self._stats = {
+            'checkouts': 0,
+            'timeouts': 0,
+            'created': 0,
+            'discarded': 0,
+            'failed_health_checks': 0,
+            'wait_time_total': 0.0,
+            'wait_time_max': 0.0,
+        }
+
+        for _ in range(min_size):
+            conn = self._connect()
+            self._idle.append((conn, self._created_at[id(conn)], time.monotonic()))
+
+    # ------------------------------------------------------------------ #
+    # API pública
+    # ------------------------------------------------------------------ #
+    def getconn(self):
+        """Presta una conexión sana. Bloquea hasta `timeout` si el pool está lleno."""
+        start = time.monotonic()
+        deadline = start + self.timeout
+        with self._lock:
+            while True:
+                if self._closed:
+                    raise psycopg2.InterfaceError("El pool está cerrado")
+                if self._idle:
+                    conn, created_at, returned_at = self._idle.pop()
+                    self._in_use += 1
+                    break
+                if self._size() < self.max_size:
+                    # Reservamos el hueco antes de conectar fuera del lock
+                    self._in_use += 1
+                    conn = None
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._stats['timeouts'] += 1
+                    raise PoolTimeout(
+                        f"No hay conexiones libres tras {self.timeout:.1f}s "
+                        f"(max_size={self.max_size})"
+                    )
+                self._waiting += 1
+                try:
+                    self._lock.wait(remaining)
+                finally:
+                    self._waiting -= 1
+
+        try:
+            if conn is None:
+                conn = self._connect()
+            elif not self._is_usable(conn, created_at, returned_at):
+                self._discard(conn)
+                conn = self._connect()
+        except Exception:
+            with self._lock:
+                self._in_use -= 1
+                self._lock.notify()
+            raise
+
+        waited = time.monotonic() - start
+        with self._lock:
+            self._stats['checkouts'] += 1
+            self._stats['wait_time_total'] += waited
+            self._stats['wait_time_max'] = max(self._stats['wait_time_max'], waited)
+        return conn
+
+    def putconn(self, conn, close=False):
+        """Devuelve una conexión al pool, deshaciendo cualquier transacción abierta."""
+        reusable = not close and not conn.closed and not self._closed
+        if reusable:
+            try:
+                if conn.get_transaction_status() != extensions.TRANSACTION_STATUS_IDLE:
+                    conn.rollback()
+            except psycopg2.Error:
+                reusable = False
+
+        created_at = self._created_at.get(id(conn), 0.0)
+        if reusable and self.max_lifetime and time.monotonic() - created_at > self.max_lifetime:
+            reusable = False
+
+        with self._lock:
+            self._in_use -= 1
+            if reusable:
+                self._idle.append((conn, created_at, time.monotonic()))
+            self._lock.notify()
+
+        if not reusable:
+            self._discard(conn)
+
+    def closeall(self):
+        """Cierra todas las conexiones libres y rechaza nuevos préstamos."""
+        with self._lock:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._lock.notify_all()
+        for conn, _, _ in idle:
+            self._discard(conn)
+
+    def stats(self):
+        """Devuelve un resumen del estado del pool para dimensionarlo."""
+        with self._lock:
+            data = dict(self._stats)
+            data.update({
+                'min_size': self.min_size,
+                'max_size': self.max_size,
+                'size': self._size(),
+                'idle': len(self._idle),
+                'in_use': self._in_use,
+                'waiting': self._waiting,
+            })
+        checkouts = data['checkouts']
+        data['wait_time_avg'] = data['wait_time_total'] / checkouts if checkouts else 0.0
+        return data
+
+    # ------------------------------------------------------------------ #
+    # Auxiliares
+    # ------------------------------------------------------------------ #
+    def _size(self):
+        return len(self._idle) + self._in_use
+
+    def _connect(self):
+        conn = psycopg2.connect(self.dsn, **self.connect_kwargs)
+        with self._lock:
+            self._created_at[id(conn)] = time.monotonic()
+            self._stats['created'] += 1
+        return conn
+
+    def _discard(self, conn):
+        with self._lock:
+            self._created_at.pop(id(conn), None)
+            self._stats['discarded'] += 1
+        try:
+            conn.close()
+        except psycopg2.Error:
+            pass
+
+    def _is_usable(self, conn, created_at, returned_at):
+        if conn.closed:
+            return False
+        now = time.monotonic()
+        if self.max_lifetime and now - created_at > self.max_lifetime:
+            return False
+        if now - returned_at < self.health_check_interval:
+            return True
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            with self._lock:
+                self._stats['failed_health_checks'] += 1
+            return False
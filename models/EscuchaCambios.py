@@ -0,0 +1,94 @@
+import logging
+import os
+import select
+import threading
+import time
+
+import psycopg2
+from psycopg2.extensions import ISOLATION_LEVEL_AUTOCOMMIT
+
+logger = logging.getLogger(__name__)
+
+
+class EscuchaCambios:
+    """Base de las cachés por worker que se invalidan con LISTEN/NOTIFY.
+
+    Cada proceso arranca un hilo que hace LISTEN en `CANAL` con una conexión
+    propia en autocommit y llama a `_al_notificar(payload)` por cada aviso. Al
+    conectar y al perder la conexión se llama a `_al_reconectar` y a
+    `_al_desconectar`; las subclases vacían ahí su caché, porque los avisos de
+    ese intervalo se pierden. `_listener_ok` indica si el hilo está escuchando.
+
+    La conexión se verifica con `SELECT 1` cada `INTERVALO_VERIFICACION`
+    segundos sin avisos (y con keepalives TCP), así una caída sin aviso se
+    detecta en ese plazo.
+    """
+
+    CANAL = None
+    NOMBRE = None       # nombre del hilo y de los mensajes de log
+    INTERVALO_VERIFICACION = 10
+    ESPERA_MAXIMA = 60
+
+    def __init__(self, dsn=None):
+        self.dsn = dsn
+        self._listener_ok = False
+        self._listener_pid = None
+        self._lock = threading.Lock()
+
+    def _al_notificar(self, payload):
+        raise NotImplementedError
+
+    def _al_reconectar(self):
+        pass
+
+    def _al_desconectar(self):
+        pass
+
+    def _asegurar_listener(self):
+        """Arranca el hilo de escucha en este proceso (una vez por pid: gunicorn hace fork)."""
+        pid = os.getpid()
+        if not self.dsn or self._listener_pid == pid:
+            return
+        with self._lock:
+            if self._listener_pid == pid:
+                return
+            self._listener_pid = pid
+            self._listener_ok = False
+        hilo = threading.Thread(target=self._escuchar, name=f'{self.NOMBRE}-listener', daemon=True)
+        hilo.start()
+
+    def _escuchar(self):
+        espera = 1
+        while True:
+            conn = None
+            try:
+                conn = psycopg2.connect(self.dsn, keepalives=1,
+                                        keepalives_idle=self.INTERVALO_VERIFICACION)
+                conn.set_isolation_level(ISOLATION_LEVEL_AUTOCOMMIT)
+                with conn.cursor() as cursor:
+                    cursor.execute(f"LISTEN {self.CANAL}")
+                # Pudo haber cambios mientras no escuchábamos
+                self._al_reconectar()
+                self._listener_ok = True
+                espera = 1
+                while True:
+                    if select.select([conn], [], [], self.INTERVALO_VERIFICACION) == ([], [], []):
+                        with conn.cursor() as cursor:
+                            cursor.execute("SELECT 1")
+                        continue
+                    conn.poll()
+                    while conn.notifies:
+                        aviso = conn.notifies.pop(0)
+                        self._al_notificar(aviso.payload)
+            except Exception as ex:
+                if self._listener_ok:
+                    self._listener_ok = False
+                    self._al_desconectar()
+                logger.warning(f"Listener de {self.NOMBRE} desconectado: {ex}")
+                if conn is not None:
+                    try:
+                        conn.close()
+                    except Exception:
+                        pass
+                time.sleep(espera)
+                espera = min(espera * 2, self.ESPERA_MAXIMA)
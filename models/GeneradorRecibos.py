@@ -0,0 +1,413 @@
+import io
+import logging
+import multiprocessing
+import os
+import threading
+import time
+import hashlib
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+from xml.sax.saxutils import escape
+
+from reportlab.lib import colors
+from reportlab.lib.pagesizes import letter
+from reportlab.lib.styles import ParagraphStyle
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.platypus import LongTable, Paragraph, SimpleDocTemplate, Spacer, TableStyle
+
+from models.Metricas import RECIBO_RENDER_SEGUNDOS
+from models.TTLCache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+def normalizar_item(item):
+    """Normaliza un item retornando dict con claves: id, nombre, precio, cantidad."""
+    if isinstance(item, dict):
+        return {
+            'id': item.get('id') or item.get('producto_id') or item.get('product_id'),
+            'nombre': item.get('nombre') or item.get('titulo') or item.get('name') or '',
+            'precio': float(item.get('precio') or item.get('price') or 0),
+            'cantidad': int(item.get('cantidad') or item.get('qty') or item.get('quantity') or 1)
+        }
+
+    # Intentar atributos del objeto
+    try:
+        pid = getattr(item, 'id', None) or getattr(item, 'producto_id', None) or getattr(item, 'product_id', None)
+        nombre = getattr(item, 'nombre', None) or getattr(item, 'titulo', None) or getattr(item, 'name', None) or ''
+        precio = getattr(item, 'precio', None) or getattr(item, 'price', None) or 0
+        cantidad = getattr(item, 'cantidad', None) or getattr(item, 'qty', None) or getattr(item, 'quantity', None) or 1
+        return {'id': pid, 'nombre': nombre, 'precio': float(precio), 'cantidad': int(cantidad)}
+    except Exception:
+        # Fallback: intentar como secuencia (tupla/lista)
+        try:
+            pid = item[0]; nombre = item[1]; precio = float(item[2]); cantidad = int(item[3])
+            return {'id': pid, 'nombre': nombre, 'precio': precio, 'cantidad': cantidad}
+        except Exception:
+            return {'id': None, 'nombre': str(item), 'precio': 0.0, 'cantidad': 1}
+
+
+def agrupar_items(items_carrito):
+    """Agrupa items por id y suma cantidades. Devuelve dict de agregados."""
+    agregados = {}
+    if not items_carrito:
+        return agregados
+
+    for item in items_carrito:
+        it = normalizar_item(item)
+        pid = it['id']
+        precio = float(it['precio'])
+        cantidad = int(it['cantidad'])
+        nombre = it['nombre']
+
+        if pid in agregados:
+            agregados[pid]['cantidad'] += cantidad
+            agregados[pid]['precio'] = precio  # conservar último precio conocido
+        else:
+            agregados[pid] = {'id': pid, 'nombre': nombre, 'precio': precio, 'cantidad': cantidad}
+
+    return agregados
+
+
+# Filas por tabla: ReportLab parte una tabla larga copiando y volviendo a medir
+# todas las filas restantes en cada salto de página (tiempo cuadrático). Con
+# tablas cortas encadenadas el costo crece lineal con la cantidad de líneas.
+FILAS_POR_BLOQUE = 100
+COLUMNAS = ["Producto", "Cantidad", "Precio Unit.", "Subtotal"]
+ANCHOS_COLUMNAS = [240, 80, 100, 100]
+MARGEN_IZQUIERDO = 40
+MARGEN_SUPERIOR = 50
+MARGEN_INFERIOR = 80
+ALTO_ENCABEZADO = 22
+COLOR_ENCABEZADO = colors.HexColor('#4a5568')
+
+_fuentes = None
+_fuentes_lock = threading.Lock()
+
+
+def _registrar_fuentes():
+    """Registra las fuentes del recibo una sola vez por proceso y devuelve (normal, negrita).
+
+    Por defecto se usa Helvetica. Con RECIBOS_FUENTE_TTF (y opcionalmente
+    RECIBOS_FUENTE_TTF_NEGRITA) se registra una fuente TrueType.
+    """
+    global _fuentes
+    if _fuentes is None:
+        with _fuentes_lock:
+            if _fuentes is None:
+                ruta = os.environ.get('RECIBOS_FUENTE_TTF')
+                if ruta:
+                    pdfmetrics.registerFont(TTFont('Recibo', ruta))
+                    pdfmetrics.registerFont(TTFont('Recibo-Negrita',
+                                                   os.environ.get('RECIBOS_FUENTE_TTF_NEGRITA') or ruta))
+                    _fuentes = ('Recibo', 'Recibo-Negrita')
+                else:
+                    _fuentes = ('Helvetica', 'Helvetica-Bold')
+    return _fuentes
+
+
+def _estilo_tabla(normal, negrita, con_encabezado, con_total):
+    comandos = [
+        ('FONTNAME', (0, 0), (-1, -1), normal),
+        ('ALIGN', (1, 0), (-1, -1), 'CENTER'),
+        ('GRID', (0, 0), (-1, -1), 0.5, colors.grey),
+    ]
+    if con_encabezado:
+        comandos += [
+            ('BACKGROUND', (0, 0), (-1, 0), COLOR_ENCABEZADO),
+            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+            ('ALIGN', (0, 0), (-1, 0), 'LEFT'),
+            ('FONTNAME', (0, 0), (-1, 0), negrita),
+            ('FONTSIZE', (0, 0), (-1, 0), 11),
+            ('BOTTOMPADDING', (0, 0), (-1, 0), 8),
+        ]
+    if con_total:
+        comandos += [
+            ('BACKGROUND', (0, -1), (-1, -1), colors.HexColor('#f7fafc')),
+            ('FONTNAME', (0, -1), (-1, -1), negrita),
+        ]
+    return TableStyle(comandos)
+
+
+@RECIBO_RENDER_SEGUNDOS.time()
+def renderizar_recibo(items, cliente, fecha=None, referencia=None):
+    """Arma el recibo como documento de flowables en memoria y devuelve los bytes del PDF.
+
+    `items` son dicts normalizados y `cliente` un dict con id, nombre y correo:
+    solo datos simples, para poder ejecutarse en otro proceso. `referencia`
+    (p. ej. el número de pedido) se imprime al pie de cada página.
+
+    Las líneas se reparten en tablas de FILAS_POR_BLOQUE filas que fluyen de
+    página en página; a partir de la segunda página el encabezado de columnas
+    lo dibuja la plantilla de página, así se repite aunque una tabla quede
+    partida entre dos páginas.
+    """
+    fecha = fecha or datetime.now()
+    referencia = referencia or fecha.strftime('%Y%m%d_%H-%M-%S')
+    normal, negrita = _registrar_fuentes()
+    width, height = letter
+
+    estilo_titulo = ParagraphStyle('titulo', fontName=negrita, fontSize=18, leading=22, spaceAfter=10)
+    estilo_dato = ParagraphStyle('dato', fontName=normal, fontSize=11, leading=20)
+    story = [
+        Paragraph("Recibo de Compra", estilo_titulo),
+        Paragraph(f"Cliente: {escape(str(cliente.get('nombre', '')))}", estilo_dato),
+        Paragraph(f"Correo: {escape(str(cliente.get('correo', '')))}", estilo_dato),
+        Paragraph(f"Fecha: {fecha.strftime('%d/%m/%Y %H:%M:%S')}", estilo_dato),
+        Spacer(1, 20),
+    ]
+
+    filas = []
+    total = 0.0
+    for agg in agrupar_items(items).values():
+        precio = float(agg.get('precio', 0))
+        cantidad = int(agg.get('cantidad', 0))
+        subtotal = precio * cantidad
+        total += subtotal
+        filas.append([agg.get('nombre', ''), str(cantidad), f"${precio:.2f}", f"${subtotal:.2f}"])
+    filas.append(["", "", "Total:", f"${total:.2f}"])
+
+    for inicio in range(0, len(filas), FILAS_POR_BLOQUE):
+        bloque = filas[inicio:inicio + FILAS_POR_BLOQUE]
+        primero = inicio == 0
+        ultimo = inicio + FILAS_POR_BLOQUE >= len(filas)
+        if primero:
+            bloque = [COLUMNAS] + bloque
+        # Sin repeatRows: en las páginas siguientes el encabezado lo dibuja solo la plantilla
+        tabla = LongTable(bloque, colWidths=ANCHOS_COLUMNAS, repeatRows=0,
+                          hAlign='LEFT', style=_estilo_tabla(normal, negrita, primero, ultimo))
+        story.append(tabla)
+
+    def _pie(c, doc):
+        c.saveState()
+        c.setFont(normal, 10)
+        c.drawString(50, 60, "Gracias por su compra!")
+        c.drawString(50, 45, "Este documento sirve como comprobante de pago.")
+        c.drawRightString(width - 50, 45, f"Recibo: {referencia} - Página {doc.page}")
+        c.restoreState()
+
+    def _pie_y_encabezado(c, doc):
+        _pie(c, doc)
+        # Encabezado de columnas alineado con las tablas (margen + relleno del marco)
+        c.saveState()
+        x = MARGEN_IZQUIERDO + 6
+        y = height - MARGEN_SUPERIOR - ALTO_ENCABEZADO
+        c.setFillColor(COLOR_ENCABEZADO)
+        c.rect(x, y, sum(ANCHOS_COLUMNAS), ALTO_ENCABEZADO, stroke=0, fill=1)
+        c.setFillColor(colors.whitesmoke)
+        c.setFont(negrita, 11)
+        for titulo, ancho in zip(COLUMNAS, ANCHOS_COLUMNAS):
+            c.drawString(x + 6, y + 7, titulo)
+            x += ancho
+        c.restoreState()
+
+    buffer = io.BytesIO()
+    doc = SimpleDocTemplate(
+        buffer, pagesize=letter,
+        leftMargin=MARGEN_IZQUIERDO, rightMargin=MARGEN_IZQUIERDO,
+        topMargin=MARGEN_SUPERIOR + ALTO_ENCABEZADO, bottomMargin=MARGEN_INFERIOR,
+        title=f"Recibo {referencia}"
+    )
+    doc.build(story, onFirstPage=_pie, onLaterPages=_pie_y_encabezado)
+    return buffer.getvalue()
+
+
+def _ejecutar_trabajo(almacen, trabajo, nombre, items, cliente, fecha, referencia):
+    """Tarea del pool: genera el PDF y lo guarda en el almacén, o registra el error."""
+    try:
+        almacen.guardar(trabajo, nombre, cliente['id'],
+                        renderizar_recibo(items, cliente, fecha, referencia))
+    except Exception as ex:
+        almacen.marcar_error(trabajo, nombre, str(ex))
+        raise
+
+
+def _purgar(almacen, antes_de):
+    """Tarea del pool: aplica la política de retención del almacén."""
+    return almacen.purgar(antes_de)
+
+
+class GeneradorRecibos:
+    """Genera los recibos PDF de los pedidos y los cachea por pedido y versión.
+
+    La clave de cada recibo es `pedido_<id>_v<version>`: `pedidos.version` sube
+    cada vez que cambian las líneas del pedido, así que una clave nunca queda
+    con contenido viejo y no hace falta invalidar nada.
+
+    Los recibos se dibujan en memoria. Los últimos se guardan en una caché
+    en memoria del worker y, con almacén (ver models/AlmacenRecibos.py),
+    también en disco o en la base de datos. Con almacén, `encolar` genera el
+    recibo en un pool de procesos acotado y cualquier worker de gunicorn puede
+    consultar `estado`. Si el pool está saturado (`max_pendientes`) o no se
+    puede usar, el recibo se genera en el mismo proceso.
+
+    Cada `intervalo_purga` segundos se encola la eliminación de los recibos
+    guardados con más de `retencion_dias` días.
+    """
+
+    def __init__(self, almacen=None, max_workers=2, max_pendientes=32, timeout=120,
+                 retencion_dias=30, intervalo_purga=3600, cache_size=64, cache_ttl=3600):
+        self.almacen = almacen
+        self.max_workers = max_workers
+        self.max_pendientes = max_pendientes
+        self.timeout = timeout
+        self.retencion_dias = retencion_dias
+        self.intervalo_purga = intervalo_purga
+        self._cache = TTLCache(maxsize=cache_size, ttl=cache_ttl, nombre='recibos')
+        self._ultima_purga = 0.0
+        self._executor = None
+        self._executor_pid = None
+        self._pendientes = 0
+        self._generados = 0
+        self._sincronos = 0
+        self._fallidos = 0
+        self._lock = threading.Lock()
+
+    @property
+    def en_memoria(self):
+        return self.almacen is None
+
+    @staticmethod
+    def clave(id_pedido, version):
+        """Devuelve (trabajo, nombre): el nombre del recibo y un hash usado para repartir en carpetas."""
+        nombre = f"pedido_{id_pedido}_v{version}"
+        return hashlib.sha1(nombre.encode()).hexdigest()[:32], nombre
+
+    @staticmethod
+    def _datos(pedido):
+        """Extrae de un pedido (dict) los argumentos de renderizar_recibo."""
+        items = [normalizar_item(item) for item in pedido['items']]
+        cliente = {
+            'id': pedido.get('id_cliente'),
+            'nombre': pedido.get('nombre_cliente') or '',
+            'correo': pedido.get('correo_cliente') or ''
+        }
+        return items, cliente, pedido.get('data_pedido'), f"Pedido #{pedido['id_pedido']}"
+
+    # ------------------------------------------------------------------ #
+    # Lectura (con generación en línea si falta)
+    # ------------------------------------------------------------------ #
+    def obtener(self, pedido):
+        """Devuelve los bytes del recibo de `pedido`, desde la caché o generándolo aquí.
+
+        `pedido` es un dict con id_pedido, version, id_cliente, nombre_cliente,
+        correo_cliente, data_pedido e items (líneas con nombre, precio y cantidad).
+        """
+        trabajo, nombre = self.clave(pedido['id_pedido'], pedido['version'])
+        pdf = self._cache.get(nombre)
+        if pdf is None and self.almacen is not None:
+            pdf = self.almacen.leer(trabajo, nombre)
+        if pdf is None:
+            items, cliente, fecha, referencia = self._datos(pedido)
+            pdf = renderizar_recibo(items, cliente, fecha, referencia)
+            with self._lock:
+                self._sincronos += 1
+            if self.almacen is not None:
+                self.almacen.guardar(trabajo, nombre, cliente['id'], pdf)
+        self._cache.set(nombre, pdf)
+        return pdf
+
+    def estado(self, id_pedido, version):
+        """Devuelve 'listo', 'pendiente', 'error' o None si el recibo no se ha encolado."""
+        trabajo, nombre = self.clave(id_pedido, version)
+        if self._cache.get(nombre) is not None:
+            return 'listo'
+        if self.almacen is None:
+            return None
+        estado, creado = self.almacen.estado(trabajo, nombre)
+        # Un trabajo que nunca terminó (proceso reiniciado) se reporta como error
+        if estado == 'pendiente' and time.time() - creado > self.timeout:
+            return 'error'
+        return estado
+
+    # ------------------------------------------------------------------ #
+    # Encolado
+    # ------------------------------------------------------------------ #
+    def encolar(self, pedido):
+        """Encola la generación del recibo de `pedido` en el pool (requiere almacén)."""
+        trabajo, nombre = self.clave(pedido['id_pedido'], pedido['version'])
+        items, cliente, fecha, referencia = self._datos(pedido)
+        argumentos = (self.almacen, trabajo, nombre, items, cliente, fecha, referencia)
+
+        self.almacen.marcar_pendiente(trabajo, nombre, cliente['id'])
+        self._programar_purga()
+
+        if self._reservar():
+            try:
+                futuro = self._obtener_executor().submit(_ejecutar_trabajo, *argumentos)
+                futuro.add_done_callback(self._al_terminar)
+                return
+            except Exception as ex:
+                # Pool roto (p. ej. un proceso murió): se descarta y se genera aquí
+                logger.warning(f"Pool de recibos no disponible, se genera en línea: {ex}")
+                self._liberar()
+                with self._lock:
+                    self._executor = None
+
+        with self._lock:
+            self._sincronos += 1
+        try:
+            _ejecutar_trabajo(*argumentos)
+        except Exception as ex:
+            logger.error(f"Error generando el recibo {nombre}: {ex}")
+
+    def _programar_purga(self):
+        if not self.retencion_dias:
+            return
+        ahora = time.time()
+        with self._lock:
+            if ahora - self._ultima_purga < self.intervalo_purga:
+                return
+            self._ultima_purga = ahora
+        try:
+            self._obtener_executor().submit(_purgar, self.almacen, ahora - self.retencion_dias * 86400)
+        except Exception as ex:
+            logger.warning(f"No se pudo programar la purga de recibos: {ex}")
+
+    def _obtener_executor(self):
+        pid = os.getpid()
+        with self._lock:
+            if self._executor is None or self._executor_pid != pid:
+                # spawn: los procesos hijos no heredan conexiones ni hilos del worker
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.max_workers,
+                    mp_context=multiprocessing.get_context('spawn')
+                )
+                self._executor_pid = pid
+            return self._executor
+
+    def _reservar(self):
+        with self._lock:
+            if self._pendientes >= self.max_pendientes:
+                return False
+            self._pendientes += 1
+            return True
+
+    def _liberar(self):
+        with self._lock:
+            self._pendientes -= 1
+
+    def _al_terminar(self, futuro):
+        self._liberar()
+        ex = futuro.exception()
+        with self._lock:
+            if ex is None:
+                self._generados += 1
+            else:
+                self._fallidos += 1
+        if ex is not None:
+            logger.error(f"Error generando recibo en el pool: {ex}")
+
+    def stats(self):
+        with self._lock:
+            data = {
+                'almacen': type(self.almacen).__name__ if self.almacen else 'memoria',
+                'max_workers': self.max_workers,
+                'pendientes': self._pendientes,
+                'generados': self._generados,
+                'sincronos': self._sincronos,
+                'fallidos': self._fallidos
+            }
+        data['cache'] = self._cache.stats()
+        return data
@@ -0,0 +1,266 @@
+import contextvars
+import logging
+import math
+import os
+import random
+import re
+import sys
+import threading
+import time
+from collections import deque
+from logging.handlers import RotatingFileHandler
+
+from psycopg2 import extensions
+
+# Medición de la petición en curso (una por hilo / contexto)
+_medicion = contextvars.ContextVar('medicion', default=None)
+
+# Consultas lentas: umbral en segundos (None = desactivado) y fracción a la que se le captura EXPLAIN
+_lentas = {'umbral': None, 'muestreo': 0.0}
+logger_lentas = logging.getLogger('consultas_lentas')
+logger_explain = logging.getLogger('consultas_lentas.explain')
+logger_explain.propagate = False   # los planes solo van al archivo
+
+_DIRECTORIO_MODELOS = os.path.dirname(os.path.abspath(__file__))
+_ESCRITURA = re.compile(r'\b(insert|update|delete|merge)\b', re.IGNORECASE)
+
+METRICAS = ('total_ms', 'bd_ms', 'consultas', 'plantillas_ms', 'bytes')
+PERCENTILES = (50, 90, 99)
+
+
+class Medicion:
+    """Acumula lo que cuesta una petición: consultas SQL, tiempo de BD y de plantillas."""
+
+    __slots__ = ('inicio', 'consultas', 'tiempo_bd', 'tiempo_plantillas', '_plantillas')
+
+    def __init__(self):
+        self.inicio = time.perf_counter()
+        self.consultas = 0
+        self.tiempo_bd = 0.0
+        self.tiempo_plantillas = 0.0
+        self._plantillas = []
+
+    def registrar_consulta(self, segundos):
+        self.consultas += 1
+        self.tiempo_bd += segundos
+
+    def inicio_plantilla(self):
+        self._plantillas.append(time.perf_counter())
+
+    def fin_plantilla(self):
+        if self._plantillas:
+            inicio = self._plantillas.pop()
+            # Las plantillas anidadas (include/extends) ya cuentan dentro de la exterior
+            if not self._plantillas:
+                self.tiempo_plantillas += time.perf_counter() - inicio
+
+    def transcurrido(self):
+        return time.perf_counter() - self.inicio
+
+
+def iniciar_medicion():
+    """Empieza a medir la petición actual; devuelve el token para `terminar_medicion`."""
+    return _medicion.set(Medicion())
+
+
+def terminar_medicion(token):
+    _medicion.reset(token)
+
+
+def medicion_actual():
+    return _medicion.get()
+
+
+def configurar_consultas_lentas(umbral_ms, muestreo=0.0, archivo=None,
+                                max_bytes=5 * 1024 * 1024, respaldos=5):
+    """Activa el registro de consultas que tardan al menos `umbral_ms` (0 lo desactiva).
+
+    A una fracción `muestreo` de las consultas lentas de lectura se le captura
+    `EXPLAIN (ANALYZE, BUFFERS)`. Todo se escribe en `archivo`, que rota al
+    llegar a `max_bytes` y conserva `respaldos` copias.
+    """
+    _lentas['umbral'] = umbral_ms / 1000 if umbral_ms and umbral_ms > 0 else None
+    _lentas['muestreo'] = max(0.0, min(1.0, muestreo))
+    if archivo and _lentas['umbral'] is not None:
+        os.makedirs(os.path.dirname(os.path.abspath(archivo)), exist_ok=True)
+        handler = RotatingFileHandler(archivo, maxBytes=max_bytes, backupCount=respaldos,
+                                      encoding='utf-8', delay=True)
+        handler.setFormatter(logging.Formatter('%(asctime)s [%(process)d] %(message)s'))
+        for logger in (logger_lentas, logger_explain):
+            for anterior in [h for h in logger.handlers if isinstance(h, RotatingFileHandler)]:
+                logger.removeHandler(anterior)
+                anterior.close()
+            logger.addHandler(handler)
+            logger.setLevel(logging.INFO)
+
+
+def _forma_parametros(parametros):
+    """Describe los parámetros por tipo (y largo de las listas), sin sus valores."""
+    def _tipo(valor):
+        if isinstance(valor, (list, tuple)):
+            return f"{type(valor).__name__}[{len(valor)}]"
+        return type(valor).__name__
+
+    if parametros is None:
+        return '()'
+    if isinstance(parametros, dict):
+        return '{' + ', '.join(f"{k}: {_tipo(v)}" for k, v in parametros.items()) + '}'
+    return '(' + ', '.join(_tipo(v) for v in parametros) + ')'
+
+
+def _origen_consulta():
+    """Devuelve el método del modelo que lanzó la consulta (p. ej. 'PedidoModel.buscar_pedidos')."""
+    frame = sys._getframe(1)
+    while frame is not None:
+        codigo = frame.f_code
+        archivo = os.path.abspath(codigo.co_filename)
+        if os.path.dirname(archivo) == _DIRECTORIO_MODELOS and archivo != os.path.abspath(__file__):
+            nombre = getattr(codigo, 'co_qualname', None)
+            if nombre is None:
+                propietario = frame.f_locals.get('cls') or type(frame.f_locals.get('self', None))
+                nombre = f"{getattr(propietario, '__name__', '?')}.{codigo.co_name}"
+            return nombre
+        frame = frame.f_back
+    return 'desconocido'
+
+
+def _texto_consulta(consulta):
+    if isinstance(consulta, bytes):
+        consulta = consulta.decode('utf-8', 'replace')
+    return ' '.join(str(consulta).split())
+
+
+class CursorMedido(extensions.cursor):
+    """Cursor que suma cada sentencia a la medición de la petición en curso.
+
+    Se instala con `cursor_factory=CursorMedido` al crear las conexiones del pool,
+    así los modelos no cambian. Si está activo el registro de consultas lentas
+    (`configurar_consultas_lentas`), también anota las que superan el umbral.
+    """
+
+    def _medir(self, metodo, args, consulta, parametros=None, explicable=False):
+        medicion = _medicion.get()
+        umbral = _lentas['umbral']
+        if medicion is None and umbral is None:
+            return metodo(*args)
+        inicio = time.perf_counter()
+        try:
+            resultado = metodo(*args)
+        finally:
+            duracion = time.perf_counter() - inicio
+            if medicion is not None:
+                medicion.registrar_consulta(duracion)
+        if umbral is not None and duracion >= umbral:
+            self._registrar_lenta(consulta, parametros, duracion, explicable)
+        return resultado
+
+    def _registrar_lenta(self, consulta, parametros, duracion, explicable):
+        origen = _origen_consulta()
+        texto = _texto_consulta(consulta)
+        logger_lentas.warning("Consulta lenta %.1f ms en %s: %s | parámetros %s",
+                              duracion * 1000, origen, texto[:1000], _forma_parametros(parametros))
+        if explicable and random.random() < _lentas['muestreo']:
+            plan = self._explicar()
+            if plan:
+                logger_explain.info("EXPLAIN %s (%.1f ms): %s\n%s", origen, duracion * 1000, texto[:1000], plan)
+
+    def _explicar(self):
+        """Ejecuta EXPLAIN (ANALYZE, BUFFERS) de la última consulta dentro de un SAVEPOINT.
+
+        Solo para lecturas (ANALYZE vuelve a ejecutar la consulta) y dentro de una
+        transacción sana; el SAVEPOINT deja la transacción del llamador como estaba.
+        """
+        conexion = self.connection
+        if (conexion.autocommit or self.query is None
+                or conexion.get_transaction_status() != extensions.TRANSACTION_STATUS_INTRANS):
+            return None
+        consulta = _texto_consulta(self.query)
+        if not re.match(r'(select|with)\b', consulta, re.IGNORECASE) or _ESCRITURA.search(consulta):
+            return None
+        cursor = conexion.cursor(cursor_factory=extensions.cursor)
+        try:
+            cursor.execute("SAVEPOINT explicar_consulta_lenta")
+            try:
+                cursor.execute(b"EXPLAIN (ANALYZE, BUFFERS) " + self.query)
+                return '\n'.join(fila[0] for fila in cursor.fetchall())
+            finally:
+                cursor.execute("ROLLBACK TO SAVEPOINT explicar_consulta_lenta")
+                cursor.execute("RELEASE SAVEPOINT explicar_consulta_lenta")
+        except Exception as ex:
+            logger_lentas.warning("No se pudo capturar EXPLAIN: %s", ex)
+            return None
+        finally:
+            cursor.close()
+
+    def execute(self, query, vars=None):
+        return self._medir(super().execute, (query, vars), query, vars, explicable=True)
+
+    def executemany(self, query, vars_list):
+        return self._medir(super().executemany, (query, vars_list), query)
+
+    def callproc(self, procname, parameters=None):
+        return self._medir(super().callproc, (procname, parameters), procname, parameters)
+
+    def copy_expert(self, sql, file, size=8192):
+        return self._medir(super().copy_expert, (sql, file, size), sql)
+
+
+def _percentil(ordenados, p):
+    """Percentil por rango más cercano sobre una lista ya ordenada."""
+    if not ordenados:
+        return None
+    indice = max(0, math.ceil(p / 100 * len(ordenados)) - 1)
+    return ordenados[indice]
+
+
+class EstadisticasEndpoints:
+    """Percentiles por endpoint de las métricas de cada petición (por worker).
+
+    Guarda las últimas `muestras` observaciones de cada métrica en una ventana
+    deslizante, así la memoria queda acotada y los percentiles reflejan el tráfico reciente.
+    """
+
+    def __init__(self, muestras=1000):
+        self.muestras = muestras
+        self._lock = threading.Lock()
+        self._endpoints = {}
+
+    def registrar(self, endpoint, status, valores):
+        with self._lock:
+            datos = self._endpoints.get(endpoint)
+            if datos is None:
+                datos = self._endpoints[endpoint] = {
+                    'peticiones': 0,
+                    'errores': 0,
+                    'series': {m: deque(maxlen=self.muestras) for m in METRICAS},
+                }
+            datos['peticiones'] += 1
+            if status >= 500:
+                datos['errores'] += 1
+            for metrica, valor in valores.items():
+                if valor is not None:
+                    datos['series'][metrica].append(valor)
+
+    def exportar(self):
+        """Devuelve {endpoint: {'peticiones', 'errores', 'metricas': {metrica: {p50, p90, p99, max, muestras}}}}."""
+        with self._lock:
+            copia = {endpoint: (d['peticiones'], d['errores'],
+                                {m: list(s) for m, s in d['series'].items()})
+                     for endpoint, d in self._endpoints.items()}
+        resultado = {}
+        for endpoint, (peticiones, errores, series) in copia.items():
+            metricas = {}
+            for metrica, valores in series.items():
+                if not valores:
+                    continue
+                ordenados = sorted(valores)
+                resumen = {f'p{p}': round(_percentil(ordenados, p), 3) for p in PERCENTILES}
+                resumen['max'] = round(ordenados[-1], 3)
+                resumen['muestras'] = len(ordenados)
+                metricas[metrica] = resumen
+            resultado[endpoint] = {'peticiones': peticiones, 'errores': errores, 'metricas': metricas}
+        return resultado
+
+    def reiniciar(self):
+        with self._lock:
+            self._endpoints.clear()
@@ -0,0 +1,130 @@
+import inspect
+
+# Las entidades con __slots__ se crean con object.__new__ y se asigna cada slot, sin
+# llamar a __init__ (ver `_cuerpo_slots`). Solo se hace así si el constructor se limita
+# a asignar cada argumento al atributo del mismo nombre (`_constructor_trivial` lo
+# comprueba al armar cada mapeador); si valida, convierte o deriva valores, el mapeador
+# llama al constructor con argumentos por nombre, como con las clases sin slots.
+
+# Funciones fila -> objeto ya construidas, por (destino, columnas, conversiones).
+# Una consulta siempre devuelve las mismas columnas, así que cada forma se arma una
+# sola vez por proceso; después mapear una fila es una llamada sin búsquedas por nombre.
+_MAPEADORES = {}
+
+
+def _columnas(cursor):
+    return tuple(columna[0] for columna in cursor.description)
+
+
+def _construir(destino, columnas, conversiones):
+    for columna in columnas:
+        if not columna.isidentifier():
+            raise ValueError(f"La columna {columna!r} necesita un alias válido para mapearse")
+    if len(set(columnas)) != len(columnas):
+        raise ValueError(f"Columnas repetidas en la consulta: {columnas}")
+    sobrantes = set(conversiones) - set(columnas)
+    if sobrantes:
+        raise ValueError(f"Conversiones para columnas que la consulta no devuelve: {sorted(sobrantes)}")
+    entorno = {'_destino': destino, '_nuevo': object.__new__}
+    valores = []
+    for i, columna in enumerate(columnas):
+        if columna in conversiones:
+            entorno[f'_c{i}'] = conversiones[columna]
+            valores.append(f'_c{i}(fila[{i}])')
+        else:
+            valores.append(f'fila[{i}]')
+
+    slots = _slots(destino) if isinstance(destino, type) else ()
+    if slots and not _constructor_trivial(destino, slots):
+        slots = ()
+    if destino is dict:
+        cuerpo = '    return {' + ', '.join(f'{c!r}: {v}' for c, v in zip(columnas, valores)) + '}'
+    elif slots:
+        cuerpo = _cuerpo_slots(destino, slots, columnas, valores, entorno)
+    else:
+        parametros = inspect.signature(destino).parameters
+        desconocidas = [c for c in columnas if c not in parametros]
+        if desconocidas:
+            raise ValueError(f"{destino.__name__} no acepta las columnas {desconocidas}")
+        cuerpo = '    return _destino(' + ', '.join(f'{c}={v}' for c, v in zip(columnas, valores)) + ')'
+    exec(f'def mapear(fila):\n{cuerpo}\n', entorno)
+    return entorno['mapear']
+
+
+def _slots(clase):
+    return [slot for tipo in reversed(clase.__mro__) for slot in getattr(tipo, '__slots__', ())
+            if not slot.startswith('__')]
+
+
+def _constructor_trivial(clase, slots):
+    """True si __init__ solo asigna cada argumento al slot del mismo nombre.
+
+    Se construye una instancia con un marcador distinto por argumento y se comprueba
+    que cada slot quede con el suyo: cualquier conversión, validación o valor fijo
+    (p. ej. Cliente, que pone rol='cliente') hace que el mapeador use el constructor.
+    """
+    parametros = inspect.signature(clase).parameters
+    if any(p.kind not in (p.POSITIONAL_OR_KEYWORD, p.KEYWORD_ONLY) for p in parametros.values()):
+        return False
+    if set(parametros) != set(slots):
+        return False
+    marcadores = {nombre: object() for nombre in parametros}
+    try:
+        instancia = clase(**marcadores)
+    except Exception:
+        return False
+    return all(getattr(instancia, slot, None) is marcadores[slot] for slot in slots)
+
+
+def _cuerpo_slots(destino, slots, columnas, valores, entorno):
+    """Entidades con __slots__ y constructor trivial: se crean sin pasar por __init__
+    y se asigna cada slot, que es lo más rápido en CPython. Los slots sin columna
+    toman el valor por defecto del constructor.
+    """
+    desconocidas = [c for c in columnas if c not in slots]
+    if desconocidas:
+        raise ValueError(f"{destino.__name__} no tiene los atributos {desconocidas}")
+    parametros = inspect.signature(destino).parameters
+    lineas = ['    obj = _nuevo(_destino)']
+    lineas += [f'    obj.{c} = {v}' for c, v in zip(columnas, valores)]
+    for slot in slots:
+        if slot in columnas:
+            continue
+        parametro = parametros.get(slot)
+        if parametro is None or parametro.default is inspect.Parameter.empty:
+            raise ValueError(f"La consulta no devuelve {slot!r}, que {destino.__name__} necesita")
+        entorno[f'_d_{slot}'] = parametro.default
+        lineas.append(f'    obj.{slot} = _d_{slot}')
+    lineas.append('    return obj')
+    return '\n'.join(lineas)
+
+
+def mapeador(cursor, destino=dict, conversiones=None):
+    """Devuelve la función que convierte una fila de la última consulta del cursor.
+
+    Las columnas se asignan por nombre (usar alias en el SELECT si hace falta): como
+    atributos si `destino` es una entidad con __slots__, como argumentos si es otra
+    clase o función, o como claves si es dict.
+    `conversiones` aplica una función a columnas concretas, p. ej. {'precio': float}.
+    """
+    conversiones = conversiones or {}
+    columnas = _columnas(cursor)
+    clave = (destino, columnas, tuple(sorted(conversiones.items())))
+    mapear = _MAPEADORES.get(clave)
+    if mapear is None:
+        mapear = _MAPEADORES[clave] = _construir(destino, columnas, conversiones)
+    return mapear
+
+
+def mapear_filas(cursor, filas=None, destino=dict, conversiones=None):
+    """Mapea `filas` (por defecto cursor.fetchall()) y devuelve la lista de objetos."""
+    mapear = mapeador(cursor, destino, conversiones)
+    return list(map(mapear, cursor.fetchall() if filas is None else filas))
+
+
+def mapear_fila(cursor, destino=dict, conversiones=None):
+    """Mapea cursor.fetchone(); devuelve None si la consulta no trajo filas."""
+    fila = cursor.fetchone()
+    if fila is None:
+        return None
+    return mapeador(cursor, destino, conversiones)(fila)
@@ -0,0 +1,61 @@
+import os
+
+from prometheus_client import (CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge,
+                               Histogram, generate_latest, multiprocess)
+
+# Con varios workers de gunicorn, PROMETHEUS_MULTIPROC_DIR debe definirse antes de arrancar
+# (ver gunicorn.conf.py): cada proceso escribe sus valores en ese directorio y /metrics los suma.
+
+PETICION_SEGUNDOS = Histogram(
+    'tienda_peticion_segundos', 'Duración de las peticiones por endpoint',
+    ['endpoint', 'metodo'],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+)
+PETICIONES = Counter(
+    'tienda_peticiones', 'Peticiones atendidas por endpoint y código de respuesta',
+    ['endpoint', 'metodo', 'status']
+)
+DB_POOL_CONEXIONES = Gauge(
+    'tienda_db_pool_conexiones', 'Conexiones de los pools por estado (en_uso, libres, esperando)',
+    ['estado'], multiprocess_mode='livesum'
+)
+DB_POOL_ESPERA_SEGUNDOS = Histogram(
+    'tienda_db_pool_espera_segundos', 'Espera para obtener una conexión del pool',
+    buckets=(0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 10)
+)
+DB_LECTURAS = Counter(
+    'tienda_db_lecturas', 'Lecturas de solo lectura por destino (replica, primaria, respaldo)',
+    ['destino']
+)
+CACHE_CONSULTAS = Counter(
+    'tienda_cache_consultas', 'Consultas a las cachés en memoria por resultado (acierto, fallo)',
+    ['cache', 'resultado']
+)
+CARRITO_AGREGADOS = Counter('tienda_carrito_agregados', 'Productos agregados al carrito')
+CHECKOUTS = Counter('tienda_checkouts', 'Checkouts por resultado (ok, sin_stock, vacio, error)', ['resultado'])
+RECIBO_RENDER_SEGUNDOS = Histogram(
+    'tienda_recibo_render_segundos', 'Duración del renderizado de un recibo PDF',
+    buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+)
+LOGIN_HASH_SEGUNDOS = Histogram(
+    'tienda_login_hash_segundos', 'Duración de la verificación del hash de contraseña en el login',
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2)
+)
+
+
+def multiproceso():
+    return bool(os.environ.get('PROMETHEUS_MULTIPROC_DIR'))
+
+
+def exponer():
+    """Devuelve (cuerpo, content_type) en formato de texto de Prometheus.
+
+    En modo multiproceso suma los valores de todos los procesos (workers y pool de recibos).
+    """
+    if multiproceso():
+        registro = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registro)
+    else:
+        registro = REGISTRY
+    return generate_latest(registro), CONTENT_TYPE_LATEST
+
@@ -0,0 +1,229 @@
+import hashlib
+import os
+import re
+
+import psycopg2
+
+# Las migraciones son los archivos NNN_nombre.sql de este directorio, en orden de versión.
+# Cada una trae su propio BEGIN/COMMIT y debe ser idempotente: se registra en
+# schema_migrations después de ejecutarse, así que si el proceso muere entre ambos
+# pasos se vuelve a aplicar en el siguiente despliegue.
+DIRECTORIO_MIGRACIONES = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'migrations'
+)
+_ARCHIVO_MIGRACION = re.compile(r'^(\d+)_(\w+)\.sql$')
+
+# Clave de pg_advisory_lock: varias instancias desplegándose a la vez se esperan entre sí
+_LLAVE_BLOQUEO = 0x7469656E6461
+
+# Índices que necesitan las consultas más frecuentes: (tabla, columnas iniciales,
+# predicado del índice parcial o None, único, consulta que lo usa)
+INDICES_ESPERADOS = (
+    ('carrito', ('id_usuario', 'id_producto'), None, True, 'carrito del usuario y upsert al agregar'),
+    ('detalle_pedidos', ('id_pedido',), None, False, 'líneas y totales de un pedido'),
+    ('detalle_pedidos', ('id_producto',), None, False, 'ventas por producto'),
+    ('pedidos', ('data_pedido',), None, False, 'búsqueda de pedidos por fecha'),
+    ('usuarios', ('correo',), None, False, 'login y registro por correo'),
+    ('productos', ('id',), 'activo = true', False, 'catálogo de productos activos'),
+)
+
+
+def listar_migraciones(directorio=DIRECTORIO_MIGRACIONES):
+    """Devuelve las migraciones del directorio ordenadas por versión.
+
+    Cada una es un dict con version, nombre, ruta y checksum (sha256 del archivo).
+    """
+    migraciones = []
+    for archivo in os.listdir(directorio):
+        coincidencia = _ARCHIVO_MIGRACION.match(archivo)
+        if not coincidencia:
+            continue
+        ruta = os.path.join(directorio, archivo)
+        with open(ruta, 'rb') as f:
+            checksum = hashlib.sha256(f.read()).hexdigest()
+        migraciones.append({
+            'version': int(coincidencia.group(1)),
+            'nombre': coincidencia.group(2),
+            'ruta': ruta,
+            'checksum': checksum,
+        })
+    migraciones.sort(key=lambda m: m['version'])
+    versiones = [m['version'] for m in migraciones]
+    repetidas = sorted({v for v in versiones if versiones.count(v) > 1})
+    if repetidas:
+        raise ValueError(f"Hay migraciones con la misma versión: {repetidas}")
+    return migraciones
+
+
+class Migrador:
+    """Aplica las migraciones pendientes y verifica el esquema de una base.
+
+    Usa una conexión propia en autocommit (no la del pool): las migraciones
+    manejan su propia transacción.
+    """
+
+    def __init__(self, dsn, directorio=DIRECTORIO_MIGRACIONES):
+        self.dsn = dsn
+        self.directorio = directorio
+
+    def _conectar(self):
+        if not self.dsn:
+            raise ValueError("Falta DATABASE_URL para aplicar las migraciones.")
+        conexion = psycopg2.connect(self.dsn)
+        conexion.autocommit = True
+        return conexion
+
+    @staticmethod
+    def _crear_tabla_registro(cursor):
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS schema_migrations (
+                version INTEGER PRIMARY KEY,
+                nombre TEXT NOT NULL,
+                checksum TEXT NOT NULL,
+                aplicada TIMESTAMPTZ NOT NULL DEFAULT NOW()
+            )
+        """)
+
+    @staticmethod
+    def _aplicadas(cursor):
+        """Devuelve {version: checksum} de las migraciones registradas."""
+        cursor.execute("SELECT to_regclass('schema_migrations')")
+        if cursor.fetchone()[0] is None:
+            return {}
+        cursor.execute("SELECT version, checksum FROM schema_migrations")
+        return dict(cursor.fetchall())
+
+    def estado(self):
+        """Devuelve las migraciones pendientes y las aplicadas cuyo archivo cambió después."""
+        migraciones = listar_migraciones(self.directorio)
+        conexion = self._conectar()
+        try:
+            with conexion.cursor() as cursor:
+                aplicadas = self._aplicadas(cursor)
+        except psycopg2.Error as ex:
+            raise ValueError(f"Error al leer el estado de las migraciones: {ex}")
+        finally:
+            conexion.close()
+        return {
+            'pendientes': [m for m in migraciones if m['version'] not in aplicadas],
+            'modificadas': [m for m in migraciones
+                            if m['version'] in aplicadas and aplicadas[m['version']] != m['checksum']],
+        }
+
+    def migrar(self, hasta=None, avisar=None):
+        """Aplica en orden las migraciones pendientes (hasta la versión `hasta`, incluida).
+
+        Devuelve la lista de migraciones aplicadas. `avisar(texto)` recibe el progreso.
+        """
+        avisar = avisar or (lambda texto: None)
+        migraciones = listar_migraciones(self.directorio)
+        aplicadas_ahora = []
+        actual = None
+        conexion = self._conectar()
+        try:
+            with conexion.cursor() as cursor:
+                # El bloqueo es de sesión: se libera al cerrar la conexión, también si algo falla
+                cursor.execute("SELECT pg_advisory_lock(%s)", (_LLAVE_BLOQUEO,))
+                self._crear_tabla_registro(cursor)
+                # Se lee después del bloqueo: otra instancia pudo haber migrado mientras tanto
+                aplicadas = self._aplicadas(cursor)
+                for migracion in migraciones:
+                    if hasta is not None and migracion['version'] > hasta:
+                        break
+                    version = migracion['version']
+                    if version in aplicadas:
+                        if aplicadas[version] != migracion['checksum']:
+                            avisar(f"Aviso: {os.path.basename(migracion['ruta'])} cambió "
+                                   f"después de aplicarse; no se vuelve a ejecutar")
+                        continue
+                    actual = os.path.basename(migracion['ruta'])
+                    avisar(f"Aplicando {actual}")
+                    with open(migracion['ruta'], encoding='utf-8') as f:
+                        cursor.execute(f.read())
+                    for aviso in conexion.notices:
+                        avisar(aviso.strip())
+                    del conexion.notices[:]
+                    cursor.execute("""
+                        INSERT INTO schema_migrations (version, nombre, checksum)
+                        VALUES (%s, %s, %s)
+                    """, (version, migracion['nombre'], migracion['checksum']))
+                    aplicadas_ahora.append(migracion)
+        except psycopg2.Error as ex:
+            raise ValueError(f"Error al aplicar las migraciones{f' ({actual})' if actual else ''}: {ex}")
+        finally:
+            conexion.close()
+        return aplicadas_ahora
+
+    def verificar(self):
+        """Compara la base con las migraciones y los índices esperados.
+
+        Devuelve la lista de problemas encontrados (vacía si todo está en orden).
+        """
+        problemas = []
+        estado = self.estado()
+        for migracion in estado['pendientes']:
+            problemas.append(f"Migración pendiente: {os.path.basename(migracion['ruta'])}")
+        for migracion in estado['modificadas']:
+            problemas.append(f"Migración modificada después de aplicarse: "
+                             f"{os.path.basename(migracion['ruta'])}")
+
+        conexion = self._conectar()
+        try:
+            with conexion.cursor() as cursor:
+                indices = {}
+                for tabla in sorted({esperado[0] for esperado in INDICES_ESPERADOS}):
+                    indices[tabla] = self._indices_de_tabla(cursor, tabla)
+        except psycopg2.Error as ex:
+            raise ValueError(f"Error al leer los índices: {ex}")
+        finally:
+            conexion.close()
+
+        for tabla, columnas, predicado, unico, uso in INDICES_ESPERADOS:
+            descripcion = f"{tabla} ({', '.join(columnas)})" + (f" WHERE {predicado}" if predicado else '')
+            if indices[tabla] is None:
+                problemas.append(f"Falta la tabla {tabla}")
+                continue
+            candidatos = [
+                indice for indice in indices[tabla]
+                if tuple(indice['columnas'][:len(columnas)]) == columnas
+                and _normalizar_predicado(indice['predicado']) == _normalizar_predicado(predicado)
+                and (indice['unico'] or not unico)
+            ]
+            if not candidatos:
+                problemas.append(f"Falta un índice {'único ' if unico else ''}en {descripcion} ({uso})")
+            elif not any(indice['valido'] for indice in candidatos):
+                nombres = ', '.join(indice['nombre'] for indice in candidatos)
+                problemas.append(f"Índice inválido en {descripcion}: {nombres} (hay que recrearlo)")
+        return problemas
+
+    @staticmethod
+    def _indices_de_tabla(cursor, tabla):
+        """Índices b-tree de la tabla, o None si la tabla no existe."""
+        cursor.execute("SELECT to_regclass(%s)::oid", (tabla,))
+        oid = cursor.fetchone()[0]
+        if oid is None:
+            return None
+        cursor.execute("""
+            SELECT c.relname, i.indisunique, i.indisvalid,
+                   pg_get_expr(i.indpred, i.indrelid, true),
+                   ARRAY(SELECT pg_get_indexdef(i.indexrelid, k, true)
+                         FROM generate_series(1, i.indnkeyatts) AS k
+                         ORDER BY k)
+            FROM pg_index i
+            JOIN pg_class c ON c.oid = i.indexrelid
+            JOIN pg_am am ON am.oid = c.relam
+            WHERE i.indrelid = %s AND am.amname = 'btree'
+        """, (oid,))
+        return [{
+            'nombre': nombre,
+            'unico': unico,
+            'valido': valido,
+            'predicado': predicado,
+            'columnas': columnas,
+        } for nombre, unico, valido, predicado, columnas in cursor.fetchall()]
+
+
+def _normalizar_predicado(predicado):
+    if not predicado:
+        return None
+    return re.sub(r'\s+', ' ', predicado.strip('() ').lower())
@@ -0,0 +1,21 @@
+import base64
+import json
+
+
+def encode_cursor(*valores):
+    """Codifica los valores de la última fila de una página en un cursor opaco (keyset)."""
+    normalizados = [v if v is None or isinstance(v, (int, str)) else str(v) for v in valores]
+    data = json.dumps(normalizados, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(data).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor_token, cantidad):
+    """Decodifica un cursor generado por encode_cursor y valida que tenga `cantidad` valores."""
+    try:
+        padded = cursor_token + '=' * (-len(cursor_token) % 4)
+        valores = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+        if not isinstance(valores, list) or len(valores) != cantidad:
+            raise ValueError
+        return valores
+    except Exception:
+        raise ValueError("Cursor de paginación inválido")
@@ -1,81 +1,238 @@
 from models.entities.pedido import Pedido, DetallePedido
+from models.Paginacion import encode_cursor, decode_cursor
+from models.Metricas import CHECKOUTS
+from models.MapeoFilas import mapear_fila, mapear_filas
+from models.CatalogoCache import CatalogoCache
+from models.ProductoModel import ProductoModel
 from datetime import datetime
 
+ESTADOS_PEDIDO = ('pendiente', 'completado')
+
+
+class PedidoModificado(ValueError):
+    """Se lanza cuando la versión enviada no coincide con la del pedido (lo editó otra persona)."""
+
+
 class PedidoModel:
     @classmethod
-    def crear_pedido(cls, conexion, id_cliente, total, items_carrito):
-        """Crea un nuevo pedido en la tabla `pedidos` y sus detalles en `detalle_pedidos`.
-        Firma: crear_pedido(conexion, id_cliente, total, items_carrito)
+    def checkout(cls, conexion, id_cliente):
+        """Convierte el carrito del cliente en un pedido en una sola transacción.
+
+        1. Bloquea las filas del carrito y sus productos (en orden de id, para no
+           provocar interbloqueos con otros checkouts) y valida stock y estado.
+        2. En una sola sentencia inserta la cabecera con su total, copia todas
+           las líneas con el precio vigente y vacía el carrito.
+        El descuento de stock lo hace el trigger de `detalle_pedidos` dentro de
+        la misma transacción, que también avisa a la caché del catálogo (el stock
+        se muestra en las páginas cacheadas).
+
+        Devuelve None si el carrito está vacío, o un dict con id_pedido, data_pedido,
+        version, total e items (id_detalle, id, nombre, precio, cantidad, subtotal).
         """
         try:
             cursor = conexion.cursor()
-
-            # Insertar cabecera del pedido
             cursor.execute("""
-                INSERT INTO pedidos (id_cliente, data_pedido, status)
-                VALUES (%s, %s, %s)
-                RETURNING id_pedido
-            """, (id_cliente, datetime.now(), 'pendiente'))
+                SELECT pr.id, pr.nombre, pr.precio, pr.stock, pr.activo, c.cantidad
+                FROM carrito c
+                JOIN productos pr ON c.id_producto = pr.id
+                WHERE c.id_usuario = %s
+                ORDER BY pr.id
+                FOR UPDATE OF c, pr
+            """, (id_cliente,))
+            filas = cursor.fetchall()
+            if not filas:
+                conexion.rollback()
+                cursor.close()
+                CHECKOUTS.labels(resultado='vacio').inc()
+                return None
 
-            id_pedido = cursor.fetchone()[0]
+            faltantes = [f"{nombre} (disponibles: {stock})"
+                         for _, nombre, _, stock, activo, cantidad in filas
+                         if not activo or cantidad > stock]
+            if faltantes:
+                CHECKOUTS.labels(resultado='sin_stock').inc()
+                raise ValueError("Stock insuficiente para: " + ", ".join(faltantes))
 
-            # Insertar detalles en detalle_pedidos
-            for item in items_carrito:
-                # item debería ser un dict con keys id, cantidad
-                id_producto = item.get('id') if isinstance(item, dict) else getattr(item, 'id', None)
-                cantidad = item.get('cantidad') if isinstance(item, dict) else getattr(item, 'cantidad', 1)
+            total = sum(precio * cantidad for _, _, precio, _, _, cantidad in filas)
 
-                cursor.execute("""
-                    INSERT INTO detalle_pedidos (id_pedido, id_producto, cantidad)
-                    VALUES (%s, %s, %s)
-                """, (id_pedido, id_producto, int(cantidad)))
+            cursor.execute("""
+                WITH cabecera AS (
+                    INSERT INTO pedidos (id_cliente, data_pedido, status, total)
+                    VALUES (%s, %s, 'pendiente', %s)
+                    RETURNING id_pedido, data_pedido, version
+                ), lineas AS (
+                    INSERT INTO detalle_pedidos (id_pedido, id_producto, cantidad, precio_unitario)
+                    SELECT cab.id_pedido, c.id_producto, c.cantidad, pr.precio
+                    FROM cabecera cab
+                    CROSS JOIN carrito c
+                    JOIN productos pr ON c.id_producto = pr.id
+                    WHERE c.id_usuario = %s
+                    ORDER BY c.id_producto
+                    RETURNING id_detalle, id_producto, cantidad, precio_unitario
+                ), vaciado AS (
+                    DELETE FROM carrito WHERE id_usuario = %s
+                )
+                SELECT cab.id_pedido, cab.data_pedido, cab.version,
+                       l.id_detalle, l.id_producto, l.cantidad, l.precio_unitario
+                FROM lineas l
+                CROSS JOIN cabecera cab
+                ORDER BY l.id_producto
+            """, (id_cliente, datetime.now(), total, id_cliente, id_cliente))
+            lineas = cursor.fetchall()
+            # Lo último antes del commit: la fila de catalogo_version queda bloqueada hasta entonces
+            version_catalogo = CatalogoCache.registrar_cambio(cursor)
 
             conexion.commit()
             cursor.close()
-            return id_pedido
+            ProductoModel.catalogo_cache.invalidar(version_catalogo)
+            CHECKOUTS.labels(resultado='ok').inc()
+
+            nombres = {fila[0]: fila[1] for fila in filas}
+            items = [{
+                'id_detalle': id_detalle,
+                'id': id_producto,
+                'nombre': nombres.get(id_producto, ''),
+                'precio': float(precio),
+                'cantidad': cantidad,
+                'subtotal': float(precio * cantidad)
+            } for _, _, _, id_detalle, id_producto, cantidad, precio in lineas]
+
+            id_pedido, data_pedido, version = lineas[0][:3]
+            return {'id_pedido': id_pedido, 'data_pedido': data_pedido, 'version': version,
+                    'total': float(total), 'items': items}
         except Exception as ex:
             conexion.rollback()
-            raise ValueError(f"Error al crear el pedido: {ex}")
+            if 'Stock insuficiente' not in str(ex):
+                CHECKOUTS.labels(resultado='error').inc()
+            raise ValueError(f"Error al procesar el pedido: {ex}")
+
+    @staticmethod
+    def _recalcular_total(cursor, id_pedido):
+        """Recalcula `pedidos.total` desde sus líneas dentro de la transacción del llamador.
+
+        También incrementa `pedidos.version`, que invalida el recibo cacheado.
+        """
+        cursor.execute("""
+            UPDATE pedidos
+            SET total = COALESCE((
+                SELECT SUM(cantidad * precio_unitario)
+                FROM detalle_pedidos
+                WHERE id_pedido = %s
+            ), 0),
+                version = version + 1
+            WHERE id_pedido = %s
+            RETURNING total
+        """, (id_pedido, id_pedido))
+        row = cursor.fetchone()
+        return float(row[0]) if row else 0.0
 
     @classmethod
     def obtener_todos_pedidos(cls, conexion):
-        """Obtiene todos los pedidos con su total calculado a partir de productos."""
+        """Obtiene todos los pedidos con su total almacenado."""
         try:
             cursor = conexion.cursor()
             cursor.execute("""
                 SELECT 
                     p.id_pedido,
                     p.id_cliente,
-                    u.nombre,
-                    u.correo,
+                    u.nombre AS nombre_cliente,
+                    u.correo AS correo_cliente,
                     p.data_pedido,
                     p.status,
-                    COALESCE(SUM(dp.cantidad * pr.precio), 0) as total
+                    p.total
                 FROM pedidos p
                 JOIN usuarios u ON p.id_cliente = u.id
-                LEFT JOIN detalle_pedidos dp ON p.id_pedido = dp.id_pedido
-                LEFT JOIN productos pr ON dp.id_producto = pr.id
-                GROUP BY p.id_pedido, p.id_cliente, u.nombre, u.correo, p.data_pedido, p.status
                 ORDER BY p.data_pedido DESC
             """)
 
-            pedidos = []
-            for row in cursor.fetchall():
-                pedidos.append({
-                    'id_pedido': row[0],
-                    'id_cliente': row[1],
-                    'nombre_cliente': row[2],
-                    'correo_cliente': row[3],
-                    'data_pedido': row[4],
-                    'status': row[5],
-                    'total': float(row[6])
-                })
+            pedidos = mapear_filas(cursor, destino=Pedido, conversiones={'total': float})
 
             cursor.close()
             return pedidos
         except Exception as ex:
             raise ValueError(f"Error al obtener los pedidos: {ex}")
 
+    @classmethod
+    def buscar_pedidos(cls, conexion, filtros=None, limite=50, despues=None):
+        """Busca pedidos con filtros y paginación por clave (fecha, id) descendente.
+
+        filtros admite: q (nombre, correo o #id), cliente, correo, status,
+        desde, hasta (datetime), total_min y total_max.
+        Devuelve (lista de Pedido, siguiente_cursor).
+        """
+        filtros = filtros or {}
+        condiciones = []
+        params = []
+
+        q = (filtros.get('q') or '').strip()
+        if q:
+            patron = f"%{q}%"
+            id_texto = q.lstrip('#')
+            if id_texto.isdigit():
+                condiciones.append("(p.id_pedido = %s OR u.nombre ILIKE %s OR u.correo ILIKE %s)")
+                params.extend([int(id_texto), patron, patron])
+            else:
+                condiciones.append("(u.nombre ILIKE %s OR u.correo ILIKE %s)")
+                params.extend([patron, patron])
+        if filtros.get('cliente'):
+            condiciones.append("u.nombre ILIKE %s")
+            params.append(f"%{filtros['cliente']}%")
+        if filtros.get('correo'):
+            condiciones.append("u.correo ILIKE %s")
+            params.append(f"%{filtros['correo']}%")
+        if filtros.get('status'):
+            condiciones.append("p.status = %s")
+            params.append(filtros['status'])
+        if filtros.get('desde'):
+            condiciones.append("p.data_pedido >= %s")
+            params.append(filtros['desde'])
+        if filtros.get('hasta'):
+            condiciones.append("p.data_pedido < %s")
+            params.append(filtros['hasta'])
+        if filtros.get('total_min') is not None:
+            condiciones.append("p.total >= %s")
+            params.append(filtros['total_min'])
+        if filtros.get('total_max') is not None:
+            condiciones.append("p.total <= %s")
+            params.append(filtros['total_max'])
+        if despues:
+            fecha, ultimo_id = decode_cursor(despues, 2)
+            condiciones.append("(p.data_pedido, p.id_pedido) < (%s, %s)")
+            params.extend([fecha, ultimo_id])
+
+        where = f"WHERE {' AND '.join(condiciones)}" if condiciones else ""
+        params.append(limite + 1)
+        try:
+            cursor = conexion.cursor()
+            cursor.execute(f"""
+                SELECT 
+                    p.id_pedido,
+                    p.id_cliente,
+                    u.nombre AS nombre_cliente,
+                    u.correo AS correo_cliente,
+                    p.data_pedido,
+                    p.status,
+                    p.total
+                FROM pedidos p
+                JOIN usuarios u ON p.id_cliente = u.id
+                {where}
+                ORDER BY p.data_pedido DESC, p.id_pedido DESC
+                LIMIT %s
+            """, params)
+
+            rows = cursor.fetchall()
+            pedidos = mapear_filas(cursor, rows[:limite], destino=Pedido, conversiones={'total': float})
+            cursor.close()
+
+            siguiente = None
+            if len(rows) > limite:
+                ultimo = pedidos[-1]
+                siguiente = encode_cursor(ultimo.data_pedido.isoformat(), ultimo.id_pedido)
+            return pedidos, siguiente
+        except Exception as ex:
+            conexion.rollback()
+            raise ValueError(f"Error al buscar pedidos: {ex}")
+
     @classmethod
     def obtener_detalles_pedido(cls, conexion, id_pedido):
         """Obtiene los detalles de un pedido específico"""
@@ -87,25 +244,16 @@ class PedidoModel:
                     dp.id_pedido,
                     dp.id_producto,
                     dp.cantidad,
-                    pr.precio as precio_unitario,
-                    (dp.cantidad * pr.precio) as subtotal,
-                    pr.nombre as nombre_producto
+                    dp.precio_unitario,
+                    (dp.cantidad * dp.precio_unitario) AS subtotal,
+                    pr.nombre AS nombre_producto
                 FROM detalle_pedidos dp
                 JOIN productos pr ON dp.id_producto = pr.id
                 WHERE dp.id_pedido = %s
             """, (id_pedido,))
 
-            detalles = []
-            for row in cursor.fetchall():
-                detalles.append({
-                    'id_detalle': row[0],
-                    'id_pedido': row[1],
-                    'id_producto': row[2],
-                    'cantidad': row[3],
-                    'precio_unitario': float(row[4]),
-                    'subtotal': float(row[5]),
-                    'nombre_producto': row[6]
-                })
+            detalles = mapear_filas(cursor, destino=DetallePedido,
+                                    conversiones={'precio_unitario': float, 'subtotal': float})
 
             cursor.close()
             return detalles
@@ -126,88 +274,164 @@ class PedidoModel:
                 SELECT 
                     p.id_pedido,
                     p.id_cliente,
-                    u.nombre,
-                    u.correo,
+                    u.nombre AS nombre_cliente,
+                    u.correo AS correo_cliente,
                     p.data_pedido,
                     p.status,
-                    COALESCE(SUM(dp.cantidad * pr.precio), 0) as total
+                    p.total,
+                    p.version
                 FROM pedidos p
                 JOIN usuarios u ON p.id_cliente = u.id
-                LEFT JOIN detalle_pedidos dp ON p.id_pedido = dp.id_pedido
-                LEFT JOIN productos pr ON dp.id_producto = pr.id
                 WHERE p.id_pedido = %s
-                GROUP BY p.id_pedido, p.id_cliente, u.nombre, u.correo, p.data_pedido, p.status
             """, (id_pedido,))
 
-            row = cursor.fetchone()
+            pedido = mapear_fila(cursor, destino=Pedido, conversiones={'total': float})
             cursor.close()
-
-            if not row:
-                return None
-
-            return {
-                'id_pedido': row[0],
-                'id_cliente': row[1],
-                'nombre_cliente': row[2],
-                'correo_cliente': row[3],
-                'data_pedido': row[4],
-                'status': row[5],
-                'total': float(row[6])
-            }
+            return pedido
         except Exception as ex:
             raise ValueError(f"Error al obtener el pedido por ID: {ex}")
 
-    @classmethod
-    def actualizar_detalle(cls, conexion, id_detalle, id_producto, cantidad):
-        """Actualiza un detalle existente (producto y cantidad)."""
-        try:
-            cursor = conexion.cursor()
-            cursor.execute("""
-                UPDATE detalle_pedidos SET id_producto = %s, cantidad = %s WHERE id_detalle = %s
-            """, (id_producto, int(cantidad), id_detalle))
-            conexion.commit()
-            cursor.close()
-            return True
-        except Exception as ex:
-            conexion.rollback()
-            raise ValueError(f"Error al actualizar detalle: {ex}")
+    @staticmethod
+    def _normalizar_cambios(cambios):
+        """Valida el lote de cambios y lo convierte a enteros.
+
+        Devuelve (lineas, eliminar, nuevas, status): `lineas` es {id_detalle: (id_producto, cantidad)}.
+        Una línea existente con cantidad 0 se elimina; una nueva con cantidad 0 se omite.
+        """
+        def _entero(valor, campo):
+            try:
+                return int(valor)
+            except (TypeError, ValueError):
+                raise ValueError(f"'{campo}' debe ser un número entero")
+
+        lineas, eliminar, nuevas = {}, set(), []
+        for item in cambios.get('lineas') or []:
+            if not isinstance(item, dict):
+                raise ValueError("Cada línea debe ser un objeto")
+            id_detalle = _entero(item.get('id_detalle'), 'id_detalle')
+            cantidad = _entero(item.get('cantidad'), 'cantidad')
+            if cantidad < 0:
+                raise ValueError("La cantidad no puede ser negativa")
+            if cantidad == 0:
+                eliminar.add(id_detalle)
+            else:
+                lineas[id_detalle] = (_entero(item.get('id_producto'), 'id_producto'), cantidad)
+        for id_detalle in cambios.get('eliminar') or []:
+            eliminar.add(_entero(id_detalle, 'eliminar'))
+        for item in cambios.get('nuevas') or []:
+            if not isinstance(item, dict):
+                raise ValueError("Cada línea nueva debe ser un objeto")
+            cantidad = _entero(item.get('cantidad', 1), 'cantidad')
+            if cantidad < 0:
+                raise ValueError("La cantidad no puede ser negativa")
+            if cantidad == 0:
+                # Como antes del lote: una fila nueva que quedó en 0 no se agrega
+                continue
+            nuevas.append((_entero(item.get('id_producto'), 'id_producto'), cantidad))
+
+        status = cambios.get('status') or None
+        if status is not None and status not in ESTADOS_PEDIDO:
+            raise ValueError("Estado inválido")
+        for id_detalle in eliminar:
+            lineas.pop(id_detalle, None)
+        return lineas, eliminar, nuevas, status
 
     @classmethod
-    def agregar_detalle(cls, conexion, id_pedido, id_producto, cantidad):
-        """Agrega una nueva fila en detalle_pedidos para un pedido existente."""
+    def aplicar_cambios(cls, conexion, id_pedido, cambios):
+        """Aplica un lote de cambios a un pedido en una sola transacción.
+
+        `cambios` = {'version', 'lineas': [{'id_detalle', 'id_producto', 'cantidad'}],
+        'eliminar': [id_detalle], 'nuevas': [{'id_producto', 'cantidad'}], 'status'}.
+        Se compara con las líneas actuales y solo se escriben las que cambian: un
+        UPDATE, un DELETE y un INSERT como máximo, cada uno sobre todo el lote.
+        Si se envía `version` y el pedido ya cambió, lanza PedidoModificado.
+        Devuelve {'pedido' (Pedido), 'detalles' (lista de DetallePedido),
+        'cambios': {'actualizadas', 'eliminadas', 'agregadas'}}.
+        """
+        lineas, eliminar, nuevas, status = cls._normalizar_cambios(cambios)
         try:
             cursor = conexion.cursor()
-            cursor.execute("""
-                INSERT INTO detalle_pedidos (id_pedido, id_producto, cantidad)
-                VALUES (%s, %s, %s)
-                RETURNING id_detalle
-            """, (id_pedido, id_producto, int(cantidad)))
-            id_detalle = cursor.fetchone()[0]
-            conexion.commit()
+            cursor.execute("SELECT version, status FROM pedidos WHERE id_pedido = %s FOR UPDATE",
+                           (id_pedido,))
+            row = cursor.fetchone()
+            if not row:
+                raise ValueError("El pedido no existe")
+            version_actual, status_actual = row
+            version = cambios.get('version')
+            if version is not None and str(version) != str(version_actual):
+                raise PedidoModificado("El pedido fue modificado por otra persona; recargue e intente de nuevo")
+
+            cursor.execute("SELECT id_detalle, id_producto, cantidad FROM detalle_pedidos WHERE id_pedido = %s",
+                           (id_pedido,))
+            actuales = {r[0]: (r[1], r[2]) for r in cursor.fetchall()}
+            ajenas = (set(lineas) | eliminar) - set(actuales)
+            if ajenas:
+                raise ValueError(f"Las líneas {sorted(ajenas)} no pertenecen al pedido")
+
+            modificadas = [(id_detalle, producto, cantidad)
+                           for id_detalle, (producto, cantidad) in lineas.items()
+                           if actuales[id_detalle] != (producto, cantidad)]
+            resumen = {'actualizadas': len(modificadas), 'eliminadas': len(eliminar), 'agregadas': len(nuevas)}
+
+            if eliminar:
+                cursor.execute("DELETE FROM detalle_pedidos WHERE id_pedido = %s AND id_detalle = ANY(%s)",
+                               (id_pedido, sorted(eliminar)))
+            if modificadas:
+                # Si cambia el producto, la línea toma el precio vigente del nuevo producto
+                cursor.execute("""
+                    UPDATE detalle_pedidos dp
+                    SET id_producto = pr.id,
+                        cantidad = v.cantidad,
+                        precio_unitario = CASE WHEN dp.id_producto = pr.id
+                                               THEN dp.precio_unitario ELSE pr.precio END
+                    FROM unnest(%s::int[], %s::int[], %s::int[]) AS v(id_detalle, id_producto, cantidad)
+                    JOIN productos pr ON pr.id = v.id_producto
+                    WHERE dp.id_detalle = v.id_detalle AND dp.id_pedido = %s
+                """, ([m[0] for m in modificadas], [m[1] for m in modificadas],
+                      [m[2] for m in modificadas], id_pedido))
+                if cursor.rowcount != len(modificadas):
+                    raise ValueError("Alguno de los productos indicados no existe")
+            if nuevas:
+                cursor.execute("""
+                    INSERT INTO detalle_pedidos (id_pedido, id_producto, cantidad, precio_unitario)
+                    SELECT %s, pr.id, v.cantidad, pr.precio
+                    FROM unnest(%s::int[], %s::int[]) WITH ORDINALITY AS v(id_producto, cantidad, orden)
+                    JOIN productos pr ON pr.id = v.id_producto
+                    ORDER BY v.orden
+                """, (id_pedido, [n[0] for n in nuevas], [n[1] for n in nuevas]))
+                if cursor.rowcount != len(nuevas):
+                    raise ValueError("Alguno de los productos indicados no existe")
+
+            if modificadas or eliminar or nuevas:
+                cls._recalcular_total(cursor, id_pedido)
+            # Las líneas nuevas descuentan stock (trigger), que el catálogo cacheado muestra
+            version_catalogo = CatalogoCache.registrar_cambio(cursor) if nuevas else None
+            if status and status != status_actual:
+                cursor.execute("UPDATE pedidos SET status = %s WHERE id_pedido = %s", (status, id_pedido))
             cursor.close()
-            return id_detalle
-        except Exception as ex:
-            conexion.rollback()
-            raise ValueError(f"Error al agregar detalle: {ex}")
 
-    @classmethod
-    def eliminar_detalle(cls, conexion, id_detalle):
-        """Elimina un detalle por su id."""
-        try:
-            cursor = conexion.cursor()
-            cursor.execute("DELETE FROM detalle_pedidos WHERE id_detalle = %s", (id_detalle,))
+            # Estado final leído dentro de la misma transacción
+            resultado = {
+                'pedido': cls.obtener_pedido_por_id(conexion, id_pedido),
+                'detalles': cls.obtener_detalles_pedido(conexion, id_pedido),
+                'cambios': resumen,
+            }
             conexion.commit()
-            cursor.close()
-            return True
+            if version_catalogo is not None:
+                ProductoModel.catalogo_cache.invalidar(version_catalogo)
+            return resultado
+        except PedidoModificado:
+            conexion.rollback()
+            raise
         except Exception as ex:
             conexion.rollback()
-            raise ValueError(f"Error al eliminar detalle: {ex}")
+            raise ValueError(f"Error al aplicar los cambios del pedido: {ex}")
 
     @classmethod
     def actualizar_status(cls, conexion, id_pedido, nuevo_status):
         """Actualiza el estado (status) de un pedido. Valores esperados: 'pendiente' o 'completado'."""
         try:
-            if nuevo_status not in ('pendiente', 'completado'):
+            if nuevo_status not in ESTADOS_PEDIDO:
                 raise ValueError('Estado inválido')
             cursor = conexion.cursor()
             cursor.execute("UPDATE pedidos SET status = %s WHERE id_pedido = %s", (nuevo_status, id_pedido))
@@ -1,10 +1,96 @@
+import csv
+import io
+import json
+import os
+import re
 from models.entities.producto import Producto
+from models.CatalogoCache import CatalogoCache
+from models.Paginacion import encode_cursor, decode_cursor
+from models.MapeoFilas import mapear_fila, mapear_filas
+
+# Ordenamientos del catálogo: nombre -> (columna de orden, dirección)
+ORDENES_CATALOGO = {
+    'nuevos': ('id', 'DESC'),
+    'precio_asc': ('precio', 'ASC'),
+    'precio_desc': ('precio', 'DESC'),
+    'nombre': ('nombre', 'ASC'),
+}
+ORDEN_POR_DEFECTO = 'nuevos'
+
+# Columnas de importación/exportación masiva (la clave natural es el nombre, sin distinguir mayúsculas)
+COLUMNAS_IMPORTACION = ['nombre', 'descripcion', 'categoria', 'imagen', 'precio', 'stock', 'activo']
+FORMATOS_IMPORTACION = ('csv', 'jsonl')
+MAX_ERRORES_REPORTADOS = 1000
+
+# Acciones masivas del panel admin: acción -> (SET, condición para no reescribir filas sin cambios)
+ACCIONES_MASIVAS = {
+    'activar': ("activo = TRUE", "activo IS NOT TRUE"),
+    'desactivar': ("activo = FALSE", "activo IS NOT FALSE"),
+    'ajustar_precio': ("precio = GREATEST(ROUND(precio * (100 + %(valor)s::numeric) / 100, 2), 0.01)", "%(valor)s <> 0"),
+    'fijar_stock': ("stock = %(valor)s", "stock IS DISTINCT FROM %(valor)s"),
+    'cambiar_categoria': ("categoria = %(valor)s", "categoria IS DISTINCT FROM %(valor)s"),
+}
+
+# Mayor id de producto aceptado: productos.id es SERIAL (integer)
+ID_MAXIMO = 2**31 - 1
+
+
+def _leer_filas(origen, formato):
+    """Itera (numero_linea, dict) desde un archivo de texto CSV (con encabezado) o JSONL."""
+    if formato == 'csv':
+        lector = csv.DictReader(origen)
+        for fila in lector:
+            yield lector.line_num, fila
+    else:
+        for numero, linea in enumerate(origen, start=1):
+            if linea.strip():
+                try:
+                    fila = json.loads(linea)
+                except ValueError:
+                    fila = None
+                yield numero, fila if isinstance(fila, dict) else None
+
+
+def _texto(valor):
+    return '' if valor is None else str(valor).strip()
+
+
+def _a_booleano(valor):
+    texto = _texto(valor).lower()
+    if texto in ('', 'true', 't', '1', 'si', 'sí', 'yes'):
+        return True
+    if texto in ('false', 'f', '0', 'no'):
+        return False
+    raise ValueError
+
 
 class ProductoModel:
 
+    @staticmethod
+    def validar_datos(datos):
+        """Reglas de validación de un producto; devuelve la lista de errores (vacía si es válido)."""
+        errores = []
+        if not datos.get('nombre'):
+            errores.append("El nombre es obligatorio.")
+
+        precio = datos.get('precio')
+        if precio is None or precio <= 0:
+            errores.append("El precio debe ser mayor a 0.")
+
+        stock = datos.get('stock')
+        if stock is None or stock < 0:
+            errores.append("El stock no puede ser negativo.")
+
+        return errores
+
+    # Caché del catálogo activo; app.py la configura con DATABASE_URL para el LISTEN
+    catalogo_cache = CatalogoCache(
+        ttl=float(os.environ.get('CATALOGO_CACHE_TTL', 300)),
+        ttl_sin_listener=float(os.environ.get('CATALOGO_CACHE_TTL_SIN_LISTENER', 5))
+    )
+
     @classmethod
     def get_all_products(cls, db_connection):
-        productos = []
         try:
             with db_connection.cursor() as cursor:
                 cursor.execute("""
@@ -14,21 +100,8 @@ class ProductoModel:
                     ORDER BY id ASC
                 """)
 
-                rows = cursor.fetchall()
-
-                for row in rows:
-                    producto = Producto(
-                        id=row[0],
-                        nombre=row[1],
-                        descripcion=row[2],
-                        categoria=row[3],
-                        nombre_columna_imagen=row[4],
-                        precio=row[5],
-                        stock=row[6]
-                    )
-                    # Exponer el estado activo para el panel admin
-                    producto.activo = bool(row[7])
-                    productos.append(producto)
+                # El estado activo se expone para el panel admin
+                productos = mapear_filas(cursor, destino=Producto, conversiones={'activo': bool})
 
             return productos
         except Exception as ex:
@@ -40,7 +113,6 @@ class ProductoModel:
         """
         Obtiene SOLO los productos activos para el catálogo público.
         """
-        productos = []
         try:
             with db_connection.cursor() as cursor:
                 cursor.execute("""
@@ -51,28 +123,116 @@ class ProductoModel:
                     ORDER BY id ASC
                 """)
 
-                rows = cursor.fetchall()
-
-                for row in rows:
-                    producto = Producto(
-                        id=row[0],
-                        nombre=row[1],
-                        descripcion=row[2],
-                        categoria=row[3],
-                        nombre_columna_imagen=row[4],
-                        precio=row[5],
-                        stock=row[6]
-                    )
-                    productos.append(producto)
+                productos = mapear_filas(cursor, destino=Producto)
 
             return productos
         except Exception as ex:
             db_connection.rollback()
             raise ValueError(f"Error al obtener productos activos: {ex}")
 
+    @classmethod
+    def get_active_products_page(cls, db_connection, categoria=None, orden=ORDEN_POR_DEFECTO,
+                                 limite=24, despues=None):
+        """
+        Obtiene una página de productos activos con paginación por clave (keyset).
+
+        `despues` es el cursor opaco devuelto por la página anterior. Devuelve
+        (productos, siguiente_cursor); siguiente_cursor es None en la última página.
+        """
+        columna, direccion = ORDENES_CATALOGO.get(orden, ORDENES_CATALOGO[ORDEN_POR_DEFECTO])
+        comparador = '<' if direccion == 'DESC' else '>'
+        condiciones = ["activo = TRUE"]
+        params = []
+        if categoria:
+            condiciones.append("categoria = %s")
+            params.append(categoria)
+        if despues:
+            valor, ultimo_id = decode_cursor(despues, 2)
+            if columna == 'id':
+                condiciones.append(f"id {comparador} %s")
+                params.append(ultimo_id)
+            else:
+                condiciones.append(f"({columna}, id) {comparador} (%s, %s)")
+                params.extend([valor, ultimo_id])
+        orden_sql = "id DESC" if columna == 'id' else f"{columna} {direccion}, id {direccion}"
+        params.append(limite + 1)
+
+        try:
+            with db_connection.cursor() as cursor:
+                cursor.execute(f"""
+                    SELECT id, nombre, descripcion, categoria,
+                           nombre_columna_imagen, precio, stock
+                    FROM productos
+                    WHERE {' AND '.join(condiciones)}
+                    ORDER BY {orden_sql}
+                    LIMIT %s
+                """, params)
+
+                rows = cursor.fetchall()
+                productos = mapear_filas(cursor, rows[:limite], destino=Producto)
+
+            siguiente = None
+            if len(rows) > limite:
+                ultimo = productos[-1]
+                siguiente = encode_cursor(getattr(ultimo, columna), ultimo.id)
+            return productos, siguiente
+        except Exception as ex:
+            db_connection.rollback()
+            raise ValueError(f"Error al obtener la página del catálogo: {ex}")
+
+    @classmethod
+    def get_catalogo_page(cls, db_connection, categoria=None, orden=ORDEN_POR_DEFECTO,
+                          limite=24, despues=None):
+        """
+        Versión cacheada de get_active_products_page.
+        Devuelve (version, (productos, siguiente_cursor)).
+        """
+        if orden not in ORDENES_CATALOGO:
+            orden = ORDEN_POR_DEFECTO
+        clave = ('pagina', categoria or '', orden, limite, despues or '')
+        return cls.catalogo_cache.obtener(
+            db_connection, clave,
+            lambda conexion: cls.get_active_products_page(conexion, categoria, orden, limite, despues)
+        )
+
+    @classmethod
+    def search(cls, db_connection, texto, pagina=1, limite=20, solo_activos=True):
+        """
+        Búsqueda de texto completo sobre nombre, categoría y descripción, ordenada por relevancia.
+
+        Usa la columna `busqueda` (tsvector con índice GIN) y la configuración
+        `es_unaccent`, así "poster" encuentra "Póster". Cada palabra se busca como
+        prefijo. Devuelve (productos, hay_mas).
+        """
+        terminos = re.findall(r'[^\W_]+', texto or '')[:10]
+        if not terminos:
+            return [], False
+        consulta = ' & '.join(f"{termino}:*" for termino in terminos)
+        pagina = max(int(pagina), 1)
+
+        filtro_activo = "AND p.activo = TRUE" if solo_activos else ""
+        try:
+            with db_connection.cursor() as cursor:
+                cursor.execute(f"""
+                    SELECT p.id, p.nombre, p.descripcion, p.categoria,
+                           p.nombre_columna_imagen, p.precio, p.stock, p.activo
+                    FROM productos p, to_tsquery('es_unaccent', %s) q
+                    WHERE p.busqueda @@ q {filtro_activo}
+                    ORDER BY ts_rank_cd(p.busqueda, q) DESC, p.id
+                    LIMIT %s OFFSET %s
+                """, (consulta, limite + 1, (pagina - 1) * limite))
+
+                rows = cursor.fetchall()
+                productos = mapear_filas(cursor, rows[:limite], destino=Producto,
+                                         conversiones={'activo': bool})
+
+            return productos, len(rows) > limite
+        except Exception as ex:
+            db_connection.rollback()
+            raise ValueError(f"Error al buscar productos: {ex}")
+
     @classmethod
     def get_product_by_id(cls, db_connection, producto_id):
-        producto = None
         try:
             with db_connection.cursor() as cursor:
                 # OJO: Aquí dice 'categoria' pero debería ser 'productos'
@@ -81,18 +241,7 @@ class ProductoModel:
                   FROM productos 
                   WHERE id = %s AND activo = TRUE""", (producto_id,))
 
-                row = cursor.fetchone()
-
-                if row:
-                    producto = Producto(
-                        id=row[0],
-                        nombre=row[1],
-                        descripcion=row[2],
-                        categoria=row[3],
-                        nombre_columna_imagen=row[4],
-                        precio=row[5],
-                        stock=row[6]
-                    )
+                producto = mapear_fila(cursor, destino=Producto)
 
             return producto
         except Exception as ex:
@@ -122,11 +271,13 @@ class ProductoModel:
             
             # 3. Ejecutamos la consulta con los datos.
             cursor.execute(sql_query, datos)
+            version = CatalogoCache.registrar_cambio(cursor)
             
             # 4. Confirmamos y guardamos los cambios en la base de datos. ¡Esto es crucial!
             db_connection.commit()
             
             cursor.close() # Buena práctica cerrar el cursor.
+            cls.catalogo_cache.invalidar(version)
             
             return True # Indicamos que la operación fue un éxito.
             
@@ -153,8 +304,10 @@ class ProductoModel:
                 producto_entity.id
             )
             cursor.execute(sql_query, datos)
+            version = CatalogoCache.registrar_cambio(cursor)
             db_connection.commit()
             cursor.close()
+            cls.catalogo_cache.invalidar(version)
             return True
         except Exception as ex:
             db_connection.rollback()
@@ -170,11 +323,299 @@ class ProductoModel:
             # Cambiamos DELETE por UPDATE
             cursor.execute("UPDATE productos SET activo = FALSE WHERE id = %s", 
                         (producto_id,))
+            version = CatalogoCache.registrar_cambio(cursor)
             db_connection.commit()
             cursor.close()
+            cls.catalogo_cache.invalidar(version)
             return True
         except Exception as ex:
             db_connection.rollback()
             raise ValueError(f"Error al desactivar producto: {ex}")
 
-            
\ No newline at end of file
+    @classmethod
+    def activate_product(cls, db_connection, producto_id):
+        """
+        Vuelve a activar un producto desactivado.
+        """
+        try:
+            cursor = db_connection.cursor()
+            cursor.execute("UPDATE productos SET activo = TRUE WHERE id = %s", (producto_id,))
+            version = CatalogoCache.registrar_cambio(cursor)
+            db_connection.commit()
+            cursor.close()
+            cls.catalogo_cache.invalidar(version)
+            return True
+        except Exception as ex:
+            db_connection.rollback()
+            raise ValueError(f"Error al activar producto: {ex}")
+
+    @staticmethod
+    def validar_accion_masiva(accion, valor):
+        """Valida y convierte el valor de una acción masiva; lanza ValueError si no es válido."""
+        if accion not in ACCIONES_MASIVAS:
+            raise ValueError(f"Acción no soportada: {accion}")
+        if accion == 'ajustar_precio':
+            try:
+                porcentaje = round(float(valor), 2)
+            except (TypeError, ValueError):
+                raise ValueError("El porcentaje debe ser numérico.")
+            if not -100 < porcentaje <= 1000:
+                raise ValueError("El porcentaje debe ser mayor a -100 y como máximo 1000.")
+            return porcentaje
+        if accion == 'fijar_stock':
+            try:
+                stock = int(valor)
+            except (TypeError, ValueError):
+                raise ValueError("El stock debe ser un número entero.")
+            if stock < 0:
+                raise ValueError("El stock no puede ser negativo.")
+            return stock
+        if accion == 'cambiar_categoria':
+            categoria = _texto(valor)
+            if not categoria:
+                raise ValueError("La categoría es obligatoria.")
+            return categoria
+        return None
+
+    @staticmethod
+    def validar_ids(ids):
+        """Convierte una lista de ids de producto (enteros o texto con dígitos) en enteros
+        sin repetir; lanza ValueError con cualquier otro valor."""
+        if not isinstance(ids, (list, tuple)):
+            raise ValueError("Los ids de producto deben enviarse como lista.")
+        validos = set()
+        for valor in ids:
+            if isinstance(valor, bool) or not isinstance(valor, (int, str)):
+                raise ValueError(f"Id de producto inválido: {valor!r}")
+            texto = str(valor).strip()
+            if not (texto.isascii() and texto.isdigit()) or not 0 < int(texto) <= ID_MAXIMO:
+                raise ValueError(f"Id de producto inválido: {valor!r}")
+            validos.add(int(texto))
+        return sorted(validos)
+
+    @classmethod
+    def accion_masiva(cls, db_connection, accion, valor=None, ids=None, categoria=None):
+        """
+        Aplica una acción a varios productos con un único UPDATE.
+        Los productos se eligen por `ids` o por `categoria` (toda la categoría).
+        Acciones: activar, desactivar, ajustar_precio (porcentaje), fijar_stock, cambiar_categoria.
+        Devuelve {'accion', 'seleccionados', 'afectados', 'ids', 'no_encontrados'}: cuántos
+        productos coincidieron, cuántos cambiaron (y sus ids) y los ids pedidos que no existen.
+        """
+        valor = cls.validar_accion_masiva(accion, valor)
+        if ids:
+            ids = cls.validar_ids(ids)
+            filtro = "id = ANY(%(ids)s)"
+        elif _texto(categoria):
+            categoria = _texto(categoria)
+            filtro = "categoria = %(categoria)s"
+        else:
+            raise ValueError("Seleccione productos o una categoría.")
+
+        asignacion, cambia = ACCIONES_MASIVAS[accion]
+        try:
+            cursor = db_connection.cursor()
+            # Los productos que ya tienen el valor no se reescriben, pero cuentan como encontrados
+            cursor.execute(f"""
+                WITH seleccion AS (
+                    SELECT id FROM productos WHERE {filtro}
+                ), cambiados AS (
+                    UPDATE productos SET {asignacion}
+                    WHERE id IN (SELECT id FROM seleccion) AND {cambia}
+                    RETURNING id
+                )
+                SELECT ARRAY(SELECT id FROM seleccion), ARRAY(SELECT id FROM cambiados ORDER BY id)
+            """, {'valor': valor, 'ids': ids, 'categoria': categoria})
+            encontrados, afectados = cursor.fetchone()
+            version = CatalogoCache.registrar_cambio(cursor) if afectados else None
+            db_connection.commit()
+            cursor.close()
+            if version is not None:
+                cls.catalogo_cache.invalidar(version)
+            return {
+                'accion': accion,
+                'seleccionados': len(encontrados),
+                'afectados': len(afectados),
+                'ids': afectados,
+                'no_encontrados': sorted(set(ids) - set(encontrados)) if ids else [],
+            }
+        except Exception as ex:
+            db_connection.rollback()
+            raise ValueError(f"Error en la acción masiva de productos: {ex}")
+
+    # ------------------------------------------------------------------ #
+    # Importación / exportación masiva (COPY)
+    # ------------------------------------------------------------------ #
+    @classmethod
+    def exportar(cls, db_connection, destino, formato='csv'):
+        """Escribe todos los productos en `destino` (archivo binario) con COPY ... TO STDOUT.
+
+        CSV lleva encabezado con COLUMNAS_IMPORTACION, así el archivo se puede volver
+        a importar. En JSONL cada línea es un objeto; se usa COPY en formato CSV con
+        comillas y separador que no aparecen en JSON para que salga sin escapar.
+        """
+        if formato not in FORMATOS_IMPORTACION:
+            raise ValueError(f"Formato no soportado: {formato}")
+        consulta = """
+            SELECT nombre, descripcion, categoria, nombre_columna_imagen AS imagen,
+                   precio, stock, activo
+            FROM productos
+            ORDER BY id
+        """
+        if formato == 'csv':
+            sql = f"COPY ({consulta}) TO STDOUT WITH (FORMAT csv, HEADER true)"
+        else:
+            sql = (f"COPY (SELECT row_to_json(t)::text FROM ({consulta}) t) "
+                   f"TO STDOUT WITH (FORMAT csv, QUOTE E'\\x01', DELIMITER E'\\x02')")
+        try:
+            with db_connection.cursor() as cursor:
+                cursor.copy_expert(sql, destino)
+            # COPY abre una transacción de solo lectura; se cierra para devolver la conexión limpia
+            db_connection.rollback()
+        except Exception as ex:
+            db_connection.rollback()
+            raise ValueError(f"Error al exportar productos: {ex}")
+
+    @classmethod
+    def importar(cls, db_connection, origen, formato='csv', tamano_lote=1000):
+        """Importa productos desde `origen` (archivo de texto CSV con encabezado o JSONL).
+
+        Cada fila se valida con `validar_datos`; las válidas se cargan por lotes con
+        COPY a una tabla temporal y se aplican con un UPDATE y un INSERT por lote
+        (upsert por nombre sin distinguir mayúsculas). Cada lote corre en un
+        SAVEPOINT: si la base rechaza el lote, se reintenta fila por fila para
+        reportar solo las filas con error. Todo se confirma en un único commit.
+
+        Devuelve {'procesados', 'insertados', 'actualizados', 'errores': [{'linea', 'errores'}]}.
+        """
+        if formato not in FORMATOS_IMPORTACION:
+            raise ValueError(f"Formato no soportado: {formato}")
+        resultado = {'procesados': 0, 'insertados': 0, 'actualizados': 0, 'errores': [], 'errores_omitidos': 0}
+
+        def _error(linea, errores):
+            if len(resultado['errores']) < MAX_ERRORES_REPORTADOS:
+                resultado['errores'].append({'linea': linea, 'errores': errores})
+            else:
+                resultado['errores_omitidos'] += 1
+
+        try:
+            cursor = db_connection.cursor()
+            cursor.execute("""
+                CREATE TEMP TABLE IF NOT EXISTS productos_importacion (
+                    nombre TEXT, descripcion TEXT, categoria TEXT, imagen TEXT,
+                    precio NUMERIC, stock INTEGER, activo BOOLEAN
+                ) ON COMMIT DROP
+            """)
+
+            lote = {}
+            for linea, fila in _leer_filas(origen, formato):
+                resultado['procesados'] += 1
+                datos, errores = cls._normalizar_fila(fila)
+                if errores:
+                    _error(linea, errores)
+                    continue
+                # Dentro del lote gana la última fila de cada nombre
+                lote[datos['nombre'].lower()] = (linea, datos)
+                if len(lote) >= tamano_lote:
+                    cls._aplicar_lote(cursor, list(lote.values()), resultado, _error)
+                    lote = {}
+            if lote:
+                cls._aplicar_lote(cursor, list(lote.values()), resultado, _error)
+
+            version = None
+            if resultado['insertados'] or resultado['actualizados']:
+                version = CatalogoCache.registrar_cambio(cursor)
+            db_connection.commit()
+            cursor.close()
+            if version is not None:
+                cls.catalogo_cache.invalidar(version)
+            return resultado
+        except Exception as ex:
+            db_connection.rollback()
+            raise ValueError(f"Error al importar productos: {ex}")
+
+    @staticmethod
+    def _normalizar_fila(fila):
+        """Convierte una fila leída a los tipos del producto. Devuelve (datos, errores)."""
+        if fila is None:
+            return None, ["Fila con formato inválido."]
+        errores = []
+        datos = {
+            'nombre': _texto(fila.get('nombre')),
+            'descripcion': _texto(fila.get('descripcion')),
+            'categoria': _texto(fila.get('categoria')),
+            'imagen': _texto(fila.get('imagen') or fila.get('nombre_columna_imagen')),
+            'precio': None,
+            'stock': None,
+            'activo': True
+        }
+        try:
+            datos['precio'] = float(_texto(fila.get('precio')))
+        except ValueError:
+            errores.append("El precio no es un número.")
+        try:
+            datos['stock'] = int(_texto(fila.get('stock')) or 0)
+        except ValueError:
+            errores.append("El stock no es un número entero.")
+        try:
+            datos['activo'] = _a_booleano(fila.get('activo'))
+        except ValueError:
+            errores.append("El campo activo debe ser true o false.")
+        if not errores:
+            errores = ProductoModel.validar_datos(datos)
+        return datos, errores
+
+    @classmethod
+    def _aplicar_lote(cls, cursor, filas, resultado, registrar_error):
+        """Aplica un lote en un SAVEPOINT; si falla, lo reintenta fila por fila."""
+        cursor.execute("SAVEPOINT lote_importacion")
+        try:
+            cls._upsert_filas(cursor, [datos for _, datos in filas], resultado)
+            cursor.execute("RELEASE SAVEPOINT lote_importacion")
+            return
+        except Exception:
+            cursor.execute("ROLLBACK TO SAVEPOINT lote_importacion")
+
+        for linea, datos in filas:
+            cursor.execute("SAVEPOINT fila_importacion")
+            try:
+                cls._upsert_filas(cursor, [datos], resultado)
+                cursor.execute("RELEASE SAVEPOINT fila_importacion")
+            except Exception as ex:
+                cursor.execute("ROLLBACK TO SAVEPOINT fila_importacion")
+                registrar_error(linea, [str(ex).strip().splitlines()[0]])
+        cursor.execute("RELEASE SAVEPOINT lote_importacion")
+
+    @staticmethod
+    def _upsert_filas(cursor, filas, resultado):
+        """Carga `filas` con COPY en la tabla temporal y hace el upsert por nombre."""
+        buffer = io.StringIO()
+        escritor = csv.writer(buffer)
+        for datos in filas:
+            escritor.writerow([datos[columna] for columna in COLUMNAS_IMPORTACION])
+        buffer.seek(0)
+
+        cursor.execute("TRUNCATE productos_importacion")
+        cursor.copy_expert(
+            f"COPY productos_importacion ({', '.join(COLUMNAS_IMPORTACION)}) FROM STDIN "
+            "WITH (FORMAT csv, FORCE_NOT_NULL (descripcion, categoria, imagen))",
+            buffer
+        )
+        cursor.execute("""
+            UPDATE productos p
+            SET descripcion = i.descripcion, categoria = i.categoria,
+                nombre_columna_imagen = i.imagen, precio = i.precio,
+                stock = i.stock, activo = i.activo
+            FROM productos_importacion i
+            WHERE lower(p.nombre) = lower(i.nombre)
+        """)
+        actualizados = cursor.rowcount
+        cursor.execute("""
+            INSERT INTO productos (nombre, descripcion, categoria, nombre_columna_imagen, precio, stock, activo)
+            SELECT i.nombre, i.descripcion, i.categoria, i.imagen, i.precio, i.stock, i.activo
+            FROM productos_importacion i
+            WHERE NOT EXISTS (SELECT 1 FROM productos p WHERE lower(p.nombre) = lower(i.nombre))
+        """)
+        # Se suman al final: si el lote falla y se reintenta fila por fila no se cuenta dos veces
+        resultado['actualizados'] += actualizados
+        resultado['insertados'] += cursor.rowcount
@@ -0,0 +1,74 @@
+import threading
+import time
+from collections import OrderedDict
+
+from models.Metricas import CACHE_CONSULTAS
+
+
+class TTLCache:
+    """Caché en memoria acotada (LRU) con expiración por tiempo y contadores de aciertos.
+
+    Con `nombre`, los aciertos y fallos también se publican en /metrics.
+    """
+
+    def __init__(self, maxsize=1024, ttl=60.0, nombre=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.nombre = nombre
+        if nombre:
+            self._aciertos = CACHE_CONSULTAS.labels(cache=nombre, resultado='acierto')
+            self._fallos = CACHE_CONSULTAS.labels(cache=nombre, resultado='fallo')
+        self._data = OrderedDict()   # clave -> (valor, expira_en)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, default=None):
+        """Devuelve el valor si existe y no ha expirado; si no, `default`."""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and entry[1] < time.monotonic():
+                del self._data[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+            else:
+                self._data.move_to_end(key)
+                self.hits += 1
+        if self.nombre:
+            (self._fallos if entry is None else self._aciertos).inc()
+        return default if entry is None else entry[0]
+
+    def set(self, key, value, ttl=None):
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'size': len(self._data),
+                'maxsize': self.maxsize,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_ratio': self.hits / total if total else 0.0,
+            }
@@ -1,22 +1,59 @@
+import os
 from werkzeug.security import check_password_hash
 from models.entities.usuario import Usuario, Cliente, Administrador
+from models.UsuarioCache import UsuarioCache
+from models.MapeoFilas import mapear_fila
+from models.Metricas import LOGIN_HASH_SEGUNDOS
+
+
+def _crear_usuario(id, nombre, correo, password, rol):
+    if rol == 'administrador':
+        return Administrador(id, nombre, correo, password)
+    return Cliente(id, nombre, correo, password)
+
 
 class UserModel:
 
+    # Caché de usuarios cargados por ID (la usa login_manager.user_loader en cada petición);
+    # app.py la configura con DATABASE_URL para el LISTEN entre workers
+    cache = UsuarioCache(
+        maxsize=int(os.environ.get('USER_CACHE_SIZE', 2048)),
+        ttl=float(os.environ.get('USER_CACHE_TTL', 60)),
+        ttl_sin_listener=float(os.environ.get('USER_CACHE_TTL_SIN_LISTENER', 5))
+    )
+
+    @classmethod
+    def get_cached(cls, user_id):
+        """Devuelve el usuario desde la caché o None si no está (no toca la BD)."""
+        return cls.cache.obtener(user_id)
+
+    @classmethod
+    def invalidate_cache(cls, user_id=None):
+        """Invalida un usuario concreto o, sin argumentos, toda la caché de este worker."""
+        cls.cache.invalidar(user_id)
+
+    @classmethod
+    def cache_stats(cls):
+        return cls.cache.stats()
+
+    @classmethod
+    def _build_user(cls, cursor):
+        """Mapea la fila (id, nombre, correo, password, rol) del cursor a Cliente o Administrador."""
+        return mapear_fila(cursor, destino=_crear_usuario)
+
     @classmethod
     def get_by_id(cls, db_connection, user_id):
-        """Obtiene un usuario por su ID"""
+        """Obtiene un usuario por su ID desde la BD y refresca la caché"""
         try:
+            generacion = cls.cache.generacion
             # Usar 'with' es una buena práctica, cierra el cursor automáticamente
             with db_connection.cursor() as cursor:
-                cursor.execute("SELECT id, nombre, correo, contraseña, rol FROM usuarios WHERE id = %s", (user_id,))
-                row = cursor.fetchone()
+                cursor.execute("SELECT id, nombre, correo, contraseña AS password, rol FROM usuarios WHERE id = %s", (user_id,))
+                usuario = cls._build_user(cursor)
             
-                if row:
-                    if row[4] == 'administrador':
-                        return Administrador(row[0], row[1], row[2], row[3])
-                    else:
-                        return Cliente(row[0], row[1], row[2], row[3])
+                if usuario:
+                    cls.cache.guardar(usuario, generacion)
+                    return usuario
                 return None
         except Exception as ex:
             # ¡IMPORTANTE! Hacer rollback para limpiar la transacción fallida
@@ -27,15 +64,19 @@ class UserModel:
     def login(cls, db_connection, user_entity):
         """Verifica credenciales y devuelve el usuario autenticado"""
         try:
+            generacion = cls.cache.generacion
             with db_connection.cursor() as cursor:
-                cursor.execute("SELECT id, nombre, correo, contraseña, rol FROM usuarios WHERE correo = %s", (user_entity.correo,))
-                row = cursor.fetchone()
+                cursor.execute("SELECT id, nombre, correo, contraseña AS password, rol FROM usuarios WHERE correo = %s", (user_entity.correo,))
+                usuario = cls._build_user(cursor)
             
-                if row and check_password_hash(row[3], user_entity.password):
-                    if row[4] == 'administrador':
-                        return Administrador(row[0], row[1], row[2], row[3])
-                    else:
-                        return Cliente(row[0], row[1], row[2], row[3])
+                if not usuario:
+                    return None
+                with LOGIN_HASH_SEGUNDOS.time():
+                    valido = check_password_hash(usuario.password, user_entity.password)
+                if valido:
+                    # La siguiente petición (user_loader) ya encuentra al usuario en caché
+                    cls.cache.guardar(usuario, generacion)
+                    return usuario
                 return None
         except Exception as ex:
             # ¡IMPORTANTE! Hacer rollback aquí también
@@ -75,12 +116,18 @@ class UserModel:
         """Actualiza la contraseña de un usuario"""
         try:
             cursor = db_connection.cursor()
-            sql_query = "UPDATE usuarios SET contraseña = %s WHERE correo = %s"
+            sql_query = "UPDATE usuarios SET contraseña = %s WHERE correo = %s RETURNING id"
             datos = (user_entity.password, user_entity.correo)
             
             cursor.execute(sql_query, datos)
+            ids = [row[0] for row in cursor.fetchall()]
+            # Avisa a los demás workers al hacer commit; este se invalida abajo sin esperar al aviso
+            for user_id in ids:
+                UsuarioCache.notificar(cursor, user_id)
             db_connection.commit()
             cursor.close()
+            for user_id in ids:
+                cls.invalidate_cache(user_id)
             return True
         except Exception as ex:
             db_connection.rollback()
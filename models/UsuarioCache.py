@@ -0,0 +1,97 @@
+from models.EscuchaCambios import EscuchaCambios
+from models.TTLCache import TTLCache
+
+
+class UsuarioCache(EscuchaCambios):
+    """Caché de usuarios por id compartida por las peticiones de un worker.
+
+    Cada worker de gunicorn tiene la suya, así que un cambio de contraseña se
+    avisa a todos con NOTIFY en la misma transacción que lo escribe (ver
+    `notificar`); un hilo por proceso hace LISTEN y descarta al usuario.
+
+    Cuando el hilo pierde la conexión se vacía la caché y, hasta que vuelve, las
+    entradas duran `ttl_sin_listener` segundos. Una caída sin aviso se detecta en
+    `INTERVALO_VERIFICACION` segundos, así que otro worker puede seguir usando
+    datos viejos de un usuario ese intervalo más `ttl_sin_listener` (10 + 5 s
+    por defecto), no el TTL completo.
+    """
+
+    CANAL = 'usuarios_cambios'
+    NOMBRE = 'usuarios'
+
+    def __init__(self, dsn=None, maxsize=2048, ttl=60.0, ttl_sin_listener=5.0):
+        super().__init__(dsn)
+        self.ttl = ttl
+        self.ttl_sin_listener = ttl_sin_listener
+        self._entradas = TTLCache(maxsize=maxsize, ttl=ttl, nombre='usuarios')
+        # Sube con cada invalidación: una carga que empezó antes no se guarda (ver `guardar`)
+        self._generacion = 0
+
+    def configurar(self, dsn, ttl=None, ttl_sin_listener=None):
+        self.dsn = dsn
+        if ttl is not None:
+            self.ttl = self._entradas.ttl = ttl
+        if ttl_sin_listener is not None:
+            self.ttl_sin_listener = ttl_sin_listener
+
+    # ------------------------------------------------------------------ #
+    # Lectura
+    # ------------------------------------------------------------------ #
+    def obtener(self, user_id):
+        """Devuelve el usuario cacheado o None (no toca la BD)."""
+        self._asegurar_listener()
+        return self._entradas.get(str(user_id))
+
+    @property
+    def generacion(self):
+        return self._generacion
+
+    def guardar(self, usuario, generacion):
+        """Guarda un usuario leído de la BD cuando la caché estaba en `generacion`.
+
+        Si entre la lectura y este punto llegó una invalidación, el dato puede ser
+        anterior al cambio y no se guarda.
+        """
+        ttl = self.ttl if self._listener_ok else self.ttl_sin_listener
+        with self._lock:
+            if generacion != self._generacion:
+                return
+            self._entradas.set(str(usuario.id), usuario, ttl=ttl)
+
+    def stats(self):
+        data = self._entradas.stats()
+        data.update({'listener': self._listener_ok})
+        return data
+
+    # ------------------------------------------------------------------ #
+    # Invalidación
+    # ------------------------------------------------------------------ #
+    @classmethod
+    def notificar(cls, cursor, user_id):
+        """Emite el aviso de cambio dentro de la transacción del llamador.
+
+        Llega a todos los workers (incluido este) cuando la transacción hace commit.
+        """
+        cursor.execute("SELECT pg_notify(%s, %s)", (cls.CANAL, str(user_id)))
+
+    def invalidar(self, user_id=None):
+        """Descarta un usuario (o todos) en este worker."""
+        with self._lock:
+            self._generacion += 1
+            if user_id is None:
+                self._entradas.clear()
+            else:
+                self._entradas.invalidate(str(user_id))
+
+    # ------------------------------------------------------------------ #
+    # Avisos del hilo de escucha (ver EscuchaCambios)
+    # ------------------------------------------------------------------ #
+    def _al_notificar(self, payload):
+        self.invalidar(payload or None)
+
+    def _al_reconectar(self):
+        self.invalidar()
+
+    def _al_desconectar(self):
+        # Las entradas guardadas con el TTL largo ya no recibirían los avisos
+        self.invalidar()
@@ -1,14 +1,39 @@
 class Pedido:
-    def __init__(self, id_pedido, id_cliente, data_pedido, status):
+    # Los listados de pedidos del admin se mapean a este objeto por fila (ver MapeoFilas);
+    # nombre_cliente, correo_cliente y version vienen de las consultas con JOIN a usuarios
+    __slots__ = ('id_pedido', 'id_cliente', 'data_pedido', 'status', 'total',
+                 'nombre_cliente', 'correo_cliente', 'version')
+
+    def __init__(self, id_pedido, id_cliente, data_pedido, status, total=0,
+                 nombre_cliente=None, correo_cliente=None, version=None):
         self.id_pedido = id_pedido
         self.id_cliente = id_cliente
         self.data_pedido = data_pedido
         self.status = status
+        self.total = total
+        self.nombre_cliente = nombre_cliente
+        self.correo_cliente = correo_cliente
+        self.version = version
+
+    def to_dict(self):
+        """Representación como diccionario (para las APIs y los recibos)."""
+        return {slot: getattr(self, slot) for slot in self.__slots__}
 
 
 class DetallePedido:
-    def __init__(self, id_detalle, id_pedido, id_producto, cantidad):
+    __slots__ = ('id_detalle', 'id_pedido', 'id_producto', 'cantidad', 'precio_unitario',
+                 'subtotal', 'nombre_producto')
+
+    def __init__(self, id_detalle, id_pedido, id_producto, cantidad, precio_unitario=None,
+                 subtotal=None, nombre_producto=None):
         self.id_detalle = id_detalle
         self.id_pedido = id_pedido
         self.id_producto = id_producto
-        self.cantidad = cantidad
\ No newline at end of file
+        self.cantidad = cantidad
+        self.precio_unitario = precio_unitario
+        self.subtotal = subtotal
+        self.nombre_producto = nombre_producto
+
+    def to_dict(self):
+        """Representación como diccionario (para las APIs)."""
+        return {slot: getattr(self, slot) for slot in self.__slots__}
\ No newline at end of file
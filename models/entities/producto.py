@@ -1,9 +1,29 @@
 class Producto:
-    def __init__(self, id, nombre, descripcion, categoria, nombre_columna_imagen, precio, stock):
+    # Sin __dict__ por instancia: el panel admin y el catálogo cargan miles de productos
+    # Con un __init__ que solo asigna, MapeoFilas llena los slots sin llamarlo (más rápido)
+    __slots__ = ('id', 'nombre', 'descripcion', 'categoria', 'nombre_columna_imagen',
+                 'precio', 'stock', 'activo')
+
+    def __init__(self, id, nombre, descripcion, categoria, nombre_columna_imagen, precio, stock,
+                 activo=True):
         self.id = id
         self.nombre = nombre
         self.descripcion = descripcion
         self.categoria = categoria
         self.nombre_columna_imagen = nombre_columna_imagen
         self.precio = precio
-        self.stock = stock
\ No newline at end of file
+        self.stock = stock
+        self.activo = activo
+
+    def to_dict(self):
+        """Representación serializable a JSON (para las APIs)."""
+        return {
+            'id': self.id,
+            'nombre': self.nombre,
+            'descripcion': self.descripcion,
+            'categoria': self.categoria,
+            'imagen': self.nombre_columna_imagen,
+            'precio': float(self.precio) if self.precio is not None else None,
+            'stock': self.stock,
+            'activo': self.activo
+        }
\ No newline at end of file
@@ -1,6 +1,10 @@
 from flask_login import UserMixin  
 
 class Usuario(UserMixin):
+    # UserMixin no declara __slots__, así que las instancias conservan un __dict__
+    # (vacío salvo que se agreguen atributos); los campos van en los slots.
+    __slots__ = ('id', 'nombre', 'correo', 'password', 'rol')
+
     def __init__(self, id, nombre, correo, password, rol='cliente'):
         self.id = id
         self.nombre = nombre
@@ -12,9 +16,13 @@ class Usuario(UserMixin):
         return str(self.id)
     
 class Cliente(Usuario):
+    __slots__ = ()
+
     def __init__(self, id, nombre, correo, password):
         super().__init__(id, nombre, correo, password, 'cliente')
 
 class Administrador(Usuario):
+    __slots__ = ()
+
     def __init__(self, id, nombre, correo, password):
         super().__init__(id, nombre, correo, password, 'administrador')
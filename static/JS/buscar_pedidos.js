@@ -1,20 +1,93 @@
-function filtrarPedidos() {
-    const input = document.getElementById('searchInput');
-    const filter = input.value.toLowerCase();
-    const table = document.getElementById('tablaPedidos');
-    
-    if (!table) return;
-    
-    const rows = table.getElementsByTagName('tr');
+// Búsqueda de pedidos en el servidor: los filtros y la paginación se resuelven
+// con /api/pedidos/buscar en lugar de recorrer las filas de la tabla.
+const formFiltros = document.getElementById('filtrosPedidos');
+const tbodyPedidos = document.querySelector('#tablaPedidos tbody');
+const btnCargarMas = document.getElementById('cargarMas');
+let temporizadorBusqueda = null;
+
+function escaparHTML(texto) {
+    const div = document.createElement('div');
+    div.textContent = texto == null ? '' : String(texto);
+    return div.innerHTML;
+}
+
+function urlConId(plantilla, id) {
+    // url_for se generó con pedido_id=0; se sustituye el 0 final por el id real
+    return plantilla.replace(/0$/, id);
+}
+
+function filaPedido(pedido) {
+    const badge = pedido.status === 'pendiente' ? 'badge-pendiente'
+        : (pedido.status === 'completado' ? 'badge-completado' : '');
+    return `
+        <tr>
+            <td><strong>#${pedido.id_pedido}</strong></td>
+            <td>${escaparHTML(pedido.nombre_cliente)}</td>
+            <td>${escaparHTML(pedido.correo_cliente)}</td>
+            <td>${escaparHTML(pedido.fecha)}</td>
+            <td><strong>$${Number(pedido.total).toFixed(2)}</strong></td>
+            <td><span class="badge ${badge}">${escaparHTML(pedido.status)}</span></td>
+            <td>
+                <a href="${urlConId(formFiltros.dataset.detalle, pedido.id_pedido)}" class="btn btn-primary btn-small">Ver Detalle</a>
+                <a href="${urlConId(formFiltros.dataset.editar, pedido.id_pedido)}" class="btn btn-secondary btn-small" style="margin-left:6px;">Editar</a>
+            </td>
+        </tr>`;
+}
 
-    for (let i = 1; i < rows.length; i++) {
-        const row = rows[i];
-        const text = row.textContent.toLowerCase();
-        
-        if (text.includes(filter)) {
-            row.style.display = '';
+function parametrosFiltros() {
+    const params = new URLSearchParams();
+    new FormData(formFiltros).forEach((valor, clave) => {
+        if (String(valor).trim() !== '') params.append(clave, String(valor).trim());
+    });
+    return params;
+}
+
+async function cargarPedidos(cursor) {
+    const params = parametrosFiltros();
+    if (cursor) params.set('cursor', cursor);
+    btnCargarMas.disabled = true;
+    try {
+        const response = await fetch(`${formFiltros.dataset.api}?${params.toString()}`);
+        const data = await response.json();
+        if (!data.success) {
+            alert(data.message || 'Error al buscar pedidos');
+            return;
+        }
+        const filas = data.pedidos.map(filaPedido).join('');
+        if (cursor) {
+            tbodyPedidos.insertAdjacentHTML('beforeend', filas);
         } else {
-            row.style.display = 'none';
+            tbodyPedidos.innerHTML = filas;
+            // Mantener la URL con los filtros para poder compartirla o recargar
+            history.replaceState(null, '', `${formFiltros.action}?${parametrosFiltros().toString()}`);
         }
+        const hayFilas = tbodyPedidos.children.length > 0;
+        document.getElementById('tablaPedidos').style.display = hayFilas ? '' : 'none';
+        document.getElementById('sinPedidos').style.display = hayFilas ? 'none' : '';
+        btnCargarMas.dataset.cursor = data.siguiente || '';
+        btnCargarMas.style.display = data.siguiente ? '' : 'none';
+    } catch (error) {
+        console.error('Error:', error);
+        alert('Error de conexión');
+    } finally {
+        btnCargarMas.disabled = false;
     }
 }
+
+function filtrarPedidos() {
+    clearTimeout(temporizadorBusqueda);
+    temporizadorBusqueda = setTimeout(() => cargarPedidos(null), 300);
+}
+
+if (formFiltros) {
+    formFiltros.addEventListener('submit', (event) => {
+        event.preventDefault();
+        clearTimeout(temporizadorBusqueda);
+        cargarPedidos(null);
+    });
+    document.getElementById('searchInput').addEventListener('input', filtrarPedidos);
+    formFiltros.querySelectorAll('select, input[type="date"]').forEach((campo) => {
+        campo.addEventListener('change', filtrarPedidos);
+    });
+    btnCargarMas.addEventListener('click', () => cargarPedidos(btnCargarMas.dataset.cursor));
+}
@@ -0,0 +1,44 @@
+import pytest
+
+from app import app
+from models.ProductoModel import ProductoModel
+from models.UserModel import UserModel
+from models.entities.usuario import Administrador
+
+
+@pytest.fixture
+def cliente_admin():
+    app.config.update(TESTING=True, WTF_CSRF_ENABLED=False)
+    admin = Administrador(1, 'Admin', 'admin@prueba.test', 'hash')
+    UserModel.cache.guardar(admin, UserModel.cache.generacion)
+    with app.test_client() as cliente:
+        with cliente.session_transaction() as sesion:
+            sesion['_user_id'] = '1'
+        yield cliente
+    UserModel.invalidate_cache()
+
+
+def test_validar_ids():
+    assert ProductoModel.validar_ids([3, '1', ' 2 ', 3]) == [1, 2, 3]
+    for invalido in (['abc'], [1.5], [True], [0], [-4], ['²'], [2**31], [None], 'abc'):
+        with pytest.raises(ValueError):
+            ProductoModel.validar_ids(invalido)
+
+
+@pytest.mark.parametrize('cuerpo', [
+    {'accion': 'activar', 'ids': ['abc']},
+    {'accion': 'activar', 'ids': [1.5]},
+    {'accion': 'activar', 'ids': '1,2'},
+    {'accion': 'activar', 'ids': []},
+    {'accion': 'fijar_stock', 'valor': 'diez', 'ids': [1]},
+    {'accion': 'ajustar_precio', 'valor': -100, 'ids': [1]},
+    {'accion': 'borrar', 'ids': [1]},
+])
+def test_datos_invalidos_responden_400(cliente_admin, cuerpo):
+    respuesta = cliente_admin.post('/api/admin/productos/masivo', json=cuerpo)
+    assert respuesta.status_code == 400
+    assert respuesta.get_json()['success'] is False
+    assert respuesta.get_json()['message']
+    # Es una API JSON: no deja mensajes flash en la sesión
+    with cliente_admin.session_transaction() as sesion:
+        assert '_flashes' not in sesion
@@ -0,0 +1,26 @@
+import pytest
+
+from models.PedidoModel import PedidoModel
+
+
+def test_linea_nueva_con_cantidad_cero_se_omite():
+    _, _, nuevas, _ = PedidoModel._normalizar_cambios({
+        'nuevas': [{'id_producto': 4, 'cantidad': 0}, {'id_producto': 5, 'cantidad': 2}],
+    })
+    assert nuevas == [(5, 2)]
+
+
+def test_linea_existente_con_cantidad_cero_se_elimina():
+    lineas, eliminar, _, _ = PedidoModel._normalizar_cambios({
+        'lineas': [{'id_detalle': 9, 'id_producto': 4, 'cantidad': 0}],
+    })
+    assert (lineas, eliminar) == ({}, {9})
+
+
+@pytest.mark.parametrize('clave, item', [
+    ('nuevas', {'id_producto': 4, 'cantidad': -1}),
+    ('lineas', {'id_detalle': 9, 'id_producto': 4, 'cantidad': -1}),
+])
+def test_cantidad_negativa_se_rechaza(clave, item):
+    with pytest.raises(ValueError):
+        PedidoModel._normalizar_cambios({clave: [item]})
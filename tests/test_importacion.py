@@ -0,0 +1,22 @@
+import io
+
+from werkzeug.datastructures import FileStorage
+
+from app import _archivo_binario
+
+
+class _SinIOBase:
+    """Como SpooledTemporaryFile antes de Python 3.11: tiene read() pero no es io.IOBase."""
+
+    def __init__(self, datos):
+        self._datos = io.BytesIO(datos)
+
+    def read(self, *args):
+        return self._datos.read(*args)
+
+
+def test_upload_que_no_es_iobase_se_lee_como_texto():
+    contenido = '﻿nombre,precio\nTaza,1.50\nPóster,2\n'.encode('utf-8')
+    archivo = FileStorage(stream=_SinIOBase(contenido), filename='catalogo.csv')
+    with io.TextIOWrapper(_archivo_binario(archivo), encoding='utf-8-sig', newline='') as texto:
+        assert texto.read() == 'nombre,precio\nTaza,1.50\nPóster,2\n'
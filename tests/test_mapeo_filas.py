@@ -0,0 +1,47 @@
+import inspect
+
+import pytest
+
+from models.MapeoFilas import mapear_filas, _slots
+from models.entities.pedido import Pedido, DetallePedido
+from models.entities.producto import Producto
+from models.entities.usuario import Usuario, Cliente, Administrador
+
+
+class _Cursor:
+    def __init__(self, columnas, filas):
+        self.description = [(columna,) for columna in columnas]
+        self._filas = filas
+
+    def fetchall(self):
+        return list(self._filas)
+
+
+class _ConPrecio:
+    __slots__ = ('id', 'precio')
+
+    def __init__(self, id, precio):
+        self.id = id
+        self.precio = round(float(precio), 2)
+
+
+@pytest.mark.parametrize('entidad', [Producto, Pedido, DetallePedido, Usuario, Cliente, Administrador])
+def test_entidad_mapeada_igual_que_con_su_constructor(entidad):
+    columnas = tuple(inspect.signature(entidad).parameters)
+    fila = tuple(f'valor_{columna}' for columna in columnas)
+    mapeado, = mapear_filas(_Cursor(columnas, [fila]), destino=entidad)
+    construido = entidad(*fila)
+    assert type(mapeado) is entidad
+    for slot in _slots(entidad):
+        assert getattr(mapeado, slot) == getattr(construido, slot), slot
+
+
+def test_constructor_con_logica_se_llama():
+    mapeado, = mapear_filas(_Cursor(('id', 'precio'), [(1, '10.456')]), destino=_ConPrecio)
+    assert mapeado.precio == 10.46
+
+
+def test_slots_sin_columna_toman_el_valor_por_defecto():
+    columnas = ('id_pedido', 'id_cliente', 'data_pedido', 'status')
+    pedido, = mapear_filas(_Cursor(columnas, [(1, 2, None, 'pendiente')]), destino=Pedido)
+    assert (pedido.total, pedido.nombre_cliente, pedido.version) == (0, None, None)
@@ -0,0 +1,36 @@
+import base64
+import re
+import zlib
+
+import pytest
+
+from models.GeneradorRecibos import FILAS_POR_BLOQUE, renderizar_recibo
+
+CLIENTE = {'id': 1, 'nombre': 'Cliente de prueba', 'correo': 'cliente@prueba.test'}
+
+
+def _items(cantidad):
+    return [{'id': i, 'nombre': f'Artículo {i}', 'precio': 1.5, 'cantidad': 1}
+            for i in range(cantidad)]
+
+
+def _encabezados_por_pagina(pdf):
+    """Cuenta cuántas veces se dibuja el título de columna 'Producto' en cada página.
+
+    ReportLab escribe cada página como un stream ASCII85 + Flate; el número de
+    página sale del pie ('Página N').
+    """
+    paginas = {}
+    for crudo in re.findall(rb'stream\r?\n(.*?)endstream', pdf, re.S):
+        contenido = zlib.decompress(base64.a85decode(crudo.strip().removesuffix(b'~>'), adobe=False))
+        pie = re.search(rb'gina (\d+)\)', contenido)
+        if pie:
+            paginas[int(pie.group(1))] = contenido.count(b'(Producto)')
+    return [paginas[numero] for numero in sorted(paginas)]
+
+
+@pytest.mark.parametrize('lineas', [50, FILAS_POR_BLOQUE * 2 - 20, FILAS_POR_BLOQUE * 4 + 50])
+def test_un_encabezado_de_columnas_por_pagina(lineas):
+    conteo = _encabezados_por_pagina(renderizar_recibo(_items(lineas), CLIENTE, referencia='prueba'))
+    assert len(conteo) > 1
+    assert conteo == [1] * len(conteo)
@@ -0,0 +1,36 @@
+from models.UsuarioCache import UsuarioCache
+from models.entities.usuario import Cliente
+
+
+def _usuario():
+    return Cliente(7, 'Cliente de prueba', 'cliente@prueba.test', 'hash')
+
+
+def test_invalidar_descarta_al_usuario():
+    cache = UsuarioCache()
+    cache.guardar(_usuario(), cache.generacion)
+    assert cache.obtener(7) is not None
+    cache.invalidar('7')
+    assert cache.obtener(7) is None
+
+
+def test_no_guarda_una_lectura_anterior_a_la_invalidacion():
+    cache = UsuarioCache()
+    generacion = cache.generacion
+    # Llega el aviso de otro worker mientras la consulta está en curso
+    cache.invalidar('7')
+    cache.guardar(_usuario(), generacion)
+    assert cache.obtener(7) is None
+
+
+def test_perder_el_listener_vacia_la_cache():
+    cache = UsuarioCache()
+    cache._listener_ok = True
+    generacion = cache.generacion
+    cache.guardar(_usuario(), generacion)
+    # Lo que hace el hilo de escucha cuando se cae la conexión
+    cache._listener_ok = False
+    cache._al_desconectar()
+    assert cache.obtener(7) is None
+    cache.guardar(_usuario(), generacion)
+    assert cache.obtener(7) is None